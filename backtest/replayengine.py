@@ -0,0 +1,226 @@
+import itertools
+import logging
+import multiprocessing
+import random
+import time
+from datetime import datetime
+
+import marketmaker
+from backtest import simulatedexchange
+from data import marketmakerexchange
+from data import orderbookstore
+from data import tickrecorder
+
+BIDS = marketmakerexchange.BIDS
+ASKS = marketmakerexchange.ASKS
+CNY = marketmakerexchange.CNY
+BTS = marketmakerexchange.BTS
+UPDATE_TIME = marketmaker.UPDATE_TIME
+
+log = logging.getLogger(__name__)
+
+
+class ReplayClock(object):
+    def __init__(self, current_time):
+        self.current_time = current_time
+
+    def now(self):
+        return datetime.fromtimestamp(self.current_time)
+
+
+class ReplayOrderBookStore(object):
+    """
+        Stands in for data.orderbookstore.OrderBookStore during a replay. Snapshots hand out the simulated exchanges'
+        books directly instead of copying them through shared memory.
+    """
+    def __init__(self, exchanges_dict):
+        self.exchanges_dict = exchanges_dict
+        self.update_times = {exchange_name: 0 for exchange_name in exchanges_dict}
+        self.version = 0
+
+    def write(self, exchange_name, order_book, update_time):
+        self.update_times[exchange_name] = update_time
+        self.version += 1
+
+    def get_version(self):
+        return self.version
+
+    def snapshot(self):
+        return orderbookstore.OrderBookSnapshot(
+            self.version, {exchange_name: {BIDS: exchange.order_book.bids,
+                                           ASKS: exchange.order_book.asks,
+                                           UPDATE_TIME: datetime.fromtimestamp(self.update_times[exchange_name])}
+                           for exchange_name, exchange in self.exchanges_dict.items()})
+
+    def close(self):
+        pass
+
+    def unlink(self):
+        pass
+
+
+class TickFileSource(object):
+    # Snapshots recorded by data.tickrecorder, replayed file after file.
+    def __init__(self, paths, start_time=None, end_time=None):
+        self.paths = paths
+        self.start_time = start_time
+        self.end_time = end_time
+
+    def __iter__(self):
+        for path in self.paths:
+            reader = tickrecorder.TickReader(path)
+            try:
+                for snapshot in reader.read(self.start_time, self.end_time):
+                    yield snapshot
+            finally:
+                reader.close()
+
+
+class SyntheticSource(object):
+    """
+        Generated snapshots: every exchange quotes around a shared random-walk price with its own mean-reverting offset,
+        so that books occasionally cross between exchanges. Exchanges are updated in turn every interval seconds.
+    """
+    def __init__(self, exchange_names, count, start_time=1500000000, interval=0.3, seed=0, levels=20,
+                 price=0.44, tick_size=0.0001):
+        self.exchange_names = exchange_names
+        self.count = count
+        self.start_time = start_time
+        self.interval = interval
+        self.seed = seed
+        self.levels = levels
+        self.price = price
+        self.tick_size = tick_size
+
+    def __iter__(self):
+        generator = random.Random(self.seed)
+        price = self.price
+        offsets = {exchange_name: 0 for exchange_name in self.exchange_names}
+        for index in range(self.count):
+            exchange_name = self.exchange_names[index % len(self.exchange_names)]
+            price = max(self.tick_size, price + generator.gauss(0, self.tick_size))
+            offsets[exchange_name] = offsets[exchange_name] * 0.95 + generator.gauss(0, self.tick_size * 10)
+            mid = price + offsets[exchange_name]
+            spread = self.tick_size * generator.randint(1, 5)
+            bids = [[round(mid - spread - level * self.tick_size, 4), generator.uniform(100, 5000)]
+                    for level in range(self.levels)]
+            asks = [[round(mid + spread + level * self.tick_size, 4), generator.uniform(100, 5000)]
+                    for level in range(self.levels)]
+            yield exchange_name, self.start_time + index * self.interval / len(self.exchange_names), bids, asks
+
+
+class ReplayResult(object):
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.snapshots = 0
+        self.trade_count = 0
+        self.missed_opportunities = 0
+        # Change of the total CNY and BTS balances, and their value in CNY at the last replayed price.
+        self.cny_change = 0
+        self.bts_change = 0
+        self.pnl = 0
+        self.elapsed = 0
+
+    def __str__(self):
+        return ("{}: PnL {:.2f} CNY, {} trades, {} missed opportunities, {} snapshots in {:.2f} s"
+                .format(self.parameters, self.pnl, self.trade_count, self.missed_opportunities, self.snapshots,
+                        self.elapsed))
+
+
+"""
+    Drive a MarketMaker with simulated exchanges through a stream of (exchange name, receive time, bids, asks)
+    snapshots, as fast as possible. The clock follows the receive times of the snapshots.
+    exchange_settings: {exchange name: keyword arguments of SimulatedExchange other than the name}.
+    parameters: MarketMaker attributes to override, such as profit_threshold, minimum_purchase_volume or
+    min_listing_volume_buffer.
+"""
+def replay(snapshots, exchange_settings, parameters=None):
+    parameters = parameters or {}
+    result = ReplayResult(parameters)
+    start = time.perf_counter()
+
+    snapshots = iter(snapshots)
+    first_snapshot = next(snapshots, None)
+    if first_snapshot is None:
+        return result
+
+    exchanges_dict = {exchange_name: simulatedexchange.SimulatedExchange(exchange_name, **settings)
+                      for exchange_name, settings in exchange_settings.items()}
+    store = ReplayOrderBookStore(exchanges_dict)
+    clock = ReplayClock(first_snapshot[1] - marketmaker.ORDER_BOOK_VALID_WINDOW)
+    maker = marketmaker.MarketMaker(exchanges_dict, {marketmaker.MARKET: store}, clock.now, notify=lambda message: None)
+    for name, value in parameters.items():
+        setattr(maker, name, value)
+    # Simulated balances are available immediately, so the ledger is reconciled in line instead of in the background.
+    maker.balance_ledger.reconcile()
+
+    initial_cny = sum(exchange.balance[CNY] for exchange in exchanges_dict.values())
+    initial_bts = sum(exchange.balance[BTS] for exchange in exchanges_dict.values())
+    last_price = 0
+    try:
+        for exchange_name, receive_time, bids, asks in itertools.chain([first_snapshot], snapshots):
+            exchange = exchanges_dict.get(exchange_name)
+            if exchange is None:
+                continue
+            clock.current_time = receive_time
+            exchange.set_order_book(bids, asks)
+            store.write(exchange_name, exchange.order_book, receive_time)
+            result.snapshots += 1
+            if bids and asks:
+                last_price = (bids[0][0] + asks[0][0]) / 2
+
+            fill_count = sum(len(exchange.fills) for exchange in exchanges_dict.values())
+            maker.on_order_book_updates({exchange_name})
+            if sum(len(exchange.fills) for exchange in exchanges_dict.values()) > fill_count:
+                result.trade_count += 1
+                maker.balance_ledger.reconcile()
+                maker.order_tracker.poll()
+            elif maker.balance_ledger.drifted_exchanges:
+                maker.balance_ledger.reconcile()
+            elif find_missed_opportunities(maker, store, exchange_name, receive_time):
+                result.missed_opportunities += 1
+    finally:
+        maker.close()
+
+    result.cny_change = sum(exchange.balance[CNY] for exchange in exchanges_dict.values()) - initial_cny
+    result.bts_change = sum(exchange.balance[BTS] for exchange in exchanges_dict.values()) - initial_bts
+    result.pnl = result.cny_change + result.bts_change * last_price
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+# Profitable pairs with valid order books that the pass just run left untraded, e.g. because of balances or volumes.
+def find_missed_opportunities(maker, store, exchange_name, receive_time):
+    market_state = maker.markets[marketmaker.MARKET]
+    valid_exchanges = {name for name, update_time in store.update_times.items()
+                       if receive_time - update_time < marketmaker.ORDER_BOOK_VALID_WINDOW and
+                       datetime.fromtimestamp(update_time) > market_state.last_transaction_time[name]}
+    return market_state.opportunity_matrix.find_opportunities(valid_exchanges, {exchange_name},
+                                                              maker.profit_threshold)
+
+
+def replay_parameters(snapshot_source, exchange_settings, parameters):
+    return replay(snapshot_source, exchange_settings, parameters)
+
+
+# Replay the same snapshot source once per parameter set, in parallel across processes.
+def run_sweep(snapshot_source, exchange_settings, parameter_sets, processes=None):
+    with multiprocessing.Pool(processes) as pool:
+        return pool.starmap(replay_parameters, [(snapshot_source, exchange_settings, parameters)
+                                                for parameters in parameter_sets])
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    exchange_names = ["btc38", "dex"]
+    exchange_settings = {exchange_name: {'profit_deduction': 0.01, 'cny_balance': 10000, 'bts_balance': 20000,
+                                         'trading_fee': 0.001}
+                         for exchange_name in exchange_names}
+    snapshot_source = SyntheticSource(exchange_names, 100000)
+    parameter_sets = [{'profit_threshold': threshold, 'min_listing_volume_buffer': buffer}
+                      for threshold in [0, 0.002, 0.005] for buffer in [100, 500]]
+    for result in run_sweep(snapshot_source, exchange_settings, parameter_sets):
+        print(result)
+
+if __name__ == '__main__':
+    main()
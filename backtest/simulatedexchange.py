@@ -0,0 +1,96 @@
+import logging
+
+from data import marketmakerexchange
+from data import orderbook
+from exceptions import exchangeexceptions
+
+CNY = marketmakerexchange.CNY
+BTS = marketmakerexchange.BTS
+BUY_ORDER = 1
+SELL_ORDER = 2
+
+log = logging.getLogger(__name__)
+
+
+class Fill(object):
+    def __init__(self, exchange_name, order_type, price, volume, fee):
+        self.exchange_name = exchange_name
+        self.order_type = order_type
+        self.price = price
+        self.volume = volume
+        # Trading fee, in CNY.
+        self.fee = fee
+
+
+class SimulatedExchange(marketmakerexchange.MarketMakerExchange):
+    """
+        Exchange backed by replayed order books. Orders are filled immediately against the current book up to their
+        limit price, like an immediate-or-cancel order; whatever cannot be filled is dropped. Filled levels are taken
+        out of the book until the next replayed snapshot replaces it. Only the default market is simulated.
+    """
+    def __init__(self, exchange_name, profit_deduction, cny_balance, bts_balance, trading_fee=0):
+        self.exchange_name = exchange_name
+        self.profit_deduction = profit_deduction
+        self.trading_fee = trading_fee
+        self.balance = {CNY: cny_balance, BTS: bts_balance}
+        self.order_book = orderbook.OrderBook()
+        self.fills = []
+        self.order_count = 0
+
+    def set_order_book(self, bids, asks):
+        self.order_book.apply_snapshot(bids, asks)
+
+    def get_order_book(self, market=marketmakerexchange.MARKET):
+        return self.order_book
+
+    def get_exchange_name(self):
+        return self.exchange_name
+
+    def get_profit_deduction(self):
+        return self.profit_deduction
+
+    def get_maker_account_balance(self):
+        return dict(self.balance)
+
+    # Orders never rest on the book, so there is never anything to list or cancel.
+    def list_my_orders(self, market=marketmakerexchange.MARKET):
+        return []
+
+    def cancel_order(self, order_id, market=marketmakerexchange.MARKET):
+        pass
+
+    def submit_arbitrage_order(self, order_type, price, volume, market=marketmakerexchange.MARKET):
+        if order_type == BUY_ORDER:
+            side = self.order_book.asks
+            fillable = [level for level in side.levels() if level[0] <= price]
+        elif order_type == SELL_ORDER:
+            side = self.order_book.bids
+            fillable = [level for level in side.levels() if level[0] >= price]
+        else:
+            raise exchangeexceptions.SubmitOrderFailureException("Unrecognized order type: {}".format(order_type))
+
+        remaining = volume
+        for level_price, level_volume in fillable:
+            if remaining <= 0:
+                break
+            fill_volume = min(remaining, level_volume)
+            self.__fill(order_type, level_price, fill_volume)
+            side.update(level_price, level_volume - fill_volume)
+            remaining -= fill_volume
+
+        if remaining >= volume:
+            raise exchangeexceptions.SubmitOrderFailureException(
+                "Order at {} not filled on {}.".format(price, self.exchange_name))
+        self.order_count += 1
+        return self.order_count
+
+    def __fill(self, order_type, price, volume):
+        notional = price * volume
+        fee = notional * self.trading_fee
+        if order_type == BUY_ORDER:
+            self.balance[CNY] -= notional + fee
+            self.balance[BTS] += volume
+        else:
+            self.balance[CNY] += notional - fee
+            self.balance[BTS] -= volume
+        self.fills.append(Fill(self.exchange_name, order_type, price, volume, fee))
@@ -0,0 +1,62 @@
+import math
+import random
+import timeit
+
+from data import arbitragegraph
+
+EXCHANGE_NAMES = ["btc38", "dex", "x", "y"]
+# Markets between CNY, BTS, BTC and ETH, with their mid prices.
+MARKETS = {"BTS_CNY": 0.44, "BTC_CNY": 20000, "ETH_CNY": 1500, "BTS_BTC": 0.000022, "ETH_BTC": 0.075,
+           "BTS_ETH": 0.000293}
+ITERATIONS = 10000
+
+
+def make_top_of_book(generator, mid):
+    spread = mid * generator.uniform(0.0005, 0.003)
+    price = mid * math.exp(generator.gauss(0, 0.001))
+    return [price - spread, generator.uniform(100, 5000)], [price + spread, generator.uniform(100, 5000)]
+
+
+# Same search over the whole graph from scratch: Bellman-Ford from a virtual source joined to every currency.
+def find_cycle_from_scratch(edges):
+    distances = {}
+    for edge in edges:
+        distances[edge.source] = 0
+        distances[edge.target] = 0
+    for _ in range(len(distances)):
+        changed = False
+        for edge in edges:
+            if distances[edge.source] + edge.weight < distances[edge.target] - arbitragegraph.EPSILON:
+                distances[edge.target] = distances[edge.source] + edge.weight
+                changed = True
+        if not changed:
+            return False
+    return True
+
+
+def report(name, seconds):
+    print("{:<32} {:>10.2f} us/tick".format(name, seconds / ITERATIONS * 1e6))
+
+
+def main():
+    generator = random.Random(7)
+    graph = arbitragegraph.ArbitrageGraph({exchange_name: 0.001 for exchange_name in EXCHANGE_NAMES})
+    books = [(exchange_name, market) for exchange_name in EXCHANGE_NAMES for market in MARKETS]
+    for exchange_name, market in books:
+        graph.update_book(exchange_name, market, *make_top_of_book(generator, MARKETS[market]))
+    ticks = [(exchange_name, market, make_top_of_book(generator, MARKETS[market]))
+             for exchange_name, market in (generator.choice(books) for _ in range(ITERATIONS))]
+    ticks = iter(ticks)
+
+    def incremental_tick():
+        exchange_name, market, (bid, ask) = next(ticks)
+        graph.update_book(exchange_name, market, bid, ask)
+        graph.find_cycles()
+
+    print("{} exchanges, {} markets, {} edges".format(len(EXCHANGE_NAMES), len(MARKETS), len(graph.edges)))
+    report("incremental update and search", timeit.timeit(incremental_tick, number=ITERATIONS))
+    edges = list(graph.edges.values())
+    report("Bellman-Ford from scratch", timeit.timeit(lambda: find_cycle_from_scratch(edges), number=ITERATIONS))
+
+if __name__ == '__main__':
+    main()
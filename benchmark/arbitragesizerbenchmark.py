@@ -0,0 +1,26 @@
+import timeit
+
+from data import arbitragesizer
+from data import orderbook
+
+LEVELS = 500
+ITERATIONS = 10000
+
+
+def make_order_book():
+    order_book = orderbook.OrderBook()
+    order_book.apply_snapshot([[0.5000 - i * 0.0001, 100] for i in range(LEVELS)],
+                              [[0.4000 + i * 0.0001, 100] for i in range(LEVELS)])
+    return order_book
+
+
+def main():
+    order_book = make_order_book()
+    plan = arbitragesizer.size_arbitrage(order_book.asks, order_book.bids, 0.01, 0.99, 1, 1e9, 1e9, 0, 500)
+    seconds = timeit.timeit(lambda: arbitragesizer.size_arbitrage(order_book.asks, order_book.bids, 0.01, 0.99, 1,
+                                                                  1e9, 1e9, 0, 500), number=ITERATIONS)
+    print("{} levels per side, {} levels walked: {:.2f} us/sizing"
+          .format(LEVELS, len(plan.purchase_levels), seconds / ITERATIONS * 1e6))
+
+if __name__ == '__main__':
+    main()
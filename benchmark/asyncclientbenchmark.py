@@ -0,0 +1,71 @@
+import asyncio
+import http.server
+import threading
+import time
+
+from btc38 import asyncclient
+from btc38 import client
+
+REQUESTS = 500
+DEPTH_RESPONSE = (b'{"bids":[[0.4402,1623.38488],[0.4401,10366.271967],[0.44,8204.550502],[0.4392,2624]],'
+                  b'"asks":[[0.4444,4127.835417],[0.4457,7358.901461],[0.4458,10000],[0.4459,9170.8]]}')
+SUBMIT_ORDER_RESPONSE = b'succ|123456'
+
+
+# Imitates depth.php and submitOrder.php of api.btc38.com, with keep-alive enabled.
+class StubRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.__respond(DEPTH_RESPONSE if self.path.startswith('/v1/depth.php') else b'fail#3')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.__respond(SUBMIT_ORDER_RESPONSE if self.path.startswith('/v1/submitOrder.php') else b'fail')
+
+    def __respond(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_sync(btc38_client):
+    for _ in range(REQUESTS):
+        btc38_client.get_depth()
+        btc38_client.submit_order(1, client.CNY_SYMBOL, 0.44, 1000, client.BTS_SYMBOL)
+
+
+async def run_async(btc38_client):
+    for _ in range(REQUESTS):
+        await btc38_client.get_depth()
+        await btc38_client.submit_order(1, client.CNY_SYMBOL, 0.44, 1000, client.BTS_SYMBOL)
+    await btc38_client.close()
+
+
+def report(name, seconds):
+    print("{:<28} {:>10.1f} us/request".format(name, seconds / (REQUESTS * 2) * 1e6))
+
+
+def main():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}/v1/'.format(server.server_address[1])
+
+    try:
+        start = time.perf_counter()
+        run_sync(client.Client('access', 'secret', 'account', base_url=base_url))
+        report("blocking client", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        asyncio.run(run_async(asyncclient.AsyncClient('access', 'secret', 'account', base_url=base_url)))
+        report("keep-alive async client", time.perf_counter() - start)
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import random
+import sys
+import timeit
+
+from btc38 import client
+from btc38 import depthparser
+
+LEVELS = 200
+ITERATIONS = 2000
+
+
+# Payload shaped like the depth.php responses of api.btc38.com.
+def make_payload(seed=0):
+    generator = random.Random(seed)
+    bids = ",".join("[{},{}]".format(round(0.4402 - i * 0.0001, 4), round(generator.uniform(10, 20000), 6))
+                    for i in range(LEVELS))
+    asks = ",".join("[{},{}]".format(round(0.4444 + i * 0.0001, 4), round(generator.uniform(10, 20000), 6))
+                    for i in range(LEVELS))
+    return '{{"bids":[{}],"asks":[{}]}}'.format(bids, asks).encode(client.ENCODING)
+
+
+"""
+    Compare client.parse_depth on the readlines() result with depthparser.DepthParser at a few depths.
+    Recorded responses can be given as file paths on the command line; a generated payload is used otherwise.
+"""
+def main():
+    payloads = []
+    for path in sys.argv[1:]:
+        with open(path, "rb") as payload_file:
+            payloads.append(payload_file.read())
+    if not payloads:
+        payloads.append(make_payload())
+
+    for payload in payloads:
+        seconds = timeit.timeit(lambda: client.parse_depth(payload.splitlines(keepends=True)), number=ITERATIONS)
+        print("{} bytes, json.loads: {:.2f} us/parse".format(len(payload), seconds / ITERATIONS * 1e6))
+        for depth in [10, 50, LEVELS]:
+            parser = depthparser.DepthParser(depth)
+            seconds = timeit.timeit(lambda: parser.parse(payload), number=ITERATIONS)
+            print("{} bytes, depth parser at depth {}: {:.2f} us/parse"
+                  .format(len(payload), depth, seconds / ITERATIONS * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from data import marketmakerexchange
+from metrics import metricsregistry
+from simulator import simulatedexchanges
+from simulator import simulatedvenue
+
+MARKET = marketmakerexchange.MARKET
+# (book ticks per second, number of exchanges) of every scenario. The first exchange is a DEX, the others btc38.
+SCENARIOS = [(1, 2), (10, 2), (1, 4), (10, 4)]
+# Seconds MarketMaker.run is measured for, after the first speculation pass.
+DURATION = 10
+# Seconds MarketMaker.run is given to reach its first speculation pass.
+STARTUP_TIMEOUT = 60
+LATENCY = 0.02
+JITTER = 0.02
+ERROR_RATE = 0.02
+BALANCES = {marketmakerexchange.BTS: 1e7, marketmakerexchange.CNY: 1e7}
+METRICS = ["speculation.detection", "speculation.pass", "speculation.staleness"]
+
+
+def create_exchanges(tick_rate, exchange_count, start_time):
+    stub_servers = []
+    exchanges = {}
+    for index in range(exchange_count):
+        venue = simulatedvenue.SimulatedVenue("sim{}".format(index), {MARKET: 0.44}, BALANCES, start_time=start_time,
+                                              latency=LATENCY, jitter=JITTER, error_rate=ERROR_RATE,
+                                              tick_rate=tick_rate)
+        if index == 0:
+            exchange = simulatedexchanges.SimulatedDexExchange(venue)
+        else:
+            stub_server, exchange = simulatedexchanges.create_btc38_exchange(venue)
+            stub_servers.append(stub_server)
+        exchanges[exchange.get_exchange_name()] = exchange
+    return stub_servers, exchanges
+
+
+"""
+    Run the market maker on the exchanges in a process of its own, in a temporary directory collecting its logs, ticks
+    and metrics, and send the speculator's metrics through the pipe once it ran for DURATION seconds. If it fails or
+    does not reach its first speculation pass within STARTUP_TIMEOUT, send the exception instead.
+"""
+def run_market_maker(exchanges, connection):
+    import marketmaker
+
+    # Injected failures are logged by the market maker on every occurrence.
+    logging.disable(logging.CRITICAL)
+    os.chdir(tempfile.mkdtemp(prefix="marketmakerbenchmark-"))
+    registry = metricsregistry.reset()
+    try:
+        maker = marketmaker.MarketMaker(exchanges, notify=lambda message: None)
+        run_errors = []
+
+        def run():
+            try:
+                maker.run()
+            except BaseException as e:
+                run_errors.append(e)
+
+        thread = threading.Thread(target=run, name="market-maker", daemon=True)
+        thread.start()
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while not maker.startup_timer.reported:
+            if run_errors:
+                raise run_errors[0]
+            if not thread.is_alive():
+                raise RuntimeError("MarketMaker.run returned before its first speculation pass.")
+            if time.monotonic() > deadline:
+                raise TimeoutError("MarketMaker.run did not reach its first speculation pass within {} seconds."
+                                   .format(STARTUP_TIMEOUT))
+            thread.join(0.1)
+        time.sleep(DURATION)
+        connection.send(registry.to_dict())
+    except Exception as e:
+        connection.send(e)
+    finally:
+        for child in multiprocessing.active_children():
+            child.terminate()
+    time.sleep(1)
+
+
+def report(tick_rate, exchange_count, metrics):
+    histograms = metrics['histograms']
+    names = METRICS + sorted(name for name in histograms if name.startswith("order.ack."))
+    print("{} ticks/s, {} exchanges".format(tick_rate, exchange_count))
+    for name in names:
+        histogram = histograms.get(name)
+        if histogram is None or not histogram['count']:
+            print("  {:<24} {:>8}".format(name, "-"))
+            continue
+        print("  {:<24} {:>8} samples  p50 {:>9.1f} us  p99 {:>9.1f} us"
+              .format(name, histogram['count'], histogram['p50_us'], histogram['p99_us']))
+
+
+def main():
+    for tick_rate, exchange_count in SCENARIOS:
+        stub_servers, exchanges = create_exchanges(tick_rate, exchange_count, time.time())
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=run_market_maker, args=(exchanges, sender))
+        process.start()
+        # Only the child holds the sending end now, so the pipe reports its end if it dies without sending anything.
+        sender.close()
+        try:
+            try:
+                metrics = receiver.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError("The market maker process exited with code {} without sending its metrics."
+                                   .format(process.exitcode))
+            if isinstance(metrics, Exception):
+                raise metrics
+            report(tick_rate, exchange_count, metrics)
+        finally:
+            process.join()
+            for stub_server in stub_servers:
+                stub_server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import random
+import timeit
+
+from metrics import metricsregistry
+
+ITERATIONS = 1000000
+
+
+def main():
+    registry = metricsregistry.MetricsRegistry()
+    samples = [random.expovariate(1000) for _ in range(1000)]
+
+    def record_samples():
+        for sample in samples:
+            registry.record("benchmark", sample)
+
+    seconds = timeit.timeit(record_samples, number=ITERATIONS // len(samples))
+    print("record: {:.0f} ns/sample".format(seconds / ITERATIONS * 1e9))
+    print(registry.get_histogram("benchmark").to_dict())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import multiprocessing
+import time
+import timeit
+from datetime import datetime
+
+from data import orderbook
+from data import orderbookstore
+
+BIDS = orderbookstore.BIDS
+ASKS = orderbookstore.ASKS
+UPDATE_TIME = orderbookstore.UPDATE_TIME
+EXCHANGE_NAMES = ["btc38", "dex"]
+ITERATIONS = 10000
+
+
+# Same access pattern as one speculation pass before the store existed: several reads per exchange.
+def read_manager_dict(order_book):
+    for exchange_name in EXCHANGE_NAMES:
+        order_book[exchange_name][UPDATE_TIME]
+        order_book[exchange_name][BIDS][0]
+        order_book[exchange_name][ASKS][0]
+        order_book[exchange_name][ASKS][1]
+
+
+# Every pass sees a new write, so the snapshot is read from shared memory.
+def read_store_snapshot(store, full_depth):
+    store.write(EXCHANGE_NAMES[0], full_depth, time.time())
+    order_book = store.snapshot()
+    for exchange_name in EXCHANGE_NAMES:
+        order_book[exchange_name][UPDATE_TIME]
+        order_book[exchange_name][BIDS].top_offer()
+        order_book[exchange_name][ASKS].top_offer()
+
+
+# A speculator woken up without any new write only checks the version.
+def read_unchanged_snapshot(store):
+    store.snapshot().version
+
+
+def report(name, seconds):
+    print("{:<24} {:>10.2f} us/pass".format(name, seconds / ITERATIONS * 1e6))
+
+
+def main():
+    manager = multiprocessing.Manager()
+    order_book = manager.dict({exchange_name: {BIDS: [0.4402, 1623.3], ASKS: [0.4444, 4127.8],
+                                               UPDATE_TIME: datetime.now()}
+                               for exchange_name in EXCHANGE_NAMES})
+    store = orderbookstore.OrderBookStore(EXCHANGE_NAMES)
+    full_depth = orderbook.OrderBook()
+    full_depth.apply_snapshot([[0.4402 - i * 0.0001, 1623.3] for i in range(orderbookstore.ORDER_BOOK_DEPTH)],
+                              [[0.4444 + i * 0.0001, 4127.8] for i in range(orderbookstore.ORDER_BOOK_DEPTH)])
+    for exchange_name in EXCHANGE_NAMES:
+        store.write(exchange_name, full_depth, time.time())
+    try:
+        report("manager dict", timeit.timeit(lambda: read_manager_dict(order_book), number=ITERATIONS))
+        report("shared memory snapshot", timeit.timeit(lambda: read_store_snapshot(store, full_depth),
+                                                           number=ITERATIONS))
+        report("unchanged snapshot", timeit.timeit(lambda: read_unchanged_snapshot(store), number=ITERATIONS))
+    finally:
+        store.close()
+        store.unlink()
+        manager.shutdown()
+
+if __name__ == '__main__':
+    main()
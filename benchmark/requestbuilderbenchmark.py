@@ -0,0 +1,40 @@
+import time
+import timeit
+import urllib.parse
+
+from btc38 import client
+
+ITERATIONS = 100000
+MDT = "access_account_secret"
+
+
+# Submit order body as it was built before the request builder: signed on every call, then urlencoded from a dict.
+def build_submit_order_params(mdt_md5, order_type, mk_type, price, amount, coinname):
+    stamp = int(time.time())
+    md5 = mdt_md5.copy()
+    md5.update(str(stamp).encode(client.ENCODING))
+    params = {'key': 'access', 'time': stamp, 'md5': md5.hexdigest()}
+    params.update({'type': order_type,
+                   'mk_type': mk_type,
+                   'price': '{:.{prec}f}'.format(price, prec=client.PRECISION[mk_type]),
+                   'amount': '{:.{prec}f}'.format(amount, prec=client.PRECISION[client.AMOUNT_KEY]),
+                   'coinname': coinname})
+    return urllib.parse.urlencode(params).encode(client.ENCODING)
+
+
+def report(name, seconds):
+    print("{:<32} {:>8.2f} us/request".format(name, seconds / ITERATIONS * 1e6))
+
+
+def main():
+    mdt_md5 = client.get_mdt_prefix_md5(MDT)
+    builder = client.RequestBuilder('access', mdt_md5)
+    report("dict + urlencode", timeit.timeit(
+        lambda: build_submit_order_params(mdt_md5, 1, client.CNY_SYMBOL, 0.4402, 1623.38488, client.BTS_SYMBOL),
+        number=ITERATIONS))
+    report("request builder", timeit.timeit(
+        lambda: builder.build_submit_order(1, client.CNY_SYMBOL, 0.4402, 1623.38488, client.BTS_SYMBOL),
+        number=ITERATIONS))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import json
+import logging
+import time
+
+from btc38 import client
+from metrics import metricsregistry
+from network import asynchttp
+from network import hedgedrequest
+
+ENCODING = client.ENCODING
+log = logging.getLogger(__name__)
+
+
+class AsyncClient(object):
+    """
+        Asynchronous counterpart of client.Client with the same API surface. Requests go through a pool of keep-alive
+        connections, so repeated polling reuses the same TCP connection to api.btc38.com.
+        With hedge_requests, the read-only depth and ticker requests are hedged (see network.hedgedrequest).
+    """
+    def __init__(self, access_key=None, secret_key=None, account_id=None, base_url=client.BASE_URL,
+                 max_connections=asynchttp.DEFAULT_MAX_CONNECTIONS, hedge_requests=False):
+        self.base_url = base_url
+        self.pool = asynchttp.AsyncHttpPool(max_connections, {'User-Agent': 'Mozilla/4.0'})
+        self.hedge_policies = None
+        if hedge_requests:
+            self.hedge_policies = {name: hedgedrequest.HedgePolicy("btc38." + name) for name in ['depth', 'tickers']}
+        if access_key and secret_key:
+            self.access_key = access_key
+            self.secret_key = secret_key
+            self.mdt = "%s_%s_%s" % (access_key, account_id, secret_key)
+            self.mdt_md5 = client.get_mdt_prefix_md5(self.mdt)
+            self.request_builder = client.RequestBuilder(access_key, self.mdt_md5)
+        else:
+            log.warning("please provide correct keys")
+
+    async def __request(self, name, data=None, c=None, mk_type=None, tid=None, timeout=2):
+        return (await self.__request_body(name, data, c, mk_type, tid, timeout)).splitlines(keepends=True)
+
+    async def __request_body(self, name, data=None, c=None, mk_type=None, tid=None, timeout=2):
+        url = client.get_request_url(name, c, mk_type, tid, self.base_url)
+        if self.hedge_policies is not None and name in self.hedge_policies:
+            return await self.hedge_policies[name].request(lambda: self.pool.request(url, data, timeout))
+        return await self.pool.request(url, data, timeout)
+
+    async def get_tickers(self, c=client.BTS_SYMBOL, mk_type=client.CNY_SYMBOL):
+        result = await self.__request('tickers', c=c, mk_type=mk_type)
+        return json.loads(result[0].decode(ENCODING))
+
+    async def get_depth(self, c=client.BTS_SYMBOL, mk_type=client.CNY_SYMBOL):
+        result = await self.__request('depth', c=c, mk_type=mk_type)
+        parse_start = time.perf_counter()
+        order_book = client.parse_depth(result)
+        metricsregistry.registry.record("btc38.depth.parse", time.perf_counter() - parse_start)
+        return order_book
+
+    # Streaming counterpart of get_depth, parsing the best levels into the given depthparser.DepthParser.
+    async def get_depth_into(self, parser, c=client.BTS_SYMBOL, mk_type=client.CNY_SYMBOL):
+        body = await self.__request_body('depth', c=c, mk_type=mk_type)
+        parse_start = time.perf_counter()
+        parser.parse(body)
+        metricsregistry.registry.record("btc38.depth.parse", time.perf_counter() - parse_start)
+        return parser
+
+    async def get_my_balance(self):
+        result = await self.__request("balance", self.request_builder.build_balance())
+        return client.parse_balance(result)
+
+    async def submit_order(self, order_type, mk_type, price, amount, coinname):
+        body = self.request_builder.build_submit_order(order_type, mk_type, price, amount, coinname)
+        result = await self.__request("submitorder", body, timeout=4)
+        return client.parse_submit_order(result)
+
+    async def cancel_order(self, mk_type, order_id):
+        return await self.__request("cancelorder", self.request_builder.build_cancel_order(mk_type, order_id))
+
+    async def get_order_list(self, coinname=None):
+        result = await self.__request("myorders", self.request_builder.build_order_list(coinname))
+        return client.parse_order_list(result)
+
+    async def get_my_trade_list(self, mk_type=client.CNY_SYMBOL, coinname=client.BTS_SYMBOL, page=1):
+        result = await self.__request("mytrades", self.request_builder.build_trade_list(mk_type, coinname, page))
+        return json.loads(result[0].decode(ENCODING))
+
+    async def close(self):
+        await self.pool.close()
@@ -1,46 +1,95 @@
 from data import marketmakerexchange
+from data import orderbook
 from btc38 import client
+from btc38 import asyncclient
+from btc38 import depthparser
 import logging
 
 EXCHANGE_NAME = "btc38"
 BTC38_PROFIT_DEDUCTION = 10.014
+BALANCE_SUFFIX = "_balance"
 log = logging.getLogger(__name__)
 
 
+# btc38 names a market by its coin (c) and the currency it is quoted in (mk_type), e.g. c=bts, mk_type=cny.
+def get_symbols(market):
+    base, quote = marketmakerexchange.get_market_currencies(market)
+    return base.lower(), quote.lower()
+
+
+# Sample trade: {'order_id': '123456', 'type': '1', 'price': '0.44000', 'volume': '100.000000', 'time': 1490000000}
+def parse_trade(trade):
+    order_type = int(trade['type']) if 'type' in trade else None
+    price = float(trade['price']) if 'price' in trade else None
+    trade_time = float(trade['time']) if 'time' in trade else None
+    return marketmakerexchange.Trade(trade['order_id'], float(trade['volume']), order_type, price, trade_time)
+
+
 class BTC38Exchange(marketmakerexchange.MarketMakerExchange):
     def get_profit_deduction(self):
         return BTC38_PROFIT_DEDUCTION
 
-    def list_my_orders(self):
-        return self.client.get_order_list(marketmakerexchange.BTS)
+    """ Sample order:
+        {'id': '123456', 'coinname': 'bts', 'type': '1', 'price': '0.44000', 'amount': '100.000000', 'time': '...'}
+        Orders are listed by coin; those carrying another mk_type belong to another market of the coin.
+    """
+    def list_my_orders(self, market=marketmakerexchange.MARKET):
+        c, mk_type = get_symbols(market)
+        return [marketmakerexchange.OpenOrder(order['id'], int(order['type']), float(order['price']),
+                                              float(order['amount']))
+                for order in self.client.get_order_list(c) if order.get('mk_type', mk_type) == mk_type]
+
+    # Trade records reference the maker's order they filled by order_id.
+    def list_my_trades(self, market=marketmakerexchange.MARKET):
+        c, mk_type = get_symbols(market)
+        return [parse_trade(trade) for trade in self.client.get_my_trade_list(mk_type, c) if 'order_id' in trade]
+
+    def cancel_order(self, order_id, market=marketmakerexchange.MARKET):
+        self.client.cancel_order(get_symbols(market)[1], order_id)
 
-    def __init__(self, access_key=None, secret_key=None, account_id=None):
-        self.client = client.Client(access_key, secret_key, account_id)
+    # Only the best depth levels of each side are parsed from the depth responses. With hedge_requests, slow depth
+    # requests of the order book fetcher are hedged. All markets share the clients and their connections; each market
+    # has its own depth parser and order book. base_url points the clients at another API host, e.g. a simulator.
+    def __init__(self, access_key=None, secret_key=None, account_id=None, depth=depthparser.DEFAULT_DEPTH,
+                 hedge_requests=False, markets=None, base_url=client.BASE_URL):
+        self.client = client.Client(access_key, secret_key, account_id, base_url=base_url)
+        self.async_client = asyncclient.AsyncClient(access_key, secret_key, account_id, base_url=base_url,
+                                                    hedge_requests=hedge_requests)
+        self.markets = markets or [marketmakerexchange.MARKET]
+        self.depth_parsers = {market: depthparser.DepthParser(depth) for market in self.markets}
+        self.order_books = {market: orderbook.OrderBook() for market in self.markets}
 
+    def get_markets(self):
+        return self.markets
+
+    # Balances are reported as "{currency}_balance" for every coin of the account.
     def get_maker_account_balance(self):
         balance = self.client.get_my_balance()
-        return {marketmakerexchange.CNY: float(balance[client.CNY_BALANCE]),
-                marketmakerexchange.BTS: float(balance[client.BTS_BALANCE])}
+        currencies = {currency for market in self.markets
+                      for currency in marketmakerexchange.get_market_currencies(market)}
+        return {currency: float(balance[currency.lower() + BALANCE_SUFFIX]) for currency in currencies}
 
     def get_exchange_name(self):
         return EXCHANGE_NAME
 
-    def get_top_offers(self):
-        orders = self.client.get_depth()
-        if orders:
-            bids = orders[marketmakerexchange.BIDS]
-            asks = orders[marketmakerexchange.ASKS]
-            return [self.__get_true_orders(bids),
-                    self.__get_true_orders(asks)]
-
-    def submit_arbitrage_order(self, order_type, price, volume):
-        self.client.submit_order(order_type, client.CNY_SYMBOL, price, volume, client.BTS_SYMBOL)
-
-    @staticmethod
-    def __get_true_orders(orders):
-        vol = 0
-        for order in orders:
-            vol += order[1]
-            if vol > marketmakerexchange.FAKE_ORDER_AMOUNT:
-                return [order[0], vol]
-        return orders[0]
+    def get_order_book(self, market=marketmakerexchange.MARKET):
+        c, mk_type = get_symbols(market)
+        return self.__update_order_book(market, self.client.get_depth_into(self.depth_parsers[market], c, mk_type))
+
+    async def get_order_book_async(self, market=marketmakerexchange.MARKET):
+        c, mk_type = get_symbols(market)
+        depth = await self.async_client.get_depth_into(self.depth_parsers[market], c, mk_type)
+        return self.__update_order_book(market, depth)
+
+    def __update_order_book(self, market, depth):
+        order_book = self.order_books[market]
+        order_book.apply_snapshot(depth.get_bids(), depth.get_asks())
+        return order_book
+
+    def warm_up(self):
+        self.client.warm_up()
+
+    def submit_arbitrage_order(self, order_type, price, volume, market=marketmakerexchange.MARKET):
+        c, mk_type = get_symbols(market)
+        result = self.client.submit_order(order_type, mk_type, price, volume, c)
+        return client.get_order_id(result)
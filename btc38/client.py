@@ -1,13 +1,17 @@
+import http.client
 import urllib.request
 import urllib.error
 import urllib.parse
 import urllib
 import json
+import threading
 import time
 import hashlib
 from retry import retry
 import logging
+import select
 import socket
+from btc38 import depthparser
 from exceptions import exchangeexceptions
 
 BASE_URL = 'http://api.btc38.com/v1/'
@@ -54,41 +58,175 @@ PRECISION = {
 }
 
 
-def get_api_path(name):
+def get_api_path(name, base_url=BASE_URL):
     path_pattern = API_PATH_DICT[name]
-    return BASE_URL + path_pattern
+    return base_url + path_pattern
+
+
+def get_request_url(name, c=None, mk_type=None, tid=None, base_url=BASE_URL):
+    url = get_api_path(name, base_url)
+    if c:
+        query = "c=%s&mk_type=%s" % (c, mk_type)
+        if tid:
+            query += "&tid=%s" % tid
+        url += query
+    return url
+
+
+# Digest state after hashing the constant "{access key}_{account id}_{secret key}_" prefix of every signature.
+def get_mdt_prefix_md5(mdt):
+    return hashlib.md5(("%s_" % mdt).encode(ENCODING))
+
+
+# True if the server closed the idle socket, or reset it. Nothing is read from a socket still open.
+def is_closed_by_peer(sock):
+    readable, writable, failed = select.select([sock], [], [], 0)
+    if not readable:
+        return False
+    try:
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except OSError:
+        return True
+
+
+def parse_depth(result):
+    # Might get [b'fail#3'] or []
+    if not result:
+        raise exchangeexceptions.UpdateOrderBookFailureException("Retrieved order book has no entries.")
+    else:
+        order_book = result[0].decode(ENCODING)
+        if order_book.lstrip().startswith(depthparser.RATE_LIMIT_PREFIX.decode(ENCODING)):
+            raise exchangeexceptions.RateLimitException("Order book request rate-limited.")
+        if ORDER_BOOK_FAILURE_STRING in order_book:
+            raise exchangeexceptions.UpdateOrderBookFailureException("Failed to retrieve order book.")
+        return json.loads(order_book)
+
+
+def parse_balance(result):
+    response = result[0].decode(ENCODING)
+    try:
+        return json.loads(response)
+    except ValueError:
+        raise exchangeexceptions.RetrieveBalanceFailureException(
+            "Failed to retrieve account balance. Response: {}".format(response))
+
+
+def parse_submit_order(result):
+    decoded_response = result[0].decode(ENCODING)
+    if SUBMIT_ORDER_SUCCESS_STRING not in decoded_response:
+        raise exchangeexceptions.SubmitOrderFailureException(
+            "Failed to place order in BTC38 exchange. Response: {}".format(decoded_response))
+    return result
+
+
+# Successful submissions are answered with "succ|{order id}".
+def get_order_id(submit_order_result):
+    fields = submit_order_result[0].decode(ENCODING).strip().split('|')
+    return fields[1] if len(fields) > 1 else None
+
+
+def parse_order_list(result):
+    if result == [b'no_order']:
+        return []
+    return json.loads(result[0].decode(ENCODING))
+
+
+def encode_value(value):
+    return urllib.parse.quote_plus(str(value)).encode(ENCODING)
+
+
+class RequestBuilder(object):
+    """
+        Encodes the form bodies of the signed requests, as urllib.parse.urlencode did with parameter dicts.
+        A signature only depends on the timestamp, in seconds, so the "key=...&time=...&md5=..." prefix is signed once
+        per second from a copy of the digest state of the constant prefix. The fixed fields of each combination of
+        order type, mk_type and coin are encoded once into byte templates, and numbers are formatted with precomputed
+        formats for the precision of their mk_type.
+    """
+    def __init__(self, access_key, mdt_md5, clock=time.time):
+        self.key_field = b"key=" + encode_value(access_key)
+        self.mdt_md5 = mdt_md5
+        self.clock = clock
+        # (timestamp, signed prefix), replaced as a whole so that threads never mix up two timestamps.
+        self.signature = (None, None)
+        self.number_formats = {key: "%.{}f".format(precision).encode(ENCODING) for key, precision in PRECISION.items()}
+        # {(order type, mk_type, coinname): (fields up to the price, fields after the amount)}
+        self.submit_order_templates = {}
+        # {fields: their encoding after the signed prefix}
+        self.field_templates = {}
+
+    def get_signed_prefix(self):
+        stamp = int(self.clock())
+        signature = self.signature
+        if signature[0] != stamp:
+            md5 = self.mdt_md5.copy()
+            md5.update(str(stamp).encode(ENCODING))
+            signature = (stamp, b"%s&time=%d&md5=%s" % (self.key_field, stamp, md5.hexdigest().encode(ENCODING)))
+            self.signature = signature
+        return signature[1]
+
+    def build_balance(self):
+        return self.get_signed_prefix()
+
+    def build_submit_order(self, order_type, mk_type, price, amount, coinname):
+        key = (order_type, mk_type, coinname)
+        template = self.submit_order_templates.get(key)
+        if template is None:
+            template = (b"&type=%s&mk_type=%s&price=" % (encode_value(order_type), encode_value(mk_type)),
+                        b"&coinname=" + encode_value(coinname))
+            self.submit_order_templates[key] = template
+        return b"%s%s%s&amount=%s%s" % (self.get_signed_prefix(), template[0], self.number_formats[mk_type] % price,
+                                         self.number_formats[AMOUNT_KEY] % amount, template[1])
+
+    def build_cancel_order(self, mk_type, order_id):
+        return b"%s%s&order_id=%s" % (self.get_signed_prefix(), self.__get_fields(('mk_type', mk_type)),
+                                      encode_value(order_id))
+
+    def build_order_list(self, coinname=None):
+        return self.get_signed_prefix() + self.__get_fields(('coinname', coinname))
+
+    def build_trade_list(self, mk_type, coinname, page):
+        return self.get_signed_prefix() + self.__get_fields(('mk_type', mk_type), ('coinname', coinname),
+                                                            ('page', page))
+
+    def __get_fields(self, *fields):
+        template = self.field_templates.get(fields)
+        if template is None:
+            template = b"".join(b"&%s=%s" % (name.encode(ENCODING), encode_value(value)) for name, value in fields)
+            self.field_templates[fields] = template
+        return template
 
 
 class Client(object):
-    def __init__(self, access_key=None, secret_key=None, account_id=None):
+    def __init__(self, access_key=None, secret_key=None, account_id=None, base_url=BASE_URL):
+        self.base_url = base_url
+        # Every thread keeps its own keep-alive connection to the API host.
+        self.connections = threading.local()
         if access_key and secret_key:
             self.access_key = access_key
             self.secret_key = secret_key
             self.mdt = "%s_%s_%s" % (access_key, account_id, secret_key)
+            self.mdt_md5 = get_mdt_prefix_md5(self.mdt)
+            self.request_builder = RequestBuilder(access_key, self.mdt_md5)
         else:
             log.warning("please provide correct keys")
 
-    def __request(self, name, data=None, c=None, mk_type=None, tid=None, timeout=2):
+    # data is the encoded form body of a POST request, built by the request builder.
+    def __request(self, name, data=None, c=None, mk_type=None, tid=None, timeout=2, read=None):
         headers = {'User-Agent': 'Mozilla/4.0'}
-        url = get_api_path(name)
-
-        if c:
-            query = "c=%s&mk_type=%s" % (c, mk_type)
-            if tid:
-                query += "&tid=%s" % tid
-            url += query
+        url = get_request_url(name, c, mk_type, tid, self.base_url)
 
         if data:
-            data = urllib.parse.urlencode(data)
-            data = data.encode(ENCODING)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
             req = urllib.request.Request(url=url, data=data, headers=headers)
         else:
             req = urllib.request.Request(url=url, data=None, headers=headers)
 
-        resp = self.__urlopen_with_retry(req, timeout=timeout)
-        result = resp.readlines()
-        resp.close()
-        return result
+        return self.__send_with_retry(req, timeout=timeout, read=read or self.__read_lines)
+
+    # Open the calling thread's connection ahead of time, so that the first request does not pay for the handshake.
+    def warm_up(self, timeout=2):
+        self.__get_connection(timeout).connect()
 
     def get_tickers(self, c=BTS_SYMBOL, mk_type=CNY_SYMBOL):
         result = self.__request('tickers', c=c, mk_type=mk_type)
@@ -100,82 +238,95 @@ class Client(object):
     """
     def get_depth(self, c=BTS_SYMBOL, mk_type=CNY_SYMBOL):
         result = self.__request('depth', c=c, mk_type=mk_type)
-        # Might get [b'fail#3'] or []
-        if not result:
-            raise exchangeexceptions.UpdateOrderBookFailureException("Retrieved order book has no entries.")
-        else:
-            order_book = result[0].decode(ENCODING)
-            if ORDER_BOOK_FAILURE_STRING in order_book:
-                raise exchangeexceptions.UpdateOrderBookFailureException("Failed to retrieve order book.")
-            return json.loads(result[0].decode(ENCODING))
+        return parse_depth(result)
+
+    """
+        Streaming counterpart of get_depth: the response body is read once into the calling thread's reusable buffer,
+        and the best levels are parsed into the given depthparser.DepthParser, which is returned.
+    """
+    def get_depth_into(self, parser, c=BTS_SYMBOL, mk_type=CNY_SYMBOL):
+        length = self.__request('depth', c=c, mk_type=mk_type, read=self.__read_into_buffer)
+        return parser.parse(self.connections.buffer, length)
 
     def get_my_balance(self):
-        timestamp, md5 = self.__get_md5()
-        params = {'key': self.access_key, 'time': timestamp, 'md5': md5}
-        result = self.__request("balance", params)
-        response = result[0].decode(ENCODING)
-        try:
-            return json.loads(response)
-        except ValueError:
-            raise exchangeexceptions.RetrieveBalanceFailureException(
-                "Failed to retrieve account balance. Response: {}".format(response))
+        result = self.__request("balance", self.request_builder.build_balance())
+        return parse_balance(result)
 
     """ Submit order. Max precision for cny is 5 digits, for btc is 8. Max precision for amount is 6.
         Submit order API has a longer timeout so that orders have a better chance to be placed.
         type: 1 for buy, and 2 for sell
     """
     def submit_order(self, order_type, mk_type, price, amount, coinname):
-        timestamp, md5 = self.__get_md5()
-        prec_price = '{:.{prec}f}'.format(price, prec=PRECISION[mk_type])
-        prec_amount = '{:.{prec}f}'.format(amount, prec=PRECISION[AMOUNT_KEY])
-        params = {'key': self.access_key,
-                  'time': timestamp,
-                  'md5': md5,
-                  'type': order_type,
-                  'mk_type': mk_type,
-                  'price': prec_price,
-                  'amount': prec_amount,
-                  'coinname': coinname}
-
-        result = self.__request("submitorder", params, timeout=4)
-        decoded_response = result[0].decode(ENCODING)
-        if SUBMIT_ORDER_SUCCESS_STRING not in decoded_response:
-            raise exchangeexceptions.SubmitOrderFailureException(
-                "Failed to place order in BTC38 exchange. Response: {}".format(decoded_response))
-        return result
+        body = self.request_builder.build_submit_order(order_type, mk_type, price, amount, coinname)
+        result = self.__request("submitorder", body, timeout=4)
+        return parse_submit_order(result)
 
     def cancel_order(self, mk_type, order_id):
-        timestamp, md5 = self.__get_md5()
-        params = {'key': self.access_key, 'time': timestamp, 'md5': md5, 'mk_type': mk_type, 'order_id': order_id}
-        return self.__request("cancelorder", params)
+        return self.__request("cancelorder", self.request_builder.build_cancel_order(mk_type, order_id))
 
     def get_order_list(self, coinname=None):
-        timestamp, md5 = self.__get_md5()
-        params = {'key': self.access_key, 'time': timestamp, 'md5': md5, 'coinname': coinname}
-        result = self.__request("myorders", params)
-        if result == [b'no_order']:
-            return []
-        return json.loads(result[0].decode(ENCODING))
+        result = self.__request("myorders", self.request_builder.build_order_list(coinname))
+        return parse_order_list(result)
 
     def get_my_trade_list(self, mk_type=CNY_SYMBOL, coinname=BTS_SYMBOL, page=1):
-        timestamp, md5 = self.__get_md5()
-        params = {'key': self.access_key,
-                  'time': timestamp,
-                  'md5': md5,
-                  'mk_type': mk_type,
-                  'coinname': coinname,
-                  'page': page}
-
-        result = self.__request("mytrades", params)
+        result = self.__request("mytrades", self.request_builder.build_trade_list(mk_type, coinname, page))
         return json.loads(result[0].decode(ENCODING))
 
-    def __get_md5(self):
-        stamp = int(time.time())
-        mdt = "%s_%s" % (self.mdt, stamp)
-        md5 = hashlib.md5()
-        md5.update(mdt.encode(ENCODING))
-        return stamp, md5.hexdigest()
+    def __get_connection(self, timeout):
+        connection = getattr(self.connections, 'connection', None)
+        if connection is None:
+            host = urllib.parse.urlsplit(self.base_url).netloc
+            connection = http.client.HTTPConnection(host, timeout=timeout)
+            self.connections.connection = connection
+        connection.timeout = timeout
+        if connection.sock:
+            connection.sock.settimeout(timeout)
+        return connection
 
-    @retry((urllib.error.URLError, socket.timeout), tries=1, delay=1, backoff=1.1)
-    def __urlopen_with_retry(self, request, timeout):
-        return urllib.request.urlopen(request, timeout=timeout)
+    @staticmethod
+    def __read_lines(resp):
+        return resp.readlines()
+
+    # Read the body into the calling thread's buffer and return its length.
+    def __read_into_buffer(self, resp):
+        buffer = getattr(self.connections, 'buffer', None)
+        if buffer is None:
+            buffer = bytearray(depthparser.INITIAL_BUFFER_SIZE)
+            self.connections.buffer = buffer
+        return depthparser.read_response(resp, buffer)
+
+    """
+        A keep-alive connection closed by the server while idle is replaced before anything is written to it. A
+        request failing on a reused connection afterwards is sent again only if it is a GET: a POST such as
+        submitOrder may have been accepted before the connection dropped, and sending it again could place a second
+        order. The order tracker and the balance ledger find out whether it was.
+    """
+    @retry((http.client.HTTPException, urllib.error.URLError, socket.timeout), tries=1, delay=1, backoff=1.1)
+    def __send_with_retry(self, request, timeout, read):
+        connection = self.__get_connection(timeout)
+        if connection.sock is not None and is_closed_by_peer(connection.sock):
+            connection.close()
+        reused = connection.sock is not None
+        try:
+            return self.__send(connection, request, read)
+        except (http.client.RemoteDisconnected, ConnectionError):
+            if not reused or request.get_method() != 'GET':
+                raise
+            return self.__send(connection, request, read)
+
+    @staticmethod
+    def __send(connection, request, read):
+        try:
+            connection.request(request.get_method(), request.selector, body=request.data,
+                               headers=dict(request.header_items()))
+            resp = connection.getresponse()
+            result = read(resp)
+            resp.close()
+        except Exception:
+            connection.close()
+            raise
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(request.full_url, resp.status, resp.reason, resp.headers, None)
+        if resp.will_close:
+            connection.close()
+        return result
@@ -0,0 +1,114 @@
+import array
+import re
+
+from exceptions import exchangeexceptions
+
+DEFAULT_DEPTH = 50
+INITIAL_BUFFER_SIZE = 64 * 1024
+BIDS_KEY = b'"bids"'
+ASKS_KEY = b'"asks"'
+
+FIRST_CHARACTER = re.compile(rb'\s*(\S)')
+LIST_START = re.compile(rb'\s*:\s*\[')
+# One [price, volume] level, optionally preceded by the comma separating it from the previous level. Numbers may be
+# quoted, and anything after the volume is ignored.
+LEVEL_DELIMITERS = b'[]" \t\r\n'
+LEVEL = re.compile(rb'\s*,?\s*\[\s*"?([-+.0-9eE]+)"?\s*,\s*"?([-+.0-9eE]+)"?[^\]]*\]')
+# btc38 answers "fail#<n>" instead of the order book when it throttles the caller.
+RATE_LIMIT_PREFIX = b'fail#'
+
+
+"""
+    Read the whole body of an http.client response into a reusable bytearray, growing it only when the body does not
+    fit. Return the body length.
+"""
+def read_response(response, buffer):
+    length = 0
+    while True:
+        if length == len(buffer):
+            buffer.extend(bytes(len(buffer) or INITIAL_BUFFER_SIZE))
+        with memoryview(buffer) as view, view[length:] as remaining:
+            count = response.readinto(remaining)
+        if not count:
+            return length
+        length += count
+
+
+class DepthParser(object):
+    """
+        Parses depth.php responses without building the JSON document. Only the best depth levels of each side are read,
+        straight into preallocated arrays which are overwritten by the next parse:
+        bid_prices[:bid_count], bid_volumes[:bid_count], ask_prices[:ask_count] and ask_volumes[:ask_count].
+    """
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self.bid_prices = array.array('d', bytes(8 * depth))
+        self.bid_volumes = array.array('d', bytes(8 * depth))
+        self.ask_prices = array.array('d', bytes(8 * depth))
+        self.ask_volumes = array.array('d', bytes(8 * depth))
+        self.bid_count = 0
+        self.ask_count = 0
+
+    # body is bytes or a bytearray buffer, of which only the first length bytes are parsed.
+    def parse(self, body, length=None):
+        if length is None:
+            length = len(body)
+        # Failures are plain text such as b'fail#3', or an empty body. Anything else starts as a JSON object.
+        match = FIRST_CHARACTER.match(body, 0, length)
+        if match is None:
+            raise exchangeexceptions.UpdateOrderBookFailureException("Retrieved order book has no entries.")
+        if match.group(1) != b'{':
+            if body.startswith(RATE_LIMIT_PREFIX, match.start(1), length):
+                raise exchangeexceptions.RateLimitException("Order book request rate-limited.")
+            raise exchangeexceptions.UpdateOrderBookFailureException("Failed to retrieve order book.")
+
+        self.bid_count = self.__parse_side(body, length, BIDS_KEY, self.bid_prices, self.bid_volumes)
+        self.ask_count = self.__parse_side(body, length, ASKS_KEY, self.ask_prices, self.ask_volumes)
+        return self
+
+    def __parse_side(self, body, length, key, prices, volumes):
+        position = body.find(key, 0, length)
+        if position < 0:
+            raise exchangeexceptions.UpdateOrderBookFailureException(
+                "Order book has no {}.".format(key.decode('utf-8')))
+        match = LIST_START.match(body, position + len(key), length)
+        if match is None:
+            return 0
+
+        # Split off the best depth levels at their closing brackets, then convert all their numbers in one pass.
+        # The empty piece between the brackets closing the last level and the side ends the levels.
+        start = match.end()
+        pieces = body[start:length].split(b']', self.depth)
+        try:
+            count = pieces.index(b'', 0, self.depth)
+        except ValueError:
+            count = min(self.depth, len(pieces))
+        values = b''.join(pieces[:count]).translate(None, LEVEL_DELIMITERS).split(b',')
+        if count and len(values) == 2 * count:
+            try:
+                prices[:count] = array.array('d', map(float, values[0::2]))
+                volumes[:count] = array.array('d', map(float, values[1::2]))
+                return count
+            except ValueError:
+                pass
+        return self.__parse_levels(body, start, length, prices, volumes)
+
+    # Slower path for levels which are not plain [price, volume] pairs.
+    def __parse_levels(self, body, position, length, prices, volumes):
+        count = 0
+        while count < self.depth:
+            match = LEVEL.match(body, position, length)
+            if match is None:
+                break
+            prices[count] = float(match.group(1))
+            volumes[count] = float(match.group(2))
+            position = match.end()
+            count += 1
+        return count
+
+    # (price, volume) pairs of the parsed levels, best price first.
+    def get_bids(self):
+        return zip(self.bid_prices[:self.bid_count], self.bid_volumes[:self.bid_count])
+
+    def get_asks(self):
+        return zip(self.ask_prices[:self.ask_count], self.ask_volumes[:self.ask_count])
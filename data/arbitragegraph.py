@@ -0,0 +1,197 @@
+import collections
+import math
+
+from data import marketmakerexchange
+
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+SELL_ORDER = marketmakerexchange.SELL_ORDER
+# Reduced costs above -EPSILON count as non-negative, so that rounding errors neither report cycles nor loop forever.
+EPSILON = 1e-12
+# Potentials only ever decrease. Past this distance from zero they are rebuilt, before they lose precision.
+MAX_POTENTIAL_DRIFT = 1000
+
+
+class Edge(object):
+    """
+        Conversion of the source currency into the target currency by one order on one exchange's market, at the top
+        of book. Its weight is -log of the rate, plus the exchange's profit deduction on buys, so that a cycle of
+        negative total weight turns an amount of a currency into more of it. capacity is the amount of source currency
+        the top of book can take.
+    """
+    def __init__(self, exchange_name, market, order_type, source, target, price, volume, weight, capacity):
+        self.exchange_name = exchange_name
+        self.market = market
+        self.order_type = order_type
+        self.source = source
+        self.target = target
+        self.price = price
+        # Top of book volume, in base currency shares.
+        self.volume = volume
+        self.weight = weight
+        self.capacity = capacity
+
+    @property
+    def rate(self):
+        return math.exp(-self.weight)
+
+
+class Cycle(object):
+    """
+        Orders converting an amount of the start currency back into itself, one leg per edge in execution order.
+        amount is the largest amount of start currency the tops of book of all legs can take, and leg_amounts the
+        amount of source currency each leg takes for it.
+    """
+    def __init__(self, legs):
+        self.legs = legs
+        self.start_currency = legs[0].source
+        self.profit = math.exp(-sum(leg.weight for leg in legs)) - 1
+        self.amount = float('inf')
+        factor = 1
+        for leg in legs:
+            self.amount = min(self.amount, leg.capacity / factor)
+            factor *= leg.rate
+        self.leg_amounts = []
+        amount = self.amount
+        for leg in legs:
+            self.leg_amounts.append(amount)
+            amount *= leg.rate
+
+    # Profit in start currency when the whole amount is traded.
+    @property
+    def expected_profit(self):
+        return self.profit * self.amount
+
+    def __len__(self):
+        return len(self.legs)
+
+
+class ArbitrageGraph(object):
+    """
+        Currencies as nodes and the top of book of every exchange's market as edges: a sell edge from base to quote at
+        the best bid and a buy edge from quote to base at the best ask. Negative cycles are arbitrages.
+        The graph keeps potentials under which every edge has a non-negative reduced cost, except the deferred edges,
+        each of which closes a negative cycle. Any negative cycle goes through a deferred edge, so cycles are detected
+        incrementally: an edge whose update makes its reduced cost negative propagates new potentials from its target
+        until either they settle, or they reach back to its source, which closes a negative cycle and defers the edge.
+        find_cycles retries the deferred edges only. At most one cycle is reported per deferred edge.
+    """
+    def __init__(self, profit_deductions=None):
+        self.profit_deductions = profit_deductions or {}
+        self.potentials = collections.defaultdict(float)
+        # {currency: {edge key: edge}}
+        self.out_edges = collections.defaultdict(dict)
+        self.edges = {}
+        self.deferred_keys = set()
+
+    """
+        Replace the edges of an exchange's market with its top of book. bid and ask are [price, volume]; an empty side
+        has a zero price. Pass None for both to take the market out of the graph, e.g. while its order book is stale.
+    """
+    def update_book(self, exchange_name, market, bid, ask):
+        base, quote = marketmakerexchange.get_market_currencies(market)
+        sell_key = (exchange_name, market, SELL_ORDER)
+        buy_key = (exchange_name, market, BUY_ORDER)
+        if bid is None or bid[0] <= 0 or bid[1] <= 0:
+            self.__remove_edge(sell_key)
+        else:
+            self.__set_edge(sell_key, Edge(exchange_name, market, SELL_ORDER, base, quote, bid[0], bid[1],
+                                           -math.log(bid[0]), bid[1]))
+        if ask is None or ask[0] <= 0 or ask[1] <= 0:
+            self.__remove_edge(buy_key)
+        else:
+            self.__set_edge(buy_key, Edge(exchange_name, market, BUY_ORDER, quote, base, ask[0], ask[1],
+                                          math.log(ask[0]) + self.profit_deductions.get(exchange_name, 0),
+                                          ask[0] * ask[1]))
+
+    """
+        Cycles of at least min_legs legs and with a profit ratio above the threshold, ranked by expected profit.
+        Deferred edges whose cycle went away since are taken back into the graph.
+    """
+    def find_cycles(self, profit_threshold=0, min_legs=2):
+        if self.potentials and min(self.potentials.values()) < -MAX_POTENTIAL_DRIFT:
+            self.__reset_potentials()
+        cycles = []
+        for key in list(self.deferred_keys):
+            legs = self.__insert(self.edges[key])
+            if legs is not None and len(legs) >= min_legs:
+                cycle = Cycle(legs)
+                if cycle.profit > profit_threshold:
+                    cycles.append(cycle)
+        cycles.sort(key=lambda cycle: cycle.expected_profit, reverse=True)
+        return cycles
+
+    def __set_edge(self, key, edge):
+        self.edges[key] = edge
+        self.out_edges[edge.source][key] = edge
+        # A deferred edge is retried by find_cycles.
+        if key not in self.deferred_keys and self.__get_reduced_cost(edge) < -EPSILON:
+            self.__insert(edge)
+
+    def __remove_edge(self, key):
+        edge = self.edges.pop(key, None)
+        if edge is not None:
+            del self.out_edges[edge.source][key]
+            self.deferred_keys.discard(key)
+
+    # Start over from zero potentials, inserting the edges one by one as if they had all been deferred.
+    def __reset_potentials(self):
+        self.potentials.clear()
+        self.deferred_keys = set(self.edges.keys())
+        for edge in list(self.edges.values()):
+            self.__insert(edge)
+
+    def __get_reduced_cost(self, edge):
+        return self.potentials[edge.source] + edge.weight - self.potentials[edge.target]
+
+    """
+        Take the edge into the graph by lowering the potentials reachable from its target. Return the legs of the
+        negative cycle it closes, in which case the potentials are restored and the edge is deferred, or None.
+    """
+    def __insert(self, edge):
+        key = (edge.exchange_name, edge.market, edge.order_type)
+        self.deferred_keys.discard(key)
+        potentials = self.potentials
+        if potentials[edge.source] + edge.weight >= potentials[edge.target] - EPSILON:
+            return None
+
+        previous_potentials = {edge.target: potentials[edge.target]}
+        predecessors = {edge.target: edge}
+        potentials[edge.target] = potentials[edge.source] + edge.weight
+        pending = collections.deque([edge.target])
+        queued = {edge.target}
+        while pending:
+            currency = pending.popleft()
+            queued.discard(currency)
+            for out_key, out_edge in self.out_edges[currency].items():
+                if out_key in self.deferred_keys or out_edge is edge:
+                    continue
+                target = out_edge.target
+                potential = potentials[currency] + out_edge.weight
+                if potential >= potentials[target] - EPSILON:
+                    continue
+                if target == edge.source:
+                    legs = self.__trace_cycle(edge, out_edge, predecessors)
+                    for changed_currency, previous_potential in previous_potentials.items():
+                        potentials[changed_currency] = previous_potential
+                    self.deferred_keys.add(key)
+                    return legs
+                previous_potentials.setdefault(target, potentials[target])
+                potentials[target] = potential
+                predecessors[target] = out_edge
+                if target not in queued:
+                    pending.append(target)
+                    queued.add(target)
+        return None
+
+    # Walk the predecessors back from the closing edge to the inserted edge.
+    @staticmethod
+    def __trace_cycle(edge, closing_edge, predecessors):
+        legs = [closing_edge]
+        currency = closing_edge.source
+        while currency != edge.target and len(legs) <= len(predecessors):
+            predecessor = predecessors[currency]
+            legs.append(predecessor)
+            currency = predecessor.source
+        legs.append(edge)
+        legs.reverse()
+        return legs
@@ -0,0 +1,142 @@
+import bisect
+
+LISTING_VOLUME_HAIRCUT = 0.2
+
+
+class ArbitragePlan(object):
+    def __init__(self, asks, bids, profit_deduction):
+        self.asks = asks
+        self.bids = bids
+        self.profit_deduction = profit_deduction
+        self.purchase_volume = 0
+        self.sell_volume = 0
+        self.cost = 0
+        self.revenue = 0
+
+    # Levels taken from the buyer's asks and the seller's bids, as [price, volume]. Built on demand.
+    @property
+    def purchase_levels(self):
+        return take_levels(self.asks, self.purchase_volume)
+
+    @property
+    def sell_levels(self):
+        return take_levels(self.bids, self.sell_volume)
+
+    # Limit prices that fill every level of the plan: the worst ask bought and the worst bid sold.
+    @property
+    def purchase_price(self):
+        return get_marginal_price(self.asks, self.purchase_volume)
+
+    @property
+    def sell_price(self):
+        return get_marginal_price(self.bids, self.sell_volume)
+
+    # Expected profit in CNY after the buyer's profit deduction.
+    @property
+    def profit(self):
+        return self.revenue - self.cost * (1 + self.profit_deduction)
+
+
+def get_sell_volume(purchase_volume, withdrawal_ratio, withdrawal_fee):
+    return purchase_volume * withdrawal_ratio - withdrawal_fee
+
+
+# Cost of taking the given volume from the best levels of an order book side.
+def get_notional(side, volume):
+    if volume <= 0:
+        return 0
+    cumulative_volumes = side.get_cumulative_volumes()
+    cumulative_notionals = side.get_cumulative_notionals()
+    index = min(bisect.bisect_left(cumulative_volumes, volume), len(cumulative_volumes) - 1)
+    if index == 0:
+        return volume * side.prices[0]
+    return cumulative_notionals[index - 1] + (volume - cumulative_volumes[index - 1]) * side.prices[index]
+
+
+# Volume that can be taken from the best levels of an order book side for the given notional.
+def get_volume_for_notional(side, notional):
+    cumulative_volumes = side.get_cumulative_volumes()
+    cumulative_notionals = side.get_cumulative_notionals()
+    index = bisect.bisect_right(cumulative_notionals, notional)
+    if index >= len(cumulative_notionals):
+        return cumulative_volumes[-1] if cumulative_volumes else 0
+    if index == 0:
+        return notional / side.prices[0]
+    return cumulative_volumes[index - 1] + (notional - cumulative_notionals[index - 1]) / side.prices[index]
+
+
+# Price of the last level needed to fill the given volume.
+def get_marginal_price(side, volume):
+    if volume <= 0:
+        return 0
+    cumulative_volumes = side.get_cumulative_volumes()
+    return side.prices[min(bisect.bisect_left(cumulative_volumes, volume), len(cumulative_volumes) - 1)]
+
+
+# Best levels of an order book side filling the given volume, as [price, volume] with the last level partially taken.
+def take_levels(side, volume):
+    if volume <= 0:
+        return []
+    cumulative_volumes = side.get_cumulative_volumes()
+    index = min(bisect.bisect_left(cumulative_volumes, volume), len(cumulative_volumes) - 1)
+    levels = side.levels(index + 1)
+    levels[-1][1] = volume - (cumulative_volumes[index - 1] if index else 0)
+    return levels
+
+
+"""
+    Largest purchase volume for which every share bought at the buyer's asks and sold (after withdrawal) at the
+    seller's bids beats the profit threshold after the buyer's profit deduction.
+    The marginal ask price rises and the marginal bid price falls with volume, so the profitable volume is found by
+    binary search over ask levels, each probe counting the bids above the break-even price with one bisect.
+"""
+def get_profitable_volume(asks, bids, profit_deduction, withdrawal_ratio, profit_threshold):
+    if not len(asks) or not len(bids):
+        return 0
+    ask_volumes = asks.get_cumulative_volumes()
+    bid_volumes = bids.get_cumulative_volumes()
+
+    # Purchase volume whose sale the bids above the break-even price of the ask level can absorb.
+    def get_bid_support(ask_index):
+        break_even_price = asks.prices[ask_index] * (1 + profit_deduction + profit_threshold) / withdrawal_ratio
+        bid_count = bisect.bisect_left(bids.keys, -break_even_price)
+        return bid_volumes[bid_count - 1] / withdrawal_ratio if bid_count else 0
+
+    # Find the last ask level whose first share is still profitable.
+    low, high = 0, len(asks)
+    while low < high:
+        middle = (low + high) // 2
+        previous_volume = ask_volumes[middle - 1] if middle else 0
+        if previous_volume < get_bid_support(middle):
+            low = middle + 1
+        else:
+            high = middle
+    if low == 0:
+        return 0
+    return min(ask_volumes[low - 1], get_bid_support(low - 1))
+
+
+"""
+    Size an arbitrage across several levels of the buyer's asks and the seller's bids (data.orderbook.OrderBookSide).
+    The volume is the largest profitable one, less a haircut that leaves some volume in the listings, and capped by
+    the usable CNY on the buyer's account and the usable BTS on the seller's account.
+    Price = BTS price in terms of CNY. Volume = number of BTS shares.
+"""
+def size_arbitrage(asks, bids, profit_deduction, withdrawal_ratio, withdrawal_fee, usable_cny, usable_bts,
+                   profit_threshold, listing_volume_buffer):
+    plan = ArbitragePlan(asks, bids, profit_deduction)
+    if usable_cny <= 0:
+        return plan
+
+    volume_available = get_profitable_volume(asks, bids, profit_deduction, withdrawal_ratio, profit_threshold)
+    safe_volume = volume_available - max(volume_available * LISTING_VOLUME_HAIRCUT, listing_volume_buffer)
+    purchase_volume = min(safe_volume, (usable_bts + withdrawal_fee) / withdrawal_ratio,
+                          get_volume_for_notional(asks, usable_cny))
+    if purchase_volume <= 0:
+        return plan
+
+    plan.purchase_volume = purchase_volume
+    plan.sell_volume = get_sell_volume(purchase_volume, withdrawal_ratio, withdrawal_fee)
+    plan.cost = get_notional(asks, purchase_volume)
+    plan.revenue = get_notional(bids, plan.sell_volume)
+    return plan
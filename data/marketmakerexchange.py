@@ -1,35 +1,116 @@
 import abc
+import asyncio
 
 BIDS = 'bids'
 ASKS = 'asks'
+# Markets are named "{base}_{quote}", prices being in quote currency per base share.
 MARKET = "BTS_CNY"
+MARKET_SEPARATOR = "_"
 CNY = "CNY"
 BTS = "BTS"
 FAKE_ORDER_AMOUNT = 10
+BUY_ORDER = 1
+SELL_ORDER = 2
+
+
+# Base and quote currencies of a market, e.g. ("BTS", "CNY") for "BTS_CNY".
+def get_market_currencies(market):
+    base, quote = market.split(MARKET_SEPARATOR)
+    return base, quote
+
+
+# Name under which an exchange's order book of a market is recorded. The default market keeps the plain exchange name,
+# so that tick files recorded before markets existed are still replayed.
+def get_book_name(exchange_name, market):
+    return exchange_name if market == MARKET else "{}.{}".format(exchange_name, market)
+
+
+class OpenOrder(object):
+    # An order still open on an exchange. remaining_volume is the part not filled yet.
+    def __init__(self, order_id, order_type, price, remaining_volume):
+        self.order_id = order_id
+        self.order_type = order_type
+        self.price = price
+        self.remaining_volume = remaining_volume
+
+
+class Trade(object):
+    # A fill of one of the maker's orders. Order type, price and time (in seconds) are None if the exchange omits them.
+    def __init__(self, order_id, volume, order_type=None, price=None, trade_time=None):
+        self.order_id = order_id
+        self.volume = volume
+        self.order_type = order_type
+        self.price = price
+        self.trade_time = trade_time
 
 
 class MarketMakerExchange(object):
-    # order_type 1 for biding, 2 for asking.
+    """
+        Every trading method takes the market it acts on, MARKET by default. An exchange trades the markets returned by
+        get_markets(), and shares its connections between them.
+    """
+    # order_type 1 for biding, 2 for asking. Return the id of the placed order, or None if the exchange does not tell.
+    @abc.abstractclassmethod
+    def submit_arbitrage_order(self, order_type, price, volume, market=MARKET):
+        raise NotImplementedError('Not implemented in abc')
+
     @abc.abstractclassmethod
-    def submit_arbitrage_order(self, order_type, price, volume):
+    def cancel_order(self, order_id, market=MARKET):
         raise NotImplementedError('Not implemented in abc')
 
+    # Fetch the latest depth and return the exchange's data.orderbook.OrderBook of the market, updated in place.
     @abc.abstractclassmethod
-    def get_top_offers(self):
+    def get_order_book(self, market=MARKET):
         raise NotImplementedError('Not implemented in abc')
 
+    # Exchanges with an asynchronous client override this. By default the blocking call runs in the loop's executor.
+    async def get_order_book_async(self, market=MARKET):
+        return await asyncio.get_event_loop().run_in_executor(None, self.get_order_book, market)
+
+    """
+        Return {market: order book} for the given markets. Exchanges with a batched depth endpoint override this, along
+        with get_request_count. By default the markets are fetched concurrently.
+    """
+    async def get_order_books_async(self, markets):
+        order_books = await asyncio.gather(*[self.get_order_book_async(market) for market in markets])
+        return dict(zip(markets, order_books))
+
+    # Number of requests get_order_books_async sends for the given markets.
+    def get_request_count(self, markets):
+        return len(markets)
+
+    """
+        Return a feed pushing the order books of the given markets, to be started in the order book fetcher process,
+        or None if the exchange is polled. Exchanges with pushed market data override this.
+    """
+    def create_market_feed(self, markets):
+        return None
+
+    def get_markets(self):
+        return [MARKET]
+
     @abc.abstractclassmethod
     def get_exchange_name(self):
         raise NotImplementedError('Not implemented in abc')
 
+    # Open the calling thread's connections ahead of the first order. Nothing to do by default.
+    def warm_up(self):
+        pass
+
+    # Return {currency: amount} for every currency of the exchange's markets.
     @abc.abstractclassmethod
     def get_maker_account_balance(self):
         raise NotImplementedError('Not implemented in abc')
 
+    # Return the maker's open orders in the market as a list of OpenOrder.
     @abc.abstractclassmethod
-    def list_my_orders(self):
+    def list_my_orders(self, market=MARKET):
         raise NotImplementedError('Not implemented in abc')
 
+    # Return the maker's recent fills in the market as a list of Trade. Exchanges without a trade history return none.
+    def list_my_trades(self, market=MARKET):
+        return []
+
     @abc.abstractclassmethod
     def get_profit_deduction(self):
         raise NotImplementedError('Not implemented in abc')
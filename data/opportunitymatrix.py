@@ -0,0 +1,71 @@
+import array
+
+from data import marketmakerexchange
+
+BIDS = marketmakerexchange.BIDS
+ASKS = marketmakerexchange.ASKS
+
+
+class Opportunity(object):
+    def __init__(self, buyer_name, seller_name, profit, expected_profit):
+        self.buyer_name = buyer_name
+        self.seller_name = seller_name
+        # Profit ratio after the buyer's profit deduction.
+        self.profit = profit
+        # Profit in CNY if the whole top of book volume could be traded.
+        self.expected_profit = expected_profit
+
+
+class OpportunityMatrix(object):
+    """
+        Top of book and profit deduction of every exchange, held in arrays indexed by exchange, so that the net profit
+        of buying on every exchange and selling on every other one is computed in a single pass.
+    """
+    def __init__(self, profit_deductions):
+        self.exchange_names = list(profit_deductions.keys())
+        size = len(self.exchange_names)
+        self.profit_deductions = array.array('d', profit_deductions.values())
+        self.bid_prices = array.array('d', [0] * size)
+        self.bid_volumes = array.array('d', [0] * size)
+        self.ask_prices = array.array('d', [0] * size)
+        self.ask_volumes = array.array('d', [0] * size)
+
+    # top_of_book: {exchange name: {BIDS: [price, volume], ASKS: [price, volume]}}
+    def update(self, top_of_book):
+        for index, exchange_name in enumerate(self.exchange_names):
+            self.bid_prices[index], self.bid_volumes[index] = top_of_book[exchange_name][BIDS]
+            self.ask_prices[index], self.ask_volumes[index] = top_of_book[exchange_name][ASKS]
+
+    """
+        Net profit ratio of every (buyer, seller) pair, as a row per buyer. Buying and selling on the same exchange,
+        or on an exchange with an empty side, is never profitable.
+    """
+    def get_profit_matrix(self):
+        bid_prices = self.bid_prices
+        return [[(bid_price - ask_price) / ask_price - deduction if ask_price > 0 and bid_price > 0 else float('-inf')
+                 for bid_price in bid_prices]
+                for ask_price, deduction in zip(self.ask_prices, self.profit_deductions)]
+
+    """
+        All (buyer, seller) pairs of valid exchanges whose net profit is above the threshold, ranked by expected profit.
+        Only pairs involving at least one of the updated exchanges are considered.
+    """
+    def find_opportunities(self, valid_exchanges, updated_exchanges, profit_threshold):
+        names = self.exchange_names
+        opportunities = []
+        for buyer_index, profits in enumerate(self.get_profit_matrix()):
+            buyer_name = names[buyer_index]
+            if buyer_name not in valid_exchanges:
+                continue
+            for seller_index, profit in enumerate(profits):
+                seller_name = names[seller_index]
+                if profit <= profit_threshold or seller_index == buyer_index or seller_name not in valid_exchanges:
+                    continue
+                if buyer_name not in updated_exchanges and seller_name not in updated_exchanges:
+                    continue
+                volume = min(self.ask_volumes[buyer_index], self.bid_volumes[seller_index])
+                opportunities.append(Opportunity(buyer_name, seller_name, profit,
+                                                 profit * self.ask_prices[buyer_index] * volume))
+
+        opportunities.sort(key=lambda opportunity: opportunity.expected_profit, reverse=True)
+        return opportunities
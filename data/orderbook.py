@@ -0,0 +1,147 @@
+import bisect
+import itertools
+import operator
+
+from data import marketmakerexchange
+
+
+class OrderBookSide(object):
+    """
+        Price levels of one side of an order book, kept sorted from the best price: descending for bids, ascending for
+        asks. Levels live in parallel lists searched with bisect, and cumulative volumes are rebuilt lazily after
+        updates so that repeated depth queries on an unchanged side cost O(log n).
+    """
+    def __init__(self, descending):
+        self.descending = descending
+        # Sort keys are the prices for asks and the negated prices for bids, so both sides are ascending in keys.
+        self.keys = []
+        self.prices = []
+        self.volumes = []
+        self.cumulative_volumes = None
+        self.cumulative_notionals = None
+
+    @classmethod
+    def from_sorted_levels(cls, descending, prices, volumes):
+        side = cls(descending)
+        side.prices = list(prices)
+        side.volumes = list(volumes)
+        side.keys = [-price for price in side.prices] if descending else list(side.prices)
+        return side
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __key(self, price):
+        return -price if self.descending else price
+
+    # Set the volume of a price level. Zero volume removes the level.
+    def update(self, price, volume):
+        key = self.__key(price)
+        index = bisect.bisect_left(self.keys, key)
+        level_exists = index < len(self.keys) and self.keys[index] == key
+
+        if volume > 0:
+            if level_exists:
+                self.volumes[index] = volume
+            else:
+                self.keys.insert(index, key)
+                self.prices.insert(index, price)
+                self.volumes.insert(index, volume)
+        elif level_exists:
+            del self.keys[index]
+            del self.prices[index]
+            del self.volumes[index]
+        self.cumulative_volumes = None
+        self.cumulative_notionals = None
+
+    """
+        Changes needed to turn this side into the given levels, as a list of [price, volume].
+        Removed levels are reported with volume 0.
+    """
+    def diff(self, levels):
+        current = dict(zip(self.prices, self.volumes))
+        changes = [[price, volume] for price, volume in levels if current.pop(price, None) != volume]
+        changes.extend([price, 0] for price in current)
+        return changes
+
+    """
+        Bring this side in line with a full depth snapshot. A single changed level is updated in place; otherwise the
+        side is rebuilt from the snapshot in one sort, rather than shifting the lists for every inserted level.
+    """
+    def apply_snapshot(self, levels):
+        changes = self.diff(levels)
+        if len(changes) == 1:
+            self.update(*changes[0])
+        elif changes:
+            self.__replace(levels)
+        return changes
+
+    def __replace(self, levels):
+        volumes = dict(levels)
+        self.prices = sorted((price for price, volume in volumes.items() if volume > 0), reverse=self.descending)
+        self.volumes = [volumes[price] for price in self.prices]
+        self.keys = [-price for price in self.prices] if self.descending else list(self.prices)
+        self.cumulative_volumes = None
+        self.cumulative_notionals = None
+
+    def levels(self, depth=None):
+        return [[price, volume] for price, volume in zip(self.prices[:depth], self.volumes[:depth])]
+
+    def best(self):
+        return [self.prices[0], self.volumes[0]] if self.prices else [0, 0]
+
+    def get_cumulative_volumes(self):
+        if self.cumulative_volumes is None:
+            self.cumulative_volumes = list(itertools.accumulate(self.volumes))
+        return self.cumulative_volumes
+
+    def get_cumulative_notionals(self):
+        if self.cumulative_notionals is None:
+            self.cumulative_notionals = list(itertools.accumulate(map(operator.mul, self.prices, self.volumes)))
+        return self.cumulative_notionals
+
+    # Total volume of the best levels, up to and including the level at the given index.
+    def cumulative_volume(self, index):
+        cumulative_volumes = self.get_cumulative_volumes()
+        if not cumulative_volumes:
+            return 0
+        return cumulative_volumes[min(index, len(cumulative_volumes) - 1)]
+
+    # Index of the first level at which the cumulative volume exceeds the given volume, or len(self) if none does.
+    def level_index_for_volume(self, volume):
+        return bisect.bisect_right(self.get_cumulative_volumes(), volume)
+
+    """
+        Skip the fake orders on top of the book: return [price, cumulative volume] of the first level at which the
+        cumulative volume exceeds the minimum volume, or the best level if the whole side is thinner than that.
+    """
+    def top_offer(self, min_volume=marketmakerexchange.FAKE_ORDER_AMOUNT):
+        index = self.level_index_for_volume(min_volume)
+        if index < len(self.prices):
+            return [self.prices[index], self.get_cumulative_volumes()[index]]
+        return self.best()
+
+
+class OrderBook(object):
+    def __init__(self):
+        self.bids = OrderBookSide(descending=True)
+        self.asks = OrderBookSide(descending=False)
+
+    """
+        Update the book from a full depth snapshot. Levels are [price, volume, ...] lists in any order.
+        Return the changed levels of each side.
+    """
+    def apply_snapshot(self, bids, asks):
+        return {marketmakerexchange.BIDS: self.bids.apply_snapshot(self.__aggregate(bids)),
+                marketmakerexchange.ASKS: self.asks.apply_snapshot(self.__aggregate(asks))}
+
+    # Some exchanges list every order separately, so merge orders at the same price into one level.
+    @staticmethod
+    def __aggregate(levels):
+        volumes = {}
+        for level in levels:
+            volumes[level[0]] = volumes.get(level[0], 0) + level[1]
+        return list(volumes.items())
+
+    def top_offers(self):
+        return [self.bids.top_offer(), self.asks.top_offer()]
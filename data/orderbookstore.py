@@ -0,0 +1,178 @@
+import logging
+import struct
+import time
+import types
+from datetime import datetime
+from multiprocessing import shared_memory
+
+from data import marketmakerexchange
+from data import orderbook
+
+BIDS = marketmakerexchange.BIDS
+ASKS = marketmakerexchange.ASKS
+UPDATE_TIME = "updateTime"
+# Number of price levels kept for each side of the book.
+ORDER_BOOK_DEPTH = 50
+
+# Slot layout for each exchange: sequence number, then the payload made of update time, bid level count, ask level
+# count, bid prices, bid volumes, ask prices and ask volumes.
+SEQUENCE_FORMAT = "Q"
+HEADER_FORMAT = "dII"
+LEVELS_FORMAT = "{}d".format(ORDER_BOOK_DEPTH * 4)
+SEQUENCE_SIZE = struct.calcsize(SEQUENCE_FORMAT)
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+PAYLOAD_FORMAT = HEADER_FORMAT + LEVELS_FORMAT
+SLOT_SIZE = SEQUENCE_SIZE + struct.calcsize(PAYLOAD_FORMAT)
+# Attempts at reading all slots without any write in between, before settling for per-slot consistency.
+MAX_SNAPSHOT_ATTEMPTS = 3
+# A slot read spins this many times before yielding the CPU to the writer between attempts, and gives up after
+# SLOT_READ_TIMEOUT seconds: a write takes microseconds, so a slot left mid-write that long has lost its writer.
+SLOT_READ_SPINS = 100
+SLOT_READ_TIMEOUT = 0.01
+
+log = logging.getLogger(__name__)
+
+
+def pad_levels(values):
+    return values + [0] * (ORDER_BOOK_DEPTH - len(values))
+
+
+class OrderBookSnapshot(object):
+    """
+        Read-only view of the order books of all exchanges: {exchange name: {BIDS, ASKS, UPDATE_TIME}}, with the store
+        version it was taken at. Its order book sides are shared with other holders of the same snapshot and must not
+        be modified.
+    """
+    def __init__(self, version, order_books):
+        self.version = version
+        self.order_books = types.MappingProxyType(order_books)
+
+    def __getitem__(self, exchange_name):
+        return self.order_books[exchange_name]
+
+    def __contains__(self, exchange_name):
+        return exchange_name in self.order_books
+
+    def __iter__(self):
+        return iter(self.order_books)
+
+    def __len__(self):
+        return len(self.order_books)
+
+    def keys(self):
+        return self.order_books.keys()
+
+    def items(self):
+        return self.order_books.items()
+
+
+class OrderBookStore(object):
+    """
+        Order books of every exchange, kept in one shared memory block so that fetcher processes can write and the
+        speculator can read without a round trip to a manager process.
+        Each exchange slot is guarded by a seqlock: the writer makes the sequence number odd while it is writing and
+        even once it is done. Readers retry until they see the same even sequence number before and after reading.
+        Every slot has exactly one writer (its fetcher), so writers never need to lock.
+        The store version is the total number of writes, i.e. half the sum of the slot sequence numbers, so it grows
+        with every write and can be read without touching the order books.
+    """
+    def __init__(self, exchange_names):
+        self.slot_index = {exchange_name: index for index, exchange_name in enumerate(exchange_names)}
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(SLOT_SIZE * len(self.slot_index), 1))
+        self.slot_offsets = [index * SLOT_SIZE for index in self.slot_index.values()]
+        # Last snapshot taken by this process, handed out again while the version is unchanged.
+        self.last_snapshot = None
+
+        current_time = time.time()
+        for exchange_name in self.slot_index:
+            self.write(exchange_name, orderbook.OrderBook(), current_time)
+
+    def write(self, exchange_name, order_book, update_time):
+        bids = order_book.bids
+        asks = order_book.asks
+        bid_count = min(len(bids), ORDER_BOOK_DEPTH)
+        ask_count = min(len(asks), ORDER_BOOK_DEPTH)
+
+        offset = self.slot_index[exchange_name] * SLOT_SIZE
+        buf = self.shared_memory.buf
+        sequence = struct.unpack_from(SEQUENCE_FORMAT, buf, offset)[0]
+
+        struct.pack_into(SEQUENCE_FORMAT, buf, offset, sequence + 1)
+        struct.pack_into(PAYLOAD_FORMAT, buf, offset + SEQUENCE_SIZE, update_time, bid_count, ask_count,
+                         *(pad_levels(bids.prices[:bid_count]) + pad_levels(bids.volumes[:bid_count]) +
+                           pad_levels(asks.prices[:ask_count]) + pad_levels(asks.volumes[:ask_count])))
+        struct.pack_into(SEQUENCE_FORMAT, buf, offset, sequence + 2)
+
+    def read(self, exchange_name):
+        return self.__read_slot(exchange_name)[1]
+
+    """
+        Return the slot's sequence number along with its order book. A slot which cannot be read consistently within
+        SLOT_READ_TIMEOUT is returned as an empty book last updated at the epoch, which is never valid, with its
+        sequence number counted as written like get_version does.
+    """
+    def __read_slot(self, exchange_name):
+        offset = self.slot_index[exchange_name] * SLOT_SIZE
+        buf = self.shared_memory.buf
+        deadline = None
+        attempts = 0
+        while True:
+            sequence_before = struct.unpack_from(SEQUENCE_FORMAT, buf, offset)[0]
+            if not sequence_before & 1:
+                payload = struct.unpack_from(PAYLOAD_FORMAT, buf, offset + SEQUENCE_SIZE)
+                if struct.unpack_from(SEQUENCE_FORMAT, buf, offset)[0] == sequence_before:
+                    break
+            attempts += 1
+            if attempts >= SLOT_READ_SPINS:
+                if deadline is None:
+                    deadline = time.perf_counter() + SLOT_READ_TIMEOUT
+                elif time.perf_counter() > deadline:
+                    log.warning("Gave up reading the {} order book, left mid-write. (Sequence: {})"
+                                .format(exchange_name, sequence_before))
+                    return sequence_before + (sequence_before & 1), self.__stale_order_book()
+                time.sleep(0)
+
+        update_time, bid_count, ask_count = payload[:3]
+        levels = payload[3:]
+        bid_prices = levels[:bid_count]
+        bid_volumes = levels[ORDER_BOOK_DEPTH:ORDER_BOOK_DEPTH + bid_count]
+        ask_prices = levels[ORDER_BOOK_DEPTH * 2:ORDER_BOOK_DEPTH * 2 + ask_count]
+        ask_volumes = levels[ORDER_BOOK_DEPTH * 3:ORDER_BOOK_DEPTH * 3 + ask_count]
+        return sequence_before, {BIDS: orderbook.OrderBookSide.from_sorted_levels(True, bid_prices, bid_volumes),
+                                 ASKS: orderbook.OrderBookSide.from_sorted_levels(False, ask_prices, ask_volumes),
+                                 UPDATE_TIME: datetime.fromtimestamp(update_time)}
+
+    @staticmethod
+    def __stale_order_book():
+        return {BIDS: orderbook.OrderBookSide(descending=True), ASKS: orderbook.OrderBookSide(descending=False),
+                UPDATE_TIME: datetime.fromtimestamp(0)}
+
+    # Number of writes so far. A slot being written counts as written.
+    def get_version(self):
+        buf = self.shared_memory.buf
+        return sum((struct.unpack_from(SEQUENCE_FORMAT, buf, offset)[0] + 1) // 2 for offset in self.slot_offsets)
+
+    """
+        Consistent OrderBookSnapshot of every exchange's order book, to be used for one speculation pass. The books of
+        all exchanges are read without any write in between, unless writes keep coming in, in which case each book is
+        still consistent on its own. While the version is unchanged, the same snapshot is returned without reading.
+    """
+    def snapshot(self):
+        version = self.get_version()
+        if self.last_snapshot is not None and self.last_snapshot.version == version:
+            return self.last_snapshot
+
+        for _ in range(MAX_SNAPSHOT_ATTEMPTS):
+            slots = {exchange_name: self.__read_slot(exchange_name) for exchange_name in self.slot_index}
+            version = sum(sequence // 2 for sequence, order_book in slots.values())
+            if self.get_version() == version:
+                break
+        self.last_snapshot = OrderBookSnapshot(version, {exchange_name: order_book
+                                                         for exchange_name, (sequence, order_book) in slots.items()})
+        return self.last_snapshot
+
+    def close(self):
+        self.shared_memory.close()
+
+    def unlink(self):
+        self.shared_memory.unlink()
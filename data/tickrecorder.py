@@ -0,0 +1,286 @@
+import array
+import bisect
+import itertools
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+
+"""
+    Append-only columnar tick files. A file starts with FILE_MAGIC and is followed by blocks, each made of a
+    BLOCK_HEADER (tag, payload length) and its payload:
+    - EXCHANGE_TAG: exchange id (uint16) followed by the UTF-8 exchange name, written the first time an exchange is seen
+      in the file.
+    - DATA_TAG: DATA_HEADER (row count, earliest and latest receive time) followed by the columns of the rows: receive
+      times (float64), exchange ids (uint16), sides (uint8, 0 for bids and 1 for asks), level indexes (uint16), prices
+      (float64) and volumes (float64). Every order book snapshot is one row per price level. Snapshots are kept in the
+      order they were recorded, so receive times may go back, e.g. between exchanges.
+    - INDEX_TAG: entry count followed by INDEX_ENTRY (earliest and latest receive time, file offset) of every data
+      block written since the previous index block, so that readers can locate blocks without decoding them.
+"""
+FILE_MAGIC = b"MMTICK01"
+BLOCK_HEADER = struct.Struct("<4sI")
+DATA_HEADER = struct.Struct("<Idd")
+INDEX_ENTRY = struct.Struct("<ddQ")
+EXCHANGE_TAG = b"EXCH"
+DATA_TAG = b"DATA"
+INDEX_TAG = b"INDX"
+BIDS_SIDE = 0
+ASKS_SIDE = 1
+
+# Rows buffered before a data block is written, and the longest time a row waits in the buffer.
+BATCH_ROWS = 4096
+FLUSH_INTERVAL = 1
+INDEX_INTERVAL = 16
+MAX_FILE_SIZE = 256 * 1024 * 1024
+MAX_QUEUED_SNAPSHOTS = 10000
+
+log = logging.getLogger(__name__)
+
+
+class TickRecorder(object):
+    """
+        Streams order book snapshots to tick files from a background thread. record() never blocks: snapshots are
+        queued and dropped (and counted) when the writer falls behind. Files rotate when they exceed the maximum size
+        or when the day changes, and are named {prefix}-{YYYYMMDD}-{sequence}.ticks.
+    """
+    def __init__(self, directory, prefix="ticks", max_file_size=MAX_FILE_SIZE):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_file_size = max_file_size
+        self.snapshots = queue.Queue(MAX_QUEUED_SNAPSHOTS)
+        self.dropped_snapshots = 0
+        self.writer_thread = threading.Thread(target=self.__write_forever, name="tick-recorder", daemon=True)
+        self.writer_thread.start()
+
+    # bids and asks are lists of prices and volumes, best price first. They must not be modified after the call.
+    def record(self, exchange_name, receive_time, bid_prices, bid_volumes, ask_prices, ask_volumes):
+        try:
+            self.snapshots.put_nowait((exchange_name, receive_time, bid_prices, bid_volumes, ask_prices, ask_volumes))
+        except queue.Full:
+            self.dropped_snapshots += 1
+
+    def close(self):
+        self.snapshots.put(None)
+        self.writer_thread.join()
+
+    def __write_forever(self):
+        writer = None
+        try:
+            while True:
+                batch = self.__next_batch()
+                if batch is None:
+                    return
+                if not batch:
+                    continue
+                day = datetime.fromtimestamp(batch[0][1]).strftime("%Y%m%d")
+                if writer is None or writer.day != day or writer.size() > self.max_file_size:
+                    if writer is not None:
+                        writer.close()
+                    writer = TickFileWriter(self.__next_path(day), day)
+                writer.write_snapshots(batch)
+        except Exception as e:
+            log.error("Tick recorder stopped. (Error: {})".format(e))
+        finally:
+            if writer is not None:
+                writer.close()
+
+    # Wait for the first snapshot, then collect more until the batch is full or the flush interval passed.
+    # Return None once the recorder is closed.
+    def __next_batch(self):
+        batch = []
+        rows = 0
+        deadline = None
+        while rows < BATCH_ROWS:
+            try:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                snapshot = self.snapshots.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if snapshot is None:
+                self.snapshots.put(None)
+                return batch or None
+            batch.append(snapshot)
+            rows += len(snapshot[2]) + len(snapshot[4])
+            if deadline is None:
+                deadline = time.monotonic() + FLUSH_INTERVAL
+        return batch
+
+    def __next_path(self, day):
+        os.makedirs(self.directory, exist_ok=True)
+        sequence = 0
+        while True:
+            path = os.path.join(self.directory, "{}-{}-{:03d}.ticks".format(self.prefix, day, sequence))
+            if not os.path.exists(path):
+                return path
+            sequence += 1
+
+
+class TickFileWriter(object):
+    def __init__(self, path, day):
+        self.path = path
+        self.day = day
+        self.file = open(path, "wb")
+        self.file.write(FILE_MAGIC)
+        self.exchange_ids = {}
+        self.unindexed_blocks = []
+
+    def size(self):
+        return self.file.tell()
+
+    def write_snapshots(self, snapshots):
+        receive_times = array.array('d')
+        exchange_ids = array.array('H')
+        sides = array.array('B')
+        levels = array.array('H')
+        prices = array.array('d')
+        volumes = array.array('d')
+
+        for exchange_name, receive_time, bid_prices, bid_volumes, ask_prices, ask_volumes in snapshots:
+            exchange_id = self.__get_exchange_id(exchange_name)
+            for side, side_prices, side_volumes in [(BIDS_SIDE, bid_prices, bid_volumes),
+                                                    (ASKS_SIDE, ask_prices, ask_volumes)]:
+                count = len(side_prices)
+                receive_times.extend([receive_time] * count)
+                exchange_ids.extend([exchange_id] * count)
+                sides.extend([side] * count)
+                levels.extend(range(count))
+                prices.extend(side_prices)
+                volumes.extend(side_volumes)
+
+        if not receive_times:
+            return
+        offset = self.file.tell()
+        first_time = min(snapshot[1] for snapshot in snapshots)
+        last_time = max(snapshot[1] for snapshot in snapshots)
+        columns = b"".join(column.tobytes() for column in [receive_times, exchange_ids, sides, levels, prices, volumes])
+        self.__write_block(DATA_TAG, DATA_HEADER.pack(len(receive_times), first_time, last_time) + columns)
+        self.unindexed_blocks.append((first_time, last_time, offset))
+
+        if len(self.unindexed_blocks) >= INDEX_INTERVAL:
+            self.__write_index()
+        self.file.flush()
+
+    def close(self):
+        if self.unindexed_blocks:
+            self.__write_index()
+        self.file.close()
+
+    def __get_exchange_id(self, exchange_name):
+        exchange_id = self.exchange_ids.get(exchange_name)
+        if exchange_id is None:
+            exchange_id = len(self.exchange_ids)
+            self.exchange_ids[exchange_name] = exchange_id
+            self.__write_block(EXCHANGE_TAG, struct.pack("<H", exchange_id) + exchange_name.encode('utf-8'))
+        return exchange_id
+
+    def __write_index(self):
+        entries = b"".join(INDEX_ENTRY.pack(*block) for block in self.unindexed_blocks)
+        self.__write_block(INDEX_TAG, struct.pack("<I", len(self.unindexed_blocks)) + entries)
+        self.unindexed_blocks = []
+
+    def __write_block(self, tag, payload):
+        self.file.write(BLOCK_HEADER.pack(tag, len(payload)))
+        self.file.write(payload)
+
+
+class TickReader(object):
+    """
+        Memory-maps a tick file and locates its data blocks by receive time. Only block headers and index blocks are
+        read when the file is opened; row data is decoded when it is iterated. A block cut short by a crash is ignored.
+        Receive times are not ordered across blocks: range reads bisect the running maximum of the blocks' latest
+        receive times, and the running minimum from the end of their earliest ones.
+    """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError("Not a tick file: {}".format(path))
+        self.exchange_names = {}
+        # (earliest receive time, latest receive time, offset) of every data block, in file order.
+        self.blocks = []
+        self.__scan()
+        self.block_end_bounds = list(itertools.accumulate((block[1] for block in self.blocks), max))
+        self.block_start_bounds = list(itertools.accumulate((block[0] for block in reversed(self.blocks)), min))[::-1]
+
+    def __scan(self):
+        indexed_offsets = set()
+        offset = len(FILE_MAGIC)
+        while offset + BLOCK_HEADER.size <= len(self.map):
+            tag, length = BLOCK_HEADER.unpack_from(self.map, offset)
+            payload_offset = offset + BLOCK_HEADER.size
+            if payload_offset + length > len(self.map):
+                break
+            if tag == EXCHANGE_TAG:
+                exchange_id = struct.unpack_from("<H", self.map, payload_offset)[0]
+                name = self.map[payload_offset + 2:payload_offset + length].decode('utf-8')
+                self.exchange_names[exchange_id] = name
+            elif tag == INDEX_TAG:
+                count = struct.unpack_from("<I", self.map, payload_offset)[0]
+                for index in range(count):
+                    entry = INDEX_ENTRY.unpack_from(self.map, payload_offset + 4 + index * INDEX_ENTRY.size)
+                    indexed_offsets.add(entry[2])
+                    self.blocks.append(entry)
+            elif tag == DATA_TAG:
+                # Data blocks after the last index block are located from their own header.
+                self.blocks.append((None, None, offset))
+            offset = payload_offset + length
+
+        self.blocks = [self.__complete_block(block) for block in self.blocks
+                       if block[0] is not None or block[2] not in indexed_offsets]
+        self.blocks.sort(key=lambda block: block[2])
+
+    def __complete_block(self, block):
+        if block[0] is not None:
+            return block
+        row_count, first_time, last_time = DATA_HEADER.unpack_from(self.map, block[2] + BLOCK_HEADER.size)
+        return first_time, last_time, block[2]
+
+    """
+        Yield every snapshot received between start_time and end_time (epoch seconds, both optional) as
+        (exchange name, receive time, bids, asks), in the order they were recorded, where bids and asks are
+        [price, volume] lists from the best price. Blocks entirely out of the range are skipped without being read.
+    """
+    def read(self, start_time=None, end_time=None):
+        first_block = 0 if start_time is None else bisect.bisect_left(self.block_end_bounds, start_time)
+        end_block = len(self.blocks) if end_time is None else bisect.bisect_right(self.block_start_bounds, end_time)
+        for first_time, last_time, offset in self.blocks[first_block:end_block]:
+            if (start_time is not None and last_time < start_time) or (end_time is not None and first_time > end_time):
+                continue
+            for snapshot in self.__read_block(offset):
+                if (start_time is not None and snapshot[1] < start_time) or \
+                        (end_time is not None and snapshot[1] > end_time):
+                    continue
+                yield snapshot
+
+    def __read_block(self, offset):
+        position = offset + BLOCK_HEADER.size
+        row_count = DATA_HEADER.unpack_from(self.map, position)[0]
+        position += DATA_HEADER.size
+        columns = []
+        for typecode in ['d', 'H', 'B', 'H', 'd', 'd']:
+            column = array.array(typecode)
+            size = row_count * column.itemsize
+            column.frombytes(self.map[position:position + size])
+            columns.append(column)
+            position += size
+        receive_times, exchange_ids, sides, levels, prices, volumes = columns
+
+        row = 0
+        while row < row_count:
+            receive_time = receive_times[row]
+            exchange_id = exchange_ids[row]
+            bids = []
+            asks = []
+            while row < row_count and receive_times[row] == receive_time and exchange_ids[row] == exchange_id:
+                (bids if sides[row] == BIDS_SIDE else asks).append([prices[row], volumes[row]])
+                row += 1
+            yield self.exchange_names[exchange_id], receive_time, bids, asks
+
+    def close(self):
+        self.map.close()
+        self.file.close()
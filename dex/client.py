@@ -1,8 +1,11 @@
-from grapheneexchange import GrapheneExchange
-
-
 class Client(object):
-    def __init__(self, witness_url, account, secret_key, watch_markets=None):
+    # exchange replaces the GrapheneExchange connection, e.g. with a simulator stub.
+    def __init__(self, witness_url, account, secret_key, watch_markets=None, exchange=None):
+        if exchange is not None:
+            self.exchange = exchange
+            return
+        from grapheneexchange import GrapheneExchange
+
         if watch_markets is None:
             watch_markets = ["CNY_BTS", "BTS_CNY"]
 
@@ -1,50 +1,98 @@
+import asyncio
+
 from data import marketmakerexchange
+from data import orderbook
 from dex import client
+from dex import marketfeed
 import logging
 
 log = logging.getLogger(__name__)
 EXCHANGE_NAME = "dex"
 DEX_PROFIT_DEDUCTION = 0.01
+# returnOrderBook answers for every watched market at once when asked for this pair.
+ALL_MARKETS = "all"
 
 
 class DexExchange(marketmakerexchange.MarketMakerExchange):
     def get_profit_deduction(self):
         return DEX_PROFIT_DEDUCTION
 
-    def list_my_orders(self):
-        return self.client.exchange.returnOpenOrders(marketmakerexchange.MARKET)[marketmakerexchange.MARKET]
+    def list_my_orders(self, market=marketmakerexchange.MARKET):
+        orders = self.client.exchange.returnOpenOrders(market)[market]
+        return [marketmakerexchange.OpenOrder(order["orderNumber"],
+                                              marketmakerexchange.BUY_ORDER if order["type"] == "buy"
+                                              else marketmakerexchange.SELL_ORDER,
+                                              float(order["rate"]), float(order["amount"]))
+                for order in orders]
+
+    def cancel_order(self, order_id, market=marketmakerexchange.MARKET):
+        self.client.exchange.cancel(order_id)
+
+    # The client watches every market and its reverse. Its returnOrderBook calls are not hedged: all calls share the
+    # GrapheneExchange websocket, which does not match concurrent calls to their answers. exchange replaces the client's
+    # GrapheneExchange, e.g. by simulator.graphenestub.
+    # With subscribe, the order book fetcher keeps the order books from the market updates pushed by the witness node
+    # instead of polling returnOrderBook.
+    def __init__(self, witness_url, account, secret_key, markets=None, exchange=None, subscribe=False):
+        self.witness_url = witness_url
+        self.subscribe = subscribe
+        self.markets = markets or [marketmakerexchange.MARKET]
+        watch_markets = []
+        for market in self.markets:
+            base, quote = marketmakerexchange.get_market_currencies(market)
+            watch_markets += [quote + marketmakerexchange.MARKET_SEPARATOR + base, market]
+        self.client = client.Client(witness_url, account, secret_key, watch_markets, exchange)
+        self.order_books = {market: orderbook.OrderBook() for market in self.markets}
 
-    def __init__(self, witness_url, account, secret_key):
-        self.client = client.Client(witness_url, account, secret_key)
+    def get_markets(self):
+        return self.markets
 
     def get_maker_account_balance(self):
         balance = self.client.exchange.returnBalances()
-        return {marketmakerexchange.CNY: float(balance["CNY"]),
-                marketmakerexchange.BTS: float(balance["BTS"])}
+        currencies = {currency for market in self.markets
+                      for currency in marketmakerexchange.get_market_currencies(market)}
+        return {currency: float(balance[currency]) for currency in currencies}
 
     def get_exchange_name(self):
         return EXCHANGE_NAME
 
-    def get_top_offers(self):
-        orders = self.client.exchange.returnOrderBook(currencyPair=marketmakerexchange.MARKET)
-        bids = orders[marketmakerexchange.MARKET][marketmakerexchange.BIDS]
-        asks = orders[marketmakerexchange.MARKET][marketmakerexchange.ASKS]
-        return [self.__get_true_orders(bids),
-                self.__get_true_orders(asks)]
+    def get_order_book(self, market=marketmakerexchange.MARKET):
+        return self.__update_order_book(market, self.__return_order_book(market))
+
+    async def get_order_book_async(self, market=marketmakerexchange.MARKET):
+        return (await self.get_order_books_async([market]))[market]
+
+    # Several markets are fetched with a single returnOrderBook call for all watched markets.
+    async def get_order_books_async(self, markets):
+        currency_pair = markets[0] if len(markets) == 1 else ALL_MARKETS
+        orders = await self.__return_order_book_async(currency_pair)
+        return {market: self.__update_order_book(market, orders) for market in markets}
+
+    def get_request_count(self, markets):
+        return 1
 
-    def submit_arbitrage_order(self, order_type, price, volume):
+    def create_market_feed(self, markets):
+        if not self.subscribe:
+            return None
+        return marketfeed.DexMarketFeed(self.witness_url, markets)
+
+    async def __return_order_book_async(self, currency_pair):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.__return_order_book, currency_pair)
+
+    def __return_order_book(self, currency_pair):
+        return self.client.exchange.returnOrderBook(currencyPair=currency_pair)
+
+    def __update_order_book(self, market, orders):
+        order_book = self.order_books[market]
+        order_book.apply_snapshot(orders[market][marketmakerexchange.BIDS], orders[market][marketmakerexchange.ASKS])
+        return order_book
+
+    # The DEX does not return the id of the placed order.
+    def submit_arbitrage_order(self, order_type, price, volume, market=marketmakerexchange.MARKET):
         if order_type == 1:
-            self.client.exchange.buy("BTS_CNY", price, volume)
+            self.client.exchange.buy(market, price, volume)
         elif order_type == 2:
-            self.client.exchange.sell("BTS_CNY", price, volume)
+            self.client.exchange.sell(market, price, volume)
         else:
             log.error("Unrecognized order type: {}".format(order_type))
-
-    @staticmethod
-    def __get_true_orders(orders):
-        vol = 0
-        for order in orders:
-            vol += order[1]
-            if vol > marketmakerexchange.FAKE_ORDER_AMOUNT:
-                return [order[0], vol]
-        return orders[0][:2]
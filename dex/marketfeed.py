@@ -0,0 +1,283 @@
+import itertools
+import json
+import logging
+import threading
+import time
+
+from data import marketmakerexchange
+from data import orderbook
+from data import orderbookstore
+from metrics import metricsregistry
+
+BIDS = marketmakerexchange.BIDS
+ASKS = marketmakerexchange.ASKS
+# Limit orders of each direction fetched from the witness node when a market is synced.
+SNAPSHOT_LIMIT = 300
+# Prices of orders are ratios of integer amounts. They are rounded so that orders at the same price share a level.
+PRICE_DECIMALS = 10
+# Seconds to wait before reconnecting after the connection dropped.
+RECONNECT_DELAY = 1
+# Without any message for this long, the connection is checked with a call. Its answer confirms that the books, to
+# which nothing was pushed meanwhile, are still current.
+KEEPALIVE_INTERVAL = 0.5
+# A call unanswered for one block interval of the witness node drops the connection.
+CALL_TIMEOUT = 3
+LIMIT_ORDER_ID_PREFIX = "1.7."
+log = logging.getLogger(__name__)
+
+
+"""
+    Side, price and volume of a limit_order_object of the witness node, in the market's terms: price in quote
+    currency and volume in base currency shares. Amounts are integers in units of their asset's precision. Return
+    None for an order of another market.
+"""
+def decode_limit_order(order, base_asset, quote_asset):
+    sold = order['sell_price']['base']
+    received = order['sell_price']['quote']
+    for_sale = int(order['for_sale'])
+    base_scale = 10 ** base_asset['precision']
+    quote_scale = 10 ** quote_asset['precision']
+    if sold['asset_id'] == base_asset['id'] and received['asset_id'] == quote_asset['id']:
+        price = (int(received['amount']) / quote_scale) / (int(sold['amount']) / base_scale)
+        return ASKS, round(price, PRICE_DECIMALS), for_sale / base_scale
+    if sold['asset_id'] == quote_asset['id'] and received['asset_id'] == base_asset['id']:
+        price = (int(sold['amount']) / quote_scale) / (int(received['amount']) / base_scale)
+        return BIDS, round(price, PRICE_DECIMALS), for_sale / quote_scale / price
+    return None
+
+
+class LocalBook(object):
+    """
+        Order book of one market kept from individual limit orders. Pushed limit_order_objects carry the full state
+        of the order, so applying one twice, or one already part of the snapshot, is harmless.
+    """
+    def __init__(self, market, base_asset, quote_asset):
+        self.market = market
+        self.base_asset = base_asset
+        self.quote_asset = quote_asset
+        # {order id: (side, price, volume)}
+        self.orders = {}
+        self.order_book = orderbook.OrderBook()
+        self.sides = {BIDS: self.order_book.bids, ASKS: self.order_book.asks}
+        # {(side, price): total volume of the orders at the price}
+        self.level_volumes = {}
+
+    def reset(self, orders):
+        self.orders = {}
+        self.level_volumes = {}
+        self.order_book = orderbook.OrderBook()
+        self.sides = {BIDS: self.order_book.bids, ASKS: self.order_book.asks}
+        for order in orders:
+            self.apply_order(order)
+
+    # Return True if the order belongs to the market.
+    def apply_order(self, order):
+        decoded_order = decode_limit_order(order, self.base_asset, self.quote_asset)
+        if decoded_order is None:
+            return False
+        self.remove_order(order['id'])
+        self.orders[order['id']] = decoded_order
+        self.__add_volume(*decoded_order)
+        return True
+
+    # Return True if the order was in the book.
+    def remove_order(self, order_id):
+        decoded_order = self.orders.pop(order_id, None)
+        if decoded_order is None:
+            return False
+        side, price, volume = decoded_order
+        self.__add_volume(side, price, -volume)
+        return True
+
+    # The witness node matches crossing orders at once, so a crossed book missed some notices.
+    def is_crossed(self):
+        bids = self.order_book.bids
+        asks = self.order_book.asks
+        return bool(bids.prices) and bool(asks.prices) and bids.prices[0] >= asks.prices[0]
+
+    def get_levels(self, depth=orderbookstore.ORDER_BOOK_DEPTH):
+        return self.order_book.bids.levels(depth), self.order_book.asks.levels(depth)
+
+    def __add_volume(self, side, price, volume):
+        key = (side, price)
+        level_volume = self.level_volumes.get(key, 0) + volume
+        # Volumes below a satoshi are rounding errors of removed orders.
+        if level_volume * 10 ** self.base_asset['precision'] < 1:
+            self.level_volumes.pop(key, None)
+            level_volume = 0
+        else:
+            self.level_volumes[key] = level_volume
+        self.sides[side].update(price, level_volume)
+
+
+class DexMarketFeed(object):
+    """
+        Order books of DEX markets kept from the market updates pushed by the witness node over its websocket, instead
+        of polling returnOrderBook. Each market is subscribed to with subscribe_to_market, then synced from a snapshot
+        of its limit orders; pushed orders are applied on top as they arrive.
+        The feed runs in a thread of its own and calls on_update(market, bids, asks, receive_time) with the best levels
+        of every market changed by a notice, receive_time being the time.perf_counter() of its reception. Markets are
+        synced again after a reconnection, or when a crossed book shows that notices were missed.
+        Quiet connections are checked every KEEPALIVE_INTERVAL; get_last_receive_time() tells until when the books are
+        known to be current, and the feed counts as out of sync once that is more than CALL_TIMEOUT ago.
+        connect(url) opens the websocket, websocket.create_connection by default.
+    """
+    def __init__(self, witness_url, markets, depth=orderbookstore.ORDER_BOOK_DEPTH, connect=None,
+                 reconnect_delay=RECONNECT_DELAY):
+        self.witness_url = witness_url
+        self.markets = markets
+        self.depth = depth
+        self.connect = connect
+        self.reconnect_delay = reconnect_delay
+        self.on_update = None
+        self.connection = None
+        self.call_ids = itertools.count(1)
+        # Notices received while waiting for the answer of a call, applied after it.
+        self.pending_notices = []
+        # {callback id: local book of the market}
+        self.books = {}
+        self.synced = threading.Event()
+        # time.time() of the last message received from the witness node.
+        self.last_receive_time = 0
+        # Errors raised by the connection's recv when nothing was received within its timeout.
+        self.timeout_errors = (TimeoutError,)
+        self.running = False
+        self.thread = None
+
+    def start(self, on_update):
+        self.on_update = on_update
+        self.running = True
+        self.thread = threading.Thread(target=self.run_forever, name="dex-market-feed", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.synced.clear()
+        if self.connection is not None:
+            self.connection.close()
+
+    # True while every market is synced and the connection answers.
+    def is_synced(self):
+        return self.synced.is_set() and time.time() - self.last_receive_time <= KEEPALIVE_INTERVAL + CALL_TIMEOUT
+
+    def get_last_receive_time(self):
+        return self.last_receive_time
+
+    def run_forever(self):
+        while self.running:
+            try:
+                self.sync()
+                while self.running:
+                    self.receive()
+            except Exception as e:
+                self.synced.clear()
+                if not self.running:
+                    break
+                metricsregistry.registry.increment("dex.feed.reconnect")
+                log.warning("DEX market feed disconnected, reconnecting in {} s. (Error: {})"
+                            .format(self.reconnect_delay, e))
+                if self.connection is not None:
+                    self.connection.close()
+                    self.connection = None
+                time.sleep(self.reconnect_delay)
+
+    # Open a new connection, subscribe to every market, then sync their books from snapshots.
+    def sync(self):
+        self.synced.clear()
+        self.pending_notices = []
+        self.connection = self.__open_connection()
+        symbols = sorted({currency for market in self.markets
+                          for currency in marketmakerexchange.get_market_currencies(market)})
+        assets = {asset['symbol']: asset for asset in self.call("lookup_asset_symbols", [symbols])}
+        self.books = {}
+        for callback_id, market in enumerate(self.markets):
+            base, quote = marketmakerexchange.get_market_currencies(market)
+            self.books[callback_id] = LocalBook(market, assets[base], assets[quote])
+            self.call("subscribe_to_market", [callback_id, assets[base]['id'], assets[quote]['id']])
+        for book in self.books.values():
+            self.resync(book)
+        self.synced.set()
+        self.__apply_pending_notices()
+
+    # Replace the book with a snapshot of the market's limit orders. Notices received so far are older than it.
+    def resync(self, book):
+        metricsregistry.registry.increment("dex.feed.resync")
+        self.pending_notices = [(message, receive_time) for message, receive_time in self.pending_notices
+                                if self.books.get(message['params'][0]) is not book]
+        receive_time = time.perf_counter()
+        book.reset(self.call("get_limit_orders", [book.base_asset['id'], book.quote_asset['id'], SNAPSHOT_LIMIT]))
+        self.__publish(book, receive_time)
+
+    def receive(self):
+        message = self.__receive_message()
+        if message is None:
+            # Nothing was pushed for a while. A failing call drops the connection.
+            self.call("get_dynamic_global_properties", [])
+        elif message.get('method') == 'notice':
+            self.pending_notices.append((message, time.perf_counter()))
+        self.__apply_pending_notices()
+
+    # Send a database API call and wait for its answer, keeping the notices received meanwhile.
+    def call(self, method, params):
+        call_id = next(self.call_ids)
+        deadline = time.monotonic() + CALL_TIMEOUT
+        self.connection.send(json.dumps({'id': call_id, 'method': 'call', 'params': ['database', method, params]}))
+        while True:
+            message = self.__receive_message()
+            if message is None:
+                if time.monotonic() < deadline:
+                    continue
+                raise TimeoutError("No answer to {} from the witness node.".format(method))
+            if message.get('method') == 'notice':
+                self.pending_notices.append((message, time.perf_counter()))
+            elif message.get('id') == call_id:
+                if 'error' in message:
+                    raise RuntimeError("Call to {} failed: {}".format(method, message['error']))
+                return message['result']
+
+    def __open_connection(self):
+        if self.connect is None:
+            import websocket
+            self.timeout_errors = (TimeoutError, websocket.WebSocketTimeoutException)
+            return websocket.create_connection(self.witness_url, timeout=KEEPALIVE_INTERVAL)
+        return self.connect(self.witness_url)
+
+    # Return the next message, or None if nothing was received within the connection's timeout.
+    def __receive_message(self):
+        try:
+            message = json.loads(self.connection.recv())
+        except self.timeout_errors:
+            return None
+        self.last_receive_time = time.time()
+        return message
+
+    """
+        Notices are {"method": "notice", "params": [callback id, [[update, ...]]]}. An update is a limit_order_object
+        for a new or changed order, the id of a removed order, or a fill operation, whose effect on the order is
+        pushed as one of the former.
+    """
+    def __apply_pending_notices(self):
+        pending_notices, self.pending_notices = self.pending_notices, []
+        changed_books = {}
+        for message, receive_time in pending_notices:
+            callback_id, updates = message['params']
+            book = self.books.get(callback_id)
+            if book is None:
+                continue
+            for update in itertools.chain.from_iterable(updates):
+                if isinstance(update, dict) and 'sell_price' in update:
+                    book.apply_order(update)
+                elif isinstance(update, str) and update.startswith(LIMIT_ORDER_ID_PREFIX):
+                    book.remove_order(update)
+            changed_books.setdefault(callback_id, receive_time)
+        for callback_id, receive_time in changed_books.items():
+            book = self.books[callback_id]
+            if book.is_crossed():
+                log.warning("DEX order book of {} is crossed, resyncing.".format(book.market))
+                self.resync(book)
+            else:
+                self.__publish(book, receive_time)
+
+    def __publish(self, book, receive_time):
+        bids, asks = book.get_levels(self.depth)
+        self.on_update(book.market, bids, asks, receive_time)
@@ -10,6 +10,12 @@ class UpdateOrderBookFailureException(Exception):
         super(UpdateOrderBookFailureException, self).__init__(message)
 
 
+# The exchange refused to return the order book because of its request rate limit.
+class RateLimitException(UpdateOrderBookFailureException):
+    def __init__(self, message):
+        super(RateLimitException, self).__init__(message)
+
+
 # Exception when failed to retrieve balance from exchange accounts.
 class RetrieveBalanceFailureException(Exception):
     def __init__(self, message):
@@ -1,10 +1,12 @@
-from marketmaker import MarketMaker
 import logging
 
+from metrics import startuptimer
+
 log = logging.getLogger(__name__)
 
 
 def main():
+    startup_timer = startuptimer.StartupTimer()
     # Initialize logger
     log_format = '%(asctime)s - [%(levelname)s] %(name)s: %(message)s'
     logging.basicConfig(level=logging.INFO, format=log_format)
@@ -14,7 +16,10 @@ def main():
     scheduler_log.setLevel(logging.ERROR)
 
     log.info("Initiating Market Maker...")
-    maker = MarketMaker()
+    # Imported here so that the startup report includes it.
+    with startup_timer.phase("import"):
+        from marketmaker import MarketMaker
+    maker = MarketMaker(startup_timer=startup_timer)
 
     log.info("Market Maker engaged!")
 
@@ -1,25 +1,41 @@
+import asyncio
 import concurrent.futures
 import json
 import logging
-import math
 import multiprocessing
-import operator
+import queue
+import signal
+import threading
 import time
 import traceback
 from datetime import datetime
 
-from apscheduler.schedulers.background import BackgroundScheduler
-
-from btc38 import btc38exchange
+from data import arbitragegraph
+from data import arbitragesizer
 from data import marketmakerexchange
-from dex import dexexchange
-from notifications import emailsender
+from data import opportunitymatrix
+from data import orderbook
+from data import orderbookstore
+from data import tickrecorder
+from metrics import metricsregistry
+from metrics import startuptimer
+from network import pollingscheduler
+from trading import balanceledger
+from trading import legrecovery
+from trading import ordergateway
+from trading import ordertracker
+from trading import riskengine
+from trading import rounding
 
 CNY_CURRENCY_CODE = marketmakerexchange.CNY
 BTS_CURRENCY_CODE = marketmakerexchange.BTS
+MARKET = marketmakerexchange.MARKET
 BIDS = marketmakerexchange.BIDS
 ASKS = marketmakerexchange.ASKS
-UPDATE_TIME = "updateTime"
+UPDATE_TIME = orderbookstore.UPDATE_TIME
+# Exchange names, also used as client names in configurations/config.json.
+BTC38_EXCHANGE_NAME = "btc38"
+DEX_EXCHANGE_NAME = "dex"
 
 PROFIT_THRESHOLD = 0.00
 
@@ -29,293 +45,707 @@ MIN_LISTING_VOLUME_BUFFER = 500
 
 ACCOUNT_CNY_RESERVE = 50
 ACCOUNT_BTS_RESERVE = 100
+# Balance left untouched on every account, by currency. Other currencies have no reserve.
+ACCOUNT_RESERVES = {CNY_CURRENCY_CODE: ACCOUNT_CNY_RESERVE, BTS_CURRENCY_CODE: ACCOUNT_BTS_RESERVE}
+# Decimal places of order prices, by quote currency.
+PRICE_DECIMALS = {CNY_CURRENCY_CODE: 4}
+DEFAULT_PRICE_DECIMALS = 8
+
+# Arbitrage cycles through three currencies or more are searched once this many markets are traded. Cycles are only
+# logged unless TRADE_CYCLES is set; two-leg cycles are the direct arbitrages already traded.
+MIN_CYCLE_MARKETS = 3
+MIN_CYCLE_LEGS = 3
+TRADE_CYCLES = False
 
 EXCHANGE_SYNC_TOLERANCE = 2
 UPDATE_LAG_TOLERANCE = 10
 # Order book information is valid for 1 second.
 ORDER_BOOK_VALID_WINDOW = 1
+# Quiet order books are still fetched twice per validity window, so that they stay valid between fetches.
+MAX_POLL_INTERVAL = ORDER_BOOK_VALID_WINDOW / 2
+# Latency histograms of the speculator and fetcher processes are dumped to these files every minute.
+SPECULATOR_METRICS_FILE = "logs/metrics-speculator.json"
+FETCHER_METRICS_FILE = "logs/metrics-fetcher.json"
+# Every decision of the pre-trade risk engine is appended to this file.
+RISK_AUDIT_FILE = "logs/risk-audit.log"
+# Optional holdings the risk engine measures inventory changes from, {exchange name: {currency: amount}}. Without
+# it, the balances of the first reconciliation are used.
+RISK_BASELINE_FILE = "configurations/risk_baseline.json"
+# Every fetched order book snapshot is recorded into tick files in this directory.
+TICK_DIRECTORY = "ticks"
+# Order book requests per second allowed on each exchange, by exchange name.
+REQUESTS_PER_SECOND = {BTC38_EXCHANGE_NAME: 3, DEX_EXCHANGE_NAME: 5}
+# Wake up the speculator at least this often even without order book updates, to check the fetchers are alive.
+UPDATE_WAIT_TIMEOUT = 1
 
 # logger
 log = logging.getLogger(__name__)
 
 
 class TradeExchange(object):
+    """
+        Only the adapters of the configured clients are imported. Clients are imported and connected in parallel, the
+        DEX client's websocket connection being the slowest. Exchanges keep the order of the configuration.
+    """
     def __init__(self):
         with open("configurations/config.json") as client_config:
             config = json.load(client_config)
 
-        self.exchanges = {}
-
-        for exchange_client in config:
-            if exchange_client['client'] == dexexchange.EXCHANGE_NAME:
-                dex_exchange = dexexchange.DexExchange(exchange_client['WITNESS_URL'],
-                                                       exchange_client['ACCOUNT'],
-                                                       exchange_client['SECRET_KEY'])
-                self.exchanges[dex_exchange.get_exchange_name()] = dex_exchange
-            if exchange_client['client'] == btc38exchange.EXCHANGE_NAME:
-                btc38_exchange = btc38exchange.BTC38Exchange(exchange_client['ACCESS_KEY'],
-                                                             exchange_client['SECRET_KEY'],
-                                                             exchange_client['ACCOUNT_ID'])
-                self.exchanges[btc38_exchange.get_exchange_name()] = btc38_exchange
-
-
-# Daemon to update order books. Each exchange requires one daemon. Daemon should not terminate in any cases.
-def order_book_fetcher_daemon(exchange, order_book):
+        exchange_clients = [exchange_client for exchange_client in config
+                            if exchange_client['client'] in EXCHANGE_FACTORIES]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(exchange_clients)),
+                                                   thread_name_prefix="exchange-connect") as executor:
+            futures = [executor.submit(EXCHANGE_FACTORIES[exchange_client['client']], exchange_client)
+                       for exchange_client in exchange_clients]
+            exchanges = [future.result() for future in futures]
+        self.exchanges = {exchange.get_exchange_name(): exchange for exchange in exchanges}
+
+
+"""
+    Every client trades the markets listed in its optional MARKETS entry, the default market otherwise.
+    HEDGE_REQUESTS applies to btc38 only: the DEX client has a single websocket, which cannot carry a hedge.
+"""
+def create_dex_exchange(exchange_client):
+    from dex import dexexchange
+    return dexexchange.DexExchange(exchange_client['WITNESS_URL'],
+                                   exchange_client['ACCOUNT'],
+                                   exchange_client['SECRET_KEY'],
+                                   exchange_client.get('MARKETS'),
+                                   subscribe=exchange_client.get('SUBSCRIBE', False))
+
+
+def create_btc38_exchange(exchange_client):
+    from btc38 import btc38exchange
+    return btc38exchange.BTC38Exchange(exchange_client['ACCESS_KEY'],
+                                       exchange_client['SECRET_KEY'],
+                                       exchange_client['ACCOUNT_ID'],
+                                       hedge_requests=exchange_client.get('HEDGE_REQUESTS', False),
+                                       markets=exchange_client.get('MARKETS'))
+
+
+EXCHANGE_FACTORIES = {DEX_EXCHANGE_NAME: create_dex_exchange, BTC38_EXCHANGE_NAME: create_btc38_exchange}
+
+
+# Daemon to update order books. A single daemon polls every exchange in one event loop, so that all exchanges and
+# markets share one process and their keep-alive connections. Exchanges with a market feed are subscribed to instead.
+# Daemon should not terminate in any cases.
+def order_book_fetcher_daemon(exchanges, order_book_stores, update_queue):
+    metricsregistry.reset().start_dumping(FETCHER_METRICS_FILE)
+    tick_recorder = tickrecorder.TickRecorder(TICK_DIRECTORY)
+
+    async def fetch_all():
+        fetchers = []
+        for exchange in exchanges:
+            markets = [market for market in exchange.get_markets() if market in order_book_stores]
+            feed = exchange.create_market_feed(markets)
+            if feed is None:
+                fetchers.append(order_book_fetcher(exchange, markets, order_book_stores, update_queue,
+                                                   tick_recorder))
+            else:
+                fetchers.append(order_book_subscriber(exchange, feed, order_book_stores, update_queue,
+                                                      tick_recorder))
+        await asyncio.gather(*fetchers)
+    asyncio.run(fetch_all())
+
+
+"""
+    Write the order book of the exchange's market to its store and record it. If its top of book changed since the
+    last write, push the market, exchange name and update time to the update queue to wake up the speculator.
+    Return True in that case.
+"""
+def publish_order_book(exchange_name, market, order_book, update_time, order_book_stores, update_queue,
+                       tick_recorder, last_top_offers):
+    order_book_stores[market].write(exchange_name, order_book, update_time)
+    # The order book is updated in place by the next fetch, so the recorder gets copies of its levels.
+    tick_recorder.record(marketmakerexchange.get_book_name(exchange_name, market), update_time,
+                         order_book.bids.prices[:], order_book.bids.volumes[:],
+                         order_book.asks.prices[:], order_book.asks.volumes[:])
+    top_offers = order_book.top_offers()
+    if top_offers == last_top_offers.get(market):
+        return False
+    update_queue.put((market, exchange_name, update_time))
+    last_top_offers[market] = top_offers
+    return True
+
+
+"""
+    Each fetch gets the order books of all the exchange's markets with a store, batched when the exchange allows it.
+    The polling scheduler paces the fetches of each exchange, so the markets of an exchange share its request budget.
+"""
+async def order_book_fetcher(exchange, markets, order_book_stores, update_queue, tick_recorder):
+    exchange_name = exchange.get_exchange_name()
+    request_count = exchange.get_request_count(markets)
+    scheduler = pollingscheduler.PollingScheduler(
+        REQUESTS_PER_SECOND.get(exchange_name, pollingscheduler.DEFAULT_REQUESTS_PER_SECOND),
+        max_interval=MAX_POLL_INTERVAL)
+    last_update_time = time.time()
+    last_top_offers = {}
     while True:
-        exchange_name = exchange.get_exchange_name()
-        # Multiprocessing manager cannot update nested items in the dictionary, therefore, I have to create a copy of
-        # the nested dictionary, update it, and then put it back into the main dictionary.
-        exchange_order_book = order_book[exchange_name]
-        time_since_last_update = 0
-
+        delay = scheduler.next_delay()
+        metricsregistry.registry.record("fetch.delay." + exchange_name, delay)
+        await asyncio.sleep(delay)
+        scheduler.on_request(request_count)
         try:
-            top_offers = exchange.get_top_offers()
-
-            current_time = datetime.now()
-            time_since_last_update = (current_time - exchange_order_book[UPDATE_TIME]).total_seconds()
-            exchange_order_book[BIDS] = top_offers[0]
-            exchange_order_book[ASKS] = top_offers[1]
-            exchange_order_book[UPDATE_TIME] = current_time
-            order_book[exchange_name] = exchange_order_book
-
-            time.sleep(0.3)
+            fetch_start = time.perf_counter()
+            order_books = await exchange.get_order_books_async(markets)
+            round_trip_time = time.perf_counter() - fetch_start
+            metricsregistry.registry.record("fetch." + exchange_name, round_trip_time)
+
+            last_update_time = time.time()
+            top_of_book_changed = False
+            for market, order_book in order_books.items():
+                top_of_book_changed |= publish_order_book(exchange_name, market, order_book, last_update_time,
+                                                          order_book_stores, update_queue, tick_recorder,
+                                                          last_top_offers)
+            scheduler.on_success(round_trip_time, top_of_book_changed)
         except Exception as e:
+            scheduler.on_failure(e)
+            time_since_last_update = time.time() - last_update_time
             if time_since_last_update > UPDATE_LAG_TOLERANCE:
                 log.warning("Exchange: {} receives no update for {} seconds. (Last error: {})"
                             .format(exchange_name, time_since_last_update, e))
 
 
-def round_up(value, decimal=0):
-    return math.ceil(value * (10 ** decimal)) / (10 ** decimal)
+"""
+    Push counterpart of order_book_fetcher. The feed keeps the order books from the exchange's pushed updates in a
+    thread of its own, and every update is written to the store as soon as it is received; fetch.<exchange> is the
+    time from its reception to the write. A quiet market pushes nothing, so while the feed is in sync, its unchanged
+    books are written again at the exchange's polling rate, with the time of the feed's last message: the books are
+    known current as of then, and a stalled connection lets them age. Once the feed falls out of sync, the books age
+    until it resyncs.
+"""
+async def order_book_subscriber(exchange, feed, order_book_stores, update_queue, tick_recorder):
+    exchange_name = exchange.get_exchange_name()
+    refresh_interval = 1 / REQUESTS_PER_SECOND.get(exchange_name, pollingscheduler.DEFAULT_REQUESTS_PER_SECOND)
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+    feed.start(lambda *update: loop.call_soon_threadsafe(updates.put_nowait, update))
+    order_books = {market: orderbook.OrderBook() for market in feed.markets}
+    # Time of the last write of every market received from the feed.
+    write_times = {}
+    last_update_time = time.time()
+    last_top_offers = {}
+    while True:
+        try:
+            update = await asyncio.wait_for(updates.get(), refresh_interval)
+        except asyncio.TimeoutError:
+            update = None
+        current_time = time.time()
+        try:
+            if update is not None:
+                market, bids, asks, receive_time = update
+                receive_lag = time.perf_counter() - receive_time
+                order_books[market].apply_snapshot(bids, asks)
+                publish_order_book(exchange_name, market, order_books[market], current_time - receive_lag,
+                                   order_book_stores, update_queue, tick_recorder, last_top_offers)
+                metricsregistry.registry.record("fetch." + exchange_name, receive_lag)
+                write_times[market] = current_time - receive_lag
+                last_update_time = current_time
+            if feed.is_synced():
+                confirmed_time = feed.get_last_receive_time()
+                for market, write_time in write_times.items():
+                    if confirmed_time - write_time >= refresh_interval:
+                        publish_order_book(exchange_name, market, order_books[market], confirmed_time,
+                                           order_book_stores, update_queue, tick_recorder, last_top_offers)
+                        write_times[market] = confirmed_time
+                last_update_time = current_time
+            elif current_time - last_update_time > UPDATE_LAG_TOLERANCE:
+                log.warning("Exchange: {} receives no update for {} seconds. (Market feed out of sync)"
+                            .format(exchange_name, current_time - last_update_time))
+                last_update_time = current_time
+        except Exception as e:
+            log.error("Failed to publish {} order books. (Error: {})".format(exchange_name, e))
+
+
+# Notification worker of the process, created with the email configuration on first use. The email modules are only
+# imported then, off the startup path.
+notification_worker = None
+notification_worker_lock = threading.Lock()
 
 
-def round_down(value, decimal=0):
-    return math.floor(value * (10 ** decimal)) / (10 ** decimal)
+def get_notification_worker():
+    global notification_worker
+    with notification_worker_lock:
+        if notification_worker is None:
+            from notifications import emailsender
+            from notifications import notificationworker
+            with open("configurations/email_header.json") as email_header:
+                header = json.load(email_header)
+            with open("configurations/email_credential.json") as email_credential:
+                credential = json.load(email_credential)
+
+            email_sender = emailsender.EmailSender(credential["login"], credential["password"])
+            notification_worker = notificationworker.NotificationWorker(email_sender, header["subject"],
+                                                                        header["from"], header["to"])
+        return notification_worker
 
 
 # Send notification email using the template.
 def send_notification_email(message):
-    with open("configurations/email_header.json") as email_header:
-        header = json.load(email_header)
-    with open("configurations/email_credential.json") as email_credential:
-        credential = json.load(email_credential)
+    get_notification_worker().notify(message)
 
-    email_sender = emailsender.EmailSender(credential["login"], credential["password"])
-    email_process = multiprocessing.Process(target=email_sender.send_email_with_message,
-                                            args=(message, header["subject"], header["from"], header["to"]))
-    email_process.start()
 
+def load_risk_baseline():
+    try:
+        with open(RISK_BASELINE_FILE) as risk_baseline:
+            return json.load(risk_baseline)
+    except FileNotFoundError:
+        return None
 
-class MarketMaker(object):
-    def __init__(self):
-        trade_exchanges = TradeExchange()
-        self.exchanges_dict = trade_exchanges.exchanges
 
-        self.account_balance = {exchange_name: {CNY_CURRENCY_CODE: 0, BTS_CURRENCY_CODE: 0} for
-                                exchange_name, exchange in self.exchanges_dict.items()}
-        current_time = datetime.now()
-        manager = multiprocessing.Manager()
-        self.order_book = manager.dict({exchange_name: {BIDS: [0, 0], ASKS: [0, 0], UPDATE_TIME: current_time} for
-                                        exchange_name, exchange in self.exchanges_dict.items()})
+class MarketState(object):
+    """
+        Speculation state of one market: its order book store, the snapshot and top of book of the last pass, its
+        opportunity matrix and the last transaction time of each exchange in the market.
+    """
+    def __init__(self, market, exchanges_dict, order_book_store, current_time):
+        self.market = market
+        self.base, self.quote = marketmakerexchange.get_market_currencies(market)
+        # Exchanges trading the market.
+        self.exchanges_dict = exchanges_dict
+        self.order_book_store = order_book_store
+        # Snapshot of the order book store, refreshed once per speculation pass.
+        self.order_book = order_book_store.snapshot()
+        # [price, volume] of the first true order on each side, past the fake orders, for the same pass.
+        self.top_of_book = self.get_top_of_book()
+        self.opportunity_matrix = opportunitymatrix.OpportunityMatrix(
+            {exchange_name: exchange.get_profit_deduction() for exchange_name, exchange in exchanges_dict.items()})
+        self.last_transaction_time = {exchange_name: current_time for exchange_name in exchanges_dict}
+
+    def get_top_of_book(self):
+        return {exchange_name: {BIDS: order_book[BIDS].top_offer(), ASKS: order_book[ASKS].top_offer()}
+                for exchange_name, order_book in self.order_book.items()}
 
-        self.last_transaction_time = {exchange_name: current_time for
-                                      exchange_name, exchange in self.exchanges_dict.items()}
 
-        # Check balance only when transactions were made.
-        self.need_balance_check = True
+class MarketMaker(object):
+    """
+        The exchanges come from configurations/config.json unless given. The order book stores ({market: store}), the
+        clock and the notification function can be replaced, for example by the backtest replay engine.
+        All markets of the exchanges are traded unless markets is given. Each market has its own state and is only
+        speculated on when its order books changed; balances, order tracking and order submission are shared.
+        The startup phases are timed by startup_timer, and reported after the first speculation pass of run().
+    """
+    def __init__(self, exchanges_dict=None, order_book_stores=None, clock=datetime.now,
+                 notify=send_notification_email, markets=None, startup_timer=None):
+        self.startup_timer = startup_timer or startuptimer.StartupTimer()
+        if exchanges_dict is None:
+            with self.startup_timer.phase("exchanges"):
+                exchanges_dict = TradeExchange().exchanges
+        self.exchanges_dict = exchanges_dict
+        self.clock = clock
+        self.notify = notify
+
+        self.profit_threshold = PROFIT_THRESHOLD
+        self.minimum_purchase_volume = MINIMUM_PURCHASE_VOLUME
+        self.min_listing_volume_buffer = MIN_LISTING_VOLUME_BUFFER
+        self.trade_cycles = TRADE_CYCLES
+
+        # Balances are updated locally when orders are placed, and reconciled with the exchanges in the background.
+        # The risk engine measures inventory from the reconciled balances.
+        self.balance_ledger = balanceledger.BalanceLedger(
+            self.exchanges_dict, on_reconciled=lambda balances: self.risk_engine.rebase(balances))
+        exchange_markets = {exchange_name: exchange.get_markets()
+                            for exchange_name, exchange in self.exchanges_dict.items()}
+        if markets is None:
+            markets = []
+            for exchange_market_list in exchange_markets.values():
+                markets += [market for market in exchange_market_list if market not in markets]
+        if order_book_stores is None:
+            with self.startup_timer.phase("order book stores"):
+                order_book_stores = {market: orderbookstore.OrderBookStore(
+                    [exchange_name for exchange_name in self.exchanges_dict
+                     if market in exchange_markets[exchange_name]])
+                    for market in markets}
+        current_time = self.clock()
+        self.markets = {market: MarketState(market,
+                                            {exchange_name: exchange for exchange_name, exchange in
+                                             self.exchanges_dict.items() if market in exchange_markets[exchange_name]},
+                                            order_book_stores[market], current_time)
+                        for market in markets}
+        self.order_book_updates = multiprocessing.Queue()
+        # Top of book of every tradable market, searched for arbitrage cycles across markets.
+        self.arbitrage_graph = None
+        if len(self.markets) >= MIN_CYCLE_MARKETS:
+            self.arbitrage_graph = arbitragegraph.ArbitrageGraph(
+                {exchange_name: exchange.get_profit_deduction() for exchange_name, exchange in exchanges_dict.items()})
+
+        # An arbitrage cycle may have one leg per currency, all submitted at once.
+        currencies = {currency for market in self.markets
+                      for currency in marketmakerexchange.get_market_currencies(market)}
+        with self.startup_timer.phase("order gateway"):
+            self.order_gateway = ordergateway.OrderGateway(self.exchanges_dict.values(),
+                                                           max(2 * len(self.exchanges_dict), len(currencies)))
+        # Every group of order legs is checked against the risk limits before it is submitted.
+        self.risk_engine = riskengine.RiskEngine(
+            clock=lambda: self.clock().timestamp(),
+            on_kill=lambda reason: self.notify("Risk kill switch tripped: {} (Reset with SIGUSR1.)".format(reason)),
+            baseline=load_risk_baseline())
+        # Set by SIGUSR1, and handled by the speculation loop of run().
+        self.risk_reset_requested = threading.Event()
+        # State of the placed orders, polled in the background. Exchanges with open orders are not traded.
+        self.order_tracker = ordertracker.OrderTracker(
+            self.exchanges_dict, clock=lambda: self.clock().timestamp(),
+            markets={exchange_name: [market for market in exchange_market_list if market in self.markets]
+                     for exchange_name, exchange_market_list in exchange_markets.items()})
+        # Arbitrage legs left one-sided are hedged or cancelled in the background.
+        self.leg_recovery = legrecovery.LegRecovery(
+            self.order_gateway, self.order_tracker, self.balance_ledger, self.risk_engine, self.__get_top_of_book,
+            lambda market: PRICE_DECIMALS.get(marketmakerexchange.get_market_currencies(market)[1],
+                                              DEFAULT_PRICE_DECIMALS),
+            self.notify)
 
+    """
+        The fetcher process starts first, so that order books are on their way while the rest starts up. The first
+        balance reconciliation runs in the background; exchanges are not traded until it is done.
+    """
     def run(self):
-        scheduler = BackgroundScheduler()
-        # Update account balance every 5 minutes in case external transfer happened.
-        scheduler.add_job(self.__request_account_balance_checking, 'interval', minutes=5)
-        scheduler.start()
-
-        order_book_fetchers = []
-        for exchange_name, exchange in self.exchanges_dict.items():
-            p = multiprocessing.Process(target=order_book_fetcher_daemon, args=(exchange, self.order_book))
-            p.daemon = True
-            order_book_fetchers.append(p)
-            p.start()
-            log.info("Started updating order book process for exchange: {}, pid: {}"
-                     .format(exchange.get_exchange_name(), p.pid))
-
-        while all(map(multiprocessing.Process.is_alive, order_book_fetchers)):
+        with self.startup_timer.phase("fetcher"):
+            order_book_stores = {market: market_state.order_book_store
+                                 for market, market_state in self.markets.items()}
+            order_book_fetcher = multiprocessing.Process(target=order_book_fetcher_daemon,
+                                                         args=(list(self.exchanges_dict.values()), order_book_stores,
+                                                               self.order_book_updates))
+            order_book_fetcher.daemon = True
+            order_book_fetcher.start()
+        log.info("Started updating order book process for exchanges: {}, markets: {}, pid: {}"
+                 .format(list(self.exchanges_dict.keys()), list(self.markets.keys()), order_book_fetcher.pid))
+
+        with self.startup_timer.phase("balance ledger"):
+            self.balance_ledger.start()
+        with self.startup_timer.phase("order tracker"):
+            self.order_tracker.start()
+        self.leg_recovery.start()
+        with self.startup_timer.phase("scheduler"):
+            from apscheduler.schedulers.background import BackgroundScheduler
+            scheduler = BackgroundScheduler()
+            # Reconcile account balance every 5 minutes in case external transfer happened.
+            scheduler.add_job(self.balance_ledger.request_reconcile, 'interval', minutes=5)
+            scheduler.start()
+        metricsregistry.registry.start_dumping(SPECULATOR_METRICS_FILE)
+        self.risk_engine.audit_log.start(RISK_AUDIT_FILE)
+        # Operators reset the risk engine with `kill -USR1 <pid>` once they checked the accounts. Signals can only be
+        # handled by the main thread, e.g. not when a benchmark runs the market maker in a thread of its own.
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.risk_reset_requested.set())
+
+        while order_book_fetcher.is_alive():
             try:
-                self.__speculate()
-                time.sleep(0.3)
+                if self.risk_reset_requested.is_set():
+                    self.risk_reset_requested.clear()
+                    self.reset_risk_engine()
+                updates = self.__wait_for_order_book_updates()
+                for market, updated_exchanges in updates.items():
+                    self.on_order_book_updates(updated_exchanges, market)
+                if updates and not self.startup_timer.reported:
+                    self.startup_timer.mark("first speculation")
+                    self.startup_timer.report()
             except Exception as e:
                 traceback.print_exc()
                 log.error("Unexpected exception caught in main execution. (Error: {})".format(e))
 
         log.fatal("Order book daemon terminated! Exit the market maker.")
-        send_notification_email("Market Maker terminated!")
-
-    def __speculate(self):
-        if self.need_balance_check:
-            try:
-                self.__update_account_balance()
-            except Exception as e:
-                log.error("Failed to update account balance.(Error: {})".format(e))
-                return
-
-        for buyer_name, buyer_exchange in self.exchanges_dict.items():
-            if self.__is_order_book_valid(buyer_name):
-                profitable_exchange_name = self.__find_profitable_exchange(buyer_exchange)
-                if profitable_exchange_name:
-                    seller_exchange = self.exchanges_dict[profitable_exchange_name]
-
-                    # BTC38 can only accept price with 5 decimal places, and volume up to 6 decimal places.
-                    # Round up the purchase price, and round down the sell price to guarantee profit.
-                    purchase_price = round_up(self.order_book[buyer_name][ASKS][0], 4)
-                    sell_price = round_down(self.order_book[profitable_exchange_name][BIDS][0], 4)
-
-                    purchase_volume = round(self.__calculate_purchase_volume(buyer_exchange, seller_exchange), 6)
-                    sell_volume = round(self.__calculate_sell_volume(buyer_exchange, purchase_volume), 6)
-
-                    if sell_volume < MINIMUM_PURCHASE_VOLUME:
-                        log.info("Under minimum arbitrage volume: {}".format(sell_volume))
-                    else:
-                        log.info("Placing arbitrage order...")
-                        order_placed = self.__place_arbitrage_orders(buyer_exchange, purchase_price, purchase_volume,
-                                                                     seller_exchange, sell_price, sell_volume)
-                        if order_placed:
-                            send_notification_email("Arbitrage: purchase from {} at {}, volume: {}. Total: {}\n"
-                                                    "Arbitrage: sell to {} at {}, volume: {}. Total: {}"
-                                                    .format(buyer_name, purchase_price, purchase_volume,
-                                                            purchase_price * purchase_volume,
-                                                            profitable_exchange_name, sell_price, sell_volume,
-                                                            sell_price * sell_volume))
-                        else:
-                            send_notification_email("Failed to place arbitrage order!")
+        self.close()
+        self.notify("Market Maker terminated!")
+        # Send the pending notifications before the process exits.
+        if notification_worker is not None:
+            notification_worker.close()
+
+    # Run one speculation pass over the pairs of the market involving the updated exchanges.
+    def on_order_book_updates(self, updated_exchanges, market=MARKET):
+        speculation_start = time.perf_counter()
+        self.__speculate(self.markets[market], updated_exchanges)
+        metricsregistry.registry.record("speculation.pass", time.perf_counter() - speculation_start)
+
+    # Clear the kill switch, and measure inventory from the balances of a fresh reconciliation.
+    def reset_risk_engine(self):
+        self.risk_engine.reset()
+        self.balance_ledger.request_reconcile()
+        self.notify("Risk engine reset.")
+
+    def close(self):
+        self.order_gateway.shutdown()
+        self.balance_ledger.shutdown()
+        self.order_tracker.shutdown()
+        self.leg_recovery.shutdown()
+        self.risk_engine.audit_log.close()
+        for market_state in self.markets.values():
+            market_state.order_book_store.close()
+            market_state.order_book_store.unlink()
 
     """
-        Find the highest bidder in the order book. If the profit is higher than the threshold,
-        return profitable exchange name.
+        Block until at least one fetcher reports a changed order book, then drain all pending updates.
+        Return {market: names of the exchanges whose order book of the market changed}.
     """
-    def __find_profitable_exchange(self, buyer_exchange):
-        buyer_name = buyer_exchange.get_exchange_name()
-        target_order_book = {exchange_name: order_book[BIDS][0] for exchange_name, order_book in self.order_book.items()
-                             if self.__is_order_book_valid(exchange_name) and exchange_name != buyer_name}
-
-        if len(target_order_book) == 0:
-            return None
+    def __wait_for_order_book_updates(self):
+        updates = []
+        try:
+            updates.append(self.order_book_updates.get(timeout=UPDATE_WAIT_TIMEOUT))
+            while True:
+                updates.append(self.order_book_updates.get_nowait())
+        except queue.Empty:
+            pass
+
+        # Time between a fetcher writing a changed order book and the speculator picking it up.
+        current_time = time.time()
+        updated_exchanges = {}
+        for market, exchange_name, update_time in updates:
+            metricsregistry.registry.record("speculation.detection", current_time - update_time)
+            updated_exchanges.setdefault(market, set()).add(exchange_name)
+        return updated_exchanges
+
+    # Only pairs involving at least one of the updated exchanges can have a new arbitrage opportunity.
+    def __speculate(self, market_state, updated_exchanges):
+        order_book = market_state.order_book_store.snapshot()
+        # No order book of the market changed since the last pass, so neither did the opportunities.
+        if order_book.version == market_state.order_book.version:
+            return
+        market_state.order_book = order_book
+        market_state.top_of_book = market_state.get_top_of_book()
+        market_state.opportunity_matrix.update(market_state.top_of_book)
+        valid_exchanges = {exchange_name for exchange_name in market_state.exchanges_dict
+                           if self.__is_order_book_valid(market_state, exchange_name) and
+                           self.balance_ledger.is_trading_allowed(exchange_name) and
+                           not self.order_tracker.has_open_orders(exchange_name, market_state.market)}
+        if self.arbitrage_graph is not None:
+            for exchange_name in market_state.exchanges_dict:
+                top_of_book = market_state.top_of_book[exchange_name] if exchange_name in valid_exchanges else {}
+                self.arbitrage_graph.update_book(exchange_name, market_state.market, top_of_book.get(BIDS),
+                                                 top_of_book.get(ASKS))
+
+        # Once an exchange traded, its order book is stale until the next update, so skip its other opportunities.
+        traded_exchanges = set()
+        for opportunity in market_state.opportunity_matrix.find_opportunities(valid_exchanges, updated_exchanges,
+                                                                              self.profit_threshold):
+            buyer_name = opportunity.buyer_name
+            seller_name = opportunity.seller_name
+            if buyer_name in traded_exchanges or seller_name in traded_exchanges:
+                continue
+
+            log.info("Found profitable exchange {} for {} in {}! Profit: {:.2f}%."
+                     .format(seller_name, buyer_name, market_state.market, opportunity.profit * 100))
+            decision_time = self.clock()
+            for exchange_name in [buyer_name, seller_name]:
+                staleness = (decision_time - market_state.order_book[exchange_name][UPDATE_TIME]).total_seconds()
+                metricsregistry.registry.record("speculation.staleness", staleness)
+            buyer_exchange = self.exchanges_dict[buyer_name]
+            seller_exchange = self.exchanges_dict[seller_name]
+
+            plan = self.__size_arbitrage(market_state, buyer_exchange, seller_exchange)
+
+            # BTC38 can only accept price with 5 decimal places, and volume up to 6 decimal places.
+            # Round up the purchase price, and round down the sell price to guarantee profit.
+            price_decimals = PRICE_DECIMALS.get(market_state.quote, DEFAULT_PRICE_DECIMALS)
+            purchase_price = rounding.round_up(plan.purchase_price, price_decimals)
+            sell_price = rounding.round_down(plan.sell_price, price_decimals)
+
+            purchase_volume = round(plan.purchase_volume, 6)
+            sell_volume = round(plan.sell_volume, 6)
+
+            if sell_volume < self.minimum_purchase_volume:
+                log.info("Under minimum arbitrage volume: {}".format(sell_volume))
+            else:
+                log.info("Placing arbitrage order...")
+                traded_exchanges.update([buyer_name, seller_name])
+                order_placed = self.__place_arbitrage_orders(market_state, buyer_exchange, purchase_price,
+                                                             purchase_volume, seller_exchange, sell_price, sell_volume)
+                if order_placed:
+                    self.notify("Arbitrage {}: purchase from {} at {}, volume: {}. Total: {}\n"
+                                "Arbitrage {}: sell to {} at {}, volume: {}. Total: {}"
+                                .format(market_state.market, buyer_name, purchase_price, purchase_volume,
+                                        purchase_price * purchase_volume,
+                                        market_state.market, seller_name, sell_price, sell_volume,
+                                        sell_price * sell_volume))
+                elif order_placed is not None:
+                    self.notify("Failed to place arbitrage order!")
+
+        if self.arbitrage_graph is not None:
+            self.__speculate_cycles(traded_exchanges)
+
+    # Cycles only use the books of valid exchanges, but the books of other markets may have aged since their last pass.
+    def __speculate_cycles(self, traded_exchanges):
+        for cycle in self.arbitrage_graph.find_cycles(self.profit_threshold, MIN_CYCLE_LEGS):
+            exchange_names = {leg.exchange_name for leg in cycle.legs}
+            if exchange_names & traded_exchanges:
+                continue
+            metricsregistry.registry.increment("speculation.cycles")
+            route = ", ".join("{} {} on {} at {}".format("buy" if leg.order_type == marketmakerexchange.BUY_ORDER
+                                                         else "sell", leg.market, leg.exchange_name, leg.price)
+                              for leg in cycle.legs)
+            log.info("Found arbitrage cycle from {}: {}. Profit: {:.2f}%."
+                     .format(cycle.start_currency, route, cycle.profit * 100))
+            if not self.trade_cycles or not all(self.__is_order_book_valid(self.markets[leg.market], leg.exchange_name)
+                                                for leg in cycle.legs):
+                continue
+            scale = self.__size_cycle(cycle)
+            if scale <= 0:
+                log.info("Insufficient fund for arbitrage cycle from {}.".format(cycle.start_currency))
+                continue
+            traded_exchanges.update(exchange_names)
+            order_placed = self.__place_cycle_orders(cycle, scale)
+            if order_placed:
+                self.notify("Arbitrage cycle from {}: {}.".format(cycle.start_currency, route))
+            elif order_placed is not None:
+                self.notify("Failed to place arbitrage cycle orders!")
 
-        best_offer = max(target_order_book.items(), key=operator.itemgetter(1))
-        purchase_price = self.order_book[buyer_name][ASKS][0]
-        profit = (best_offer[1] - purchase_price) / purchase_price
-        if profit - buyer_exchange.get_profit_deduction() > PROFIT_THRESHOLD:
-            log.info("Found profitable exchange {}! Profit: {:.2f}%."
-                     .format(buyer_name, profit * 100))
-            return best_offer[0]
-
-    def __order_books_in_sync(self, base_exchange_name, target_exchange_name):
-        base_ex_update_time = self.order_book[base_exchange_name][UPDATE_TIME]
-        compare_ex_update_time = self.order_book[target_exchange_name][UPDATE_TIME]
+    @staticmethod
+    def __order_books_in_sync(market_state, base_exchange_name, target_exchange_name):
+        base_ex_update_time = market_state.order_book[base_exchange_name][UPDATE_TIME]
+        compare_ex_update_time = market_state.order_book[target_exchange_name][UPDATE_TIME]
         if abs((base_ex_update_time - compare_ex_update_time).total_seconds()) > EXCHANGE_SYNC_TOLERANCE:
             return False
         else:
             return True
 
-    def __is_order_book_valid(self, exchange_name):
-        current_time = datetime.now()
-        last_update_time = self.order_book[exchange_name][UPDATE_TIME]
-        updated_after_transactions = last_update_time > self.last_transaction_time[exchange_name]
+    def __is_order_book_valid(self, market_state, exchange_name):
+        current_time = self.clock()
+        last_update_time = market_state.order_book[exchange_name][UPDATE_TIME]
+        updated_after_transactions = last_update_time > market_state.last_transaction_time[exchange_name]
         order_book_valid = (current_time - last_update_time).total_seconds() < ORDER_BOOK_VALID_WINDOW
         return updated_after_transactions and order_book_valid
 
-    def __request_account_balance_checking(self):
-        self.need_balance_check = True
-
-    def __update_account_balance(self):
-        for exchange_name, exchange in self.exchanges_dict.items():
-            exchange_name = exchange.get_exchange_name()
-            balance = exchange.get_maker_account_balance()
-            self.account_balance[exchange_name][CNY_CURRENCY_CODE] = balance[CNY_CURRENCY_CODE]
-            self.account_balance[exchange_name][BTS_CURRENCY_CODE] = balance[BTS_CURRENCY_CODE]
-
-        log.info("Account balance updated. New account balance: {}".format(self.account_balance))
-        self.need_balance_check = False
-
-    # Price = BTS price in terms of CNY. Volume = number of BTS shares.
-    def __calculate_purchase_volume(self, buyer_exchange, seller_exchange):
+    """
+        Size the arbitrage over the full depth of the buyer's asks and the seller's bids.
+        Price = base currency price in terms of quote currency. Volume = number of base currency shares.
+    """
+    def __size_arbitrage(self, market_state, buyer_exchange, seller_exchange):
         buyer_exchange_name = buyer_exchange.get_exchange_name()
         seller_exchange_name = seller_exchange.get_exchange_name()
 
-        buyer_vol = self.order_book[buyer_exchange_name][ASKS][1]
-        seller_vol = self.order_book[seller_exchange_name][BIDS][1]
-
-        volume_available = min(buyer_vol, seller_vol)
+        usable_quote = (self.balance_ledger.get_balance(buyer_exchange_name).get(market_state.quote, 0) -
+                        ACCOUNT_RESERVES.get(market_state.quote, 0))
+        usable_base = (self.balance_ledger.get_balance(seller_exchange_name).get(market_state.base, 0) -
+                       ACCOUNT_RESERVES.get(market_state.base, 0))
 
-        if volume_available < MINIMUM_PURCHASE_VOLUME + MIN_LISTING_VOLUME_BUFFER:
-            return 0
-
-        buyer_price = self.order_book[buyer_exchange_name][ASKS][0]
-
-        usable_cny = self.account_balance[buyer_exchange_name][CNY_CURRENCY_CODE] - ACCOUNT_CNY_RESERVE
-        usable_bts = self.account_balance[seller_exchange_name][BTS_CURRENCY_CODE] - ACCOUNT_BTS_RESERVE
-
-        if usable_cny <= 0:
+        if usable_quote <= 0:
             log.info("Insufficient fund on buyer account: {}".format(buyer_exchange_name))
-            return 0
-        elif usable_bts <= 0:
+        elif usable_base <= 0:
             log.info("Insufficient fund on seller account: {}".format(seller_exchange_name))
-            return 0
-        else:
-            safe_volume = volume_available - max(volume_available * 0.2, MIN_LISTING_VOLUME_BUFFER)
-            return min(usable_cny / buyer_price, usable_bts, safe_volume)
 
+        withdrawal_ratio, withdrawal_fee = self.__get_withdrawal_fee(buyer_exchange)
+        plan = arbitragesizer.size_arbitrage(market_state.order_book[buyer_exchange_name][ASKS],
+                                             market_state.order_book[seller_exchange_name][BIDS],
+                                             buyer_exchange.get_profit_deduction(), withdrawal_ratio, withdrawal_fee,
+                                             usable_quote, usable_base, self.profit_threshold,
+                                             self.min_listing_volume_buffer)
+        log.info("Arbitrage sized over {} ask levels and {} bid levels. Expected profit: {:.4f}."
+                 .format(len(plan.purchase_levels), len(plan.sell_levels), plan.profit))
+        return plan
+
+    # Withdrawal fee from btc38 is 1%, therefore, sell_vol = purchase_vol * 0.99 - 1
     @staticmethod
-    def __calculate_sell_volume(buyer_exchange, purchase_volume):
-        buyer_name = buyer_exchange.get_exchange_name()
-        # Withdrawal fee from btc38 is 1%, therefore, sell_vol = purchase_vol * 0.99 - 1
-        if buyer_name == btc38exchange.EXCHANGE_NAME:
-            return purchase_volume * 0.99 - 1
+    def __get_withdrawal_fee(buyer_exchange):
+        if buyer_exchange.get_exchange_name() == BTC38_EXCHANGE_NAME:
+            return 0.99, 1
         else:
-            return purchase_volume - 1
-
-    def __open_order_exists(self):
-        for exchange_name, exchange in self.exchanges_dict.items():
-            orders = exchange.list_my_orders()
-            if orders:
-                log.info("{} order still open: {}".format(exchange.get_exchange_name(), orders))
-                return True
-        return False
+            return 1, 1
+
+    # Fraction of the cycle's top of book amount that the usable balances of the exchanges can trade.
+    def __size_cycle(self, cycle):
+        scale = 1
+        for leg, amount in zip(cycle.legs, cycle.leg_amounts):
+            usable = (self.balance_ledger.get_balance(leg.exchange_name).get(leg.source, 0) -
+                      ACCOUNT_RESERVES.get(leg.source, 0))
+            scale = min(scale, usable / amount)
+        return scale
 
     """
-        Place arbitrage order, return True if both orders have been placed, false otherwise.
-        After placing arbitrage order, send out email notification.
-        Price = BTS price in terms of CNY. Volume = number of BTS shares.
+        Place one order per leg of the cycle, each scaled down. Return True if all of them have been placed, False if
+        any failed, and None if the risk engine rejected the cycle.
     """
-    def __place_arbitrage_orders(self, buyer_exchange, purchase_price, purchase_volume,
-                                 seller_exchange, sell_price, sell_volume):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            seller_thread_future = executor.submit(self.__place_orders_thread,
-                                                   seller_exchange, 2, sell_price, sell_volume)
-            buyer_thread_future = executor.submit(self.__place_orders_thread,
-                                                  buyer_exchange, 1, purchase_price, purchase_volume)
-
-            seller_exception = seller_thread_future.exception()
-            buyer_exception = buyer_thread_future.exception()
+    def __place_cycle_orders(self, cycle, scale):
+        legs = []
+        for leg, amount in zip(cycle.legs, cycle.leg_amounts):
+            price_decimals = PRICE_DECIMALS.get(marketmakerexchange.get_market_currencies(leg.market)[1],
+                                                DEFAULT_PRICE_DECIMALS)
+            if leg.order_type == marketmakerexchange.BUY_ORDER:
+                price = rounding.round_up(leg.price, price_decimals)
+                volume = rounding.round_down(amount * scale / leg.price, 6)
+            else:
+                price = rounding.round_down(leg.price, price_decimals)
+                volume = rounding.round_down(amount * scale, 6)
+            legs.append(ordergateway.OrderLeg(self.exchanges_dict[leg.exchange_name], leg.order_type, price, volume,
+                                              leg.market))
+
+        exceptions = self.__submit_legs(legs)
+        if exceptions is None:
+            return None
+        if any(exception is not None for exception in exceptions):
+            self.notify("\n".join("{} {} exception: {}".format(leg.exchange.get_exchange_name(), leg.market, exception)
+                                  for leg, exception in zip(legs, exceptions)))
+            return False
+        return True
 
-            # If this method is called, successful or not, we need to recheck the account balance.
-            self.__request_account_balance_checking()
+    """
+        Place arbitrage order, return True if both orders have been placed, False otherwise, and None if the risk
+        engine rejected them. After placing arbitrage order, send out email notification.
+        Price = base currency price in terms of quote currency. Volume = number of base currency shares.
+    """
+    def __place_arbitrage_orders(self, market_state, buyer_exchange, purchase_price, purchase_volume,
+                                 seller_exchange, sell_price, sell_volume):
+        market = market_state.market
+        legs = [ordergateway.OrderLeg(seller_exchange, 2, sell_price, sell_volume, market),
+                ordergateway.OrderLeg(buyer_exchange, 1, purchase_price, purchase_volume, market)]
+        exceptions = self.__submit_legs(legs)
+        if exceptions is None:
+            return None
+        seller_exception, buyer_exception = exceptions
 
-            if seller_exception is not None or buyer_exception is not None:
-                error_email = "Seller exception: {}\nBuyer exception: {}".format(seller_exception, buyer_exception)
-                send_notification_email(error_email)
-                return False
+        if seller_exception is not None or buyer_exception is not None:
+            error_email = "Seller exception: {}\nBuyer exception: {}".format(seller_exception, buyer_exception)
+            self.notify(error_email)
+            return False
 
         return True
 
-    def __place_orders_thread(self, exchange, order_type, price, volume):
-        exchange_name = exchange.get_exchange_name()
-        order_message = "Place order at: {} - order type {}, at {}, volume: {}".format(
-            exchange_name, order_type, price, volume)
-        try:
-            exchange.submit_arbitrage_order(order_type, price, volume)
-            current_time = datetime.now()
-            self.last_transaction_time[exchange_name] = current_time
+    """
+        Submit the legs together and return the exception of each leg, None for the legs placed. Return None without
+        submitting anything if the risk engine rejects the legs.
+    """
+    def __submit_legs(self, legs):
+        decision = self.risk_engine.check(legs)
+        if not decision:
+            log.info("Arbitrage legs rejected by the risk engine: {}.".format(decision.reason))
+            return None
+        for leg in legs:
+            self.balance_ledger.record_order(leg.exchange.get_exchange_name(), leg.order_type, leg.price, leg.volume,
+                                             leg.market)
+        futures = self.order_gateway.submit_legs(legs)
+
+        exceptions = [future.exception() for future in futures]
+        tracked_orders = [self.__log_order_leg(leg, exception) for leg, exception in zip(legs, exceptions)]
+        self.risk_engine.on_legs_submitted(legs, exceptions)
+        self.leg_recovery.on_legs_submitted(legs, exceptions, tracked_orders)
+        skew = self.order_gateway.get_skew(legs)
+        metricsregistry.registry.record("order.skew", skew)
+        log.info("Arbitrage legs submitted with {:.3f} ms skew.".format(skew * 1000))
+
+        # If this method is called, successful or not, the ledger is reconciled with the exchanges.
+        self.balance_ledger.request_reconcile()
+        return exceptions
+
+    # Return the tracked order of the leg, None if it failed.
+    def __log_order_leg(self, leg, exception):
+        exchange_name = leg.exchange.get_exchange_name()
+        order_message = "Place order at: {} - {} order type {}, at {}, volume: {}".format(
+            exchange_name, leg.market, leg.order_type, leg.price, leg.volume)
+        if exception is None:
+            current_time = self.clock()
+            self.markets[leg.market].last_transaction_time[exchange_name] = current_time
+            tracked_order = self.order_tracker.track(exchange_name, leg.order_id, leg.order_type, leg.price,
+                                                     leg.volume, leg.market)
             log.info("Arbitrage order placed successfully" + order_message)
-        except Exception as e:
-            log.error("Failed to place order - " + order_message + ". Error: {}.".format(e))
-            raise e
+            return tracked_order
+        self.balance_ledger.revert_order(exchange_name, leg.order_type, leg.price, leg.volume, leg.market)
+        log.error("Failed to place order - " + order_message + ". Error: {}.".format(exception))
+        return None
+
+    # Top of book of the exchange in the market from a fresh snapshot, for the hedges of the leg recovery.
+    def __get_top_of_book(self, exchange_name, market):
+        market_state = self.markets.get(market)
+        if market_state is None:
+            return None
+        snapshot = market_state.order_book_store.snapshot()
+        if exchange_name not in snapshot:
+            return None
+        order_book = snapshot[exchange_name]
+        return {BIDS: order_book[BIDS].top_offer(), ASKS: order_book[ASKS].top_offer()}
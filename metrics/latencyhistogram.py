@@ -0,0 +1,91 @@
+"""
+    Log-linear latency histogram in the style of HdrHistogram. Latencies are recorded in whole microseconds. Values
+    below 2 * SUB_BUCKET_COUNT get one bucket each; above that every power of two is split into SUB_BUCKET_COUNT equal
+    buckets, so that the relative error stays under 1 / SUB_BUCKET_COUNT (about 3%) across the whole range.
+"""
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+# Highest trackable latency is 2 ** 36 microseconds, about 19 hours. Larger values land in the last bucket.
+MAX_VALUE_BITS = 36
+BUCKET_COUNT = (MAX_VALUE_BITS - SUB_BUCKET_BITS + 1) * SUB_BUCKET_COUNT
+MAX_VALUE = 1 << MAX_VALUE_BITS
+
+
+def get_bucket_index(value):
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+        return value
+    return min(shift * SUB_BUCKET_COUNT + (value >> shift), BUCKET_COUNT - 1)
+
+
+# Lowest value that falls into the bucket.
+def get_bucket_value(index):
+    shift = index // SUB_BUCKET_COUNT - 1
+    if shift <= 0:
+        return index
+    return (index - shift * SUB_BUCKET_COUNT) << shift
+
+
+class LatencyHistogram(object):
+    """
+        Recording is a bucket index computation and a list increment, with no allocation. Concurrent recorders may
+        rarely lose a count, which is acceptable for monitoring and keeps the hot path free of locks.
+    """
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.min = MAX_VALUE
+        self.max = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1000000)
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            self.counts[value] += 1
+        else:
+            self.counts[min(shift * SUB_BUCKET_COUNT + (value >> shift), BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value < self.min:
+            self.min = value
+
+    # Latency in microseconds under which the given percentage of samples fall.
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if bucket_count and seen >= threshold:
+                return min(get_bucket_value(index + 1) - 1, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def merge(self, other):
+        for index, bucket_count in enumerate(other.counts):
+            self.counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.min = min(self.min, other.min)
+
+    def reset(self):
+        self.__init__()
+
+    def to_dict(self):
+        return {'count': self.count,
+                'min_us': self.min if self.count else 0,
+                'mean_us': round(self.mean(), 1),
+                'p50_us': self.percentile(50),
+                'p90_us': self.percentile(90),
+                'p99_us': self.percentile(99),
+                'p999_us': self.percentile(99.9),
+                'max_us': self.max}
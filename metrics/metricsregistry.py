@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from metrics import latencyhistogram
+
+DEFAULT_DUMP_INTERVAL = 60
+
+log = logging.getLogger(__name__)
+
+
+class MetricsRegistry(object):
+    """
+        Named latency histograms and event counters of one process. Every process (speculator, order book fetcher)
+        records into its own registry and dumps it to its own file.
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.start_time = time.time()
+        self.dump_thread = None
+
+    def get_histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, latencyhistogram.LatencyHistogram())
+        return histogram
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.get_histogram(name)
+        histogram.record(seconds)
+
+    def increment(self, name, count=1):
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def to_dict(self):
+        return {'pid': os.getpid(),
+                'since': self.start_time,
+                'until': time.time(),
+                'histograms': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items()))}
+
+    # Write all histograms and counters to a JSON file, replacing it atomically so readers never see a partial dump.
+    def dump(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as dump_file:
+            json.dump(self.to_dict(), dump_file, indent=2)
+        os.replace(temporary_path, path)
+
+    # Dump the histograms periodically from a daemon thread.
+    def start_dumping(self, path, interval=DEFAULT_DUMP_INTERVAL):
+        def dump_periodically():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except Exception as e:
+                    log.error("Failed to dump metrics to {}. (Error: {})".format(path, e))
+
+        self.dump_thread = threading.Thread(target=dump_periodically, name="metrics-dump", daemon=True)
+        self.dump_thread.start()
+
+
+# Registry of the current process. A forked process starts from a copy of its parent's histograms, so it should reset
+# the registry before recording.
+registry = MetricsRegistry()
+
+
+def reset():
+    global registry
+    registry = MetricsRegistry()
+    return registry
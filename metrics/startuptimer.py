@@ -0,0 +1,51 @@
+import contextlib
+import logging
+import time
+
+from metrics import metricsregistry
+
+log = logging.getLogger(__name__)
+
+
+class StartupTimer(object):
+    """
+        Durations of the startup phases of a process, measured from the timer's creation. Phases may overlap, e.g. when
+        a phase is started in the background, and milestones mark the elapsed time at which something first happened.
+        The report is logged once and recorded into the metrics registry as startup.<phase>.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.start_time = clock()
+        # (name, start offset, duration) of each phase, and (name, offset) of each milestone, in seconds.
+        self.phases = []
+        self.milestones = []
+        self.reported = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase_start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases.append((name, phase_start - self.start_time, self.clock() - phase_start))
+
+    def mark(self, name):
+        self.milestones.append((name, self.clock() - self.start_time))
+
+    def get_report(self):
+        lines = ["Startup phases:"]
+        for name, offset, duration in self.phases:
+            lines.append("  {:<24} {:>9.1f} ms (at {:.1f} ms)".format(name, duration * 1000, offset * 1000))
+        for name, offset in self.milestones:
+            lines.append("  {:<24} at {:.1f} ms".format(name, offset * 1000))
+        return "\n".join(lines)
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        for name, offset, duration in self.phases:
+            metricsregistry.registry.record("startup." + name, duration)
+        for name, offset in self.milestones:
+            metricsregistry.registry.record("startup." + name, offset)
+        log.info(self.get_report())
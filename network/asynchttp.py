@@ -0,0 +1,136 @@
+import asyncio
+import urllib.parse
+
+ENCODING = 'utf-8'
+CRLF = b'\r\n'
+DEFAULT_MAX_CONNECTIONS = 4
+
+
+class HttpResponseException(Exception):
+    def __init__(self, message, status=None):
+        super(HttpResponseException, self).__init__(message)
+        self.status = status
+
+
+class AsyncHttpPool(object):
+    """
+        Minimal HTTP/1.1 client keeping a pool of keep-alive connections per host, so that polling does not pay for a
+        TCP handshake on every request. Connections are opened lazily inside the running event loop.
+    """
+    def __init__(self, max_connections_per_host=DEFAULT_MAX_CONNECTIONS, headers=None):
+        self.max_connections_per_host = max_connections_per_host
+        self.headers = headers or {}
+        self.idle_connections = {}
+        self.connection_slots = {}
+
+    async def request(self, url, data=None, timeout=2):
+        parsed_url = urllib.parse.urlsplit(url)
+        host = parsed_url.hostname
+        port = parsed_url.port or 80
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path += '?' + parsed_url.query
+
+        request = self.__build_request(host, path, data)
+        slots = self.connection_slots.setdefault((host, port), asyncio.Semaphore(self.max_connections_per_host))
+        async with slots:
+            status, body = await asyncio.wait_for(self.__send(host, port, request, data is None), timeout)
+
+        if status >= 400:
+            raise HttpResponseException("HTTP {} from {}.".format(status, url), status)
+        return body
+
+    async def close(self):
+        for connections in self.idle_connections.values():
+            for reader, writer in connections:
+                writer.close()
+        self.idle_connections = {}
+
+    def __build_request(self, host, path, data):
+        method = 'POST' if data is not None else 'GET'
+        lines = ['{} {} HTTP/1.1'.format(method, path), 'Host: {}'.format(host), 'Connection: keep-alive']
+        lines.extend('{}: {}'.format(key, value) for key, value in self.headers.items())
+        body = b''
+        if data is not None:
+            body = data
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+            lines.append('Content-Length: {}'.format(len(body)))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode(ENCODING) + body
+
+    """
+        A pooled connection closed by the server while idle is dropped before anything is written to it. A request
+        failing on a pooled connection afterwards is sent again once, on a fresh connection, only if it is a GET: a
+        POST such as submitOrder may have been accepted before the connection dropped.
+    """
+    async def __send(self, host, port, request, idempotent):
+        connection = self.__take_idle_connection(host, port)
+        if connection is not None:
+            reader, writer = connection
+            try:
+                return await self.__exchange(host, port, reader, writer, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not idempotent:
+                    raise
+            except BaseException:
+                writer.close()
+                raise
+
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            return await self.__exchange(host, port, reader, writer, request)
+        except BaseException:
+            writer.close()
+            raise
+
+    def __take_idle_connection(self, host, port):
+        idle = self.idle_connections.setdefault((host, port), [])
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    async def __exchange(self, host, port, reader, writer, request):
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by {}:{}.".format(host, port))
+        status = int(status_line.split(b' ', 2)[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (CRLF, b'\n', b''):
+                break
+            key, value = line.decode(ENCODING).split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self.__read_chunked(reader)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        if keep_alive:
+            self.idle_connections[(host, port)].append((reader, writer))
+        else:
+            writer.close()
+        return status, body
+
+    @staticmethod
+    async def __read_chunked(reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                await reader.readline()
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
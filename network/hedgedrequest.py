@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+
+from metrics import latencyhistogram
+from metrics import metricsregistry
+
+HEDGE_PERCENTILE = 90
+# Hedges allowed per request, so that a slow exchange does not get twice the load.
+MAX_HEDGE_RATIO = 0.1
+# Latencies measured before the first hedge, and after which the measurements start over.
+MIN_SAMPLES = 20
+SAMPLE_WINDOW = 1000
+
+log = logging.getLogger(__name__)
+
+
+class HedgePolicy(object):
+    """
+        Hedged requests for one read-only call. When a request has not completed within the p90 latency measured for
+        the call, a second identical request is sent; the first one to succeed wins and the other is cancelled.
+        Hedging starts after MIN_SAMPLES measurements and is capped to MAX_HEDGE_RATIO of the requests. Only the latency
+        of successful requests is measured, hedged or not: failures are often immediate, or time out.
+        Every request, hedge and hedge win is counted in the metrics registry under hedge.<name>.
+    """
+    def __init__(self, name, percentile=HEDGE_PERCENTILE, max_hedge_ratio=MAX_HEDGE_RATIO):
+        self.name = name
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.latencies = latencyhistogram.LatencyHistogram()
+        self.hedge_delay = None
+        self.requests = 0
+        self.hedges = 0
+
+    # Seconds after which a request is hedged, or None until enough latencies are measured.
+    def get_hedge_delay(self):
+        return self.hedge_delay
+
+    def __record_latency(self, seconds):
+        self.latencies.record(seconds)
+        if self.latencies.count >= MIN_SAMPLES:
+            self.hedge_delay = self.latencies.percentile(self.percentile) / 1e6
+        if self.latencies.count >= SAMPLE_WINDOW:
+            # Start over so that the delay follows the exchange's current latency, keeping the last delay meanwhile.
+            self.latencies.reset()
+            self.requests //= 2
+            self.hedges //= 2
+
+    def __may_hedge(self):
+        return self.hedges < self.max_hedge_ratio * self.requests
+
+    # make_request returns a new coroutine for the call each time it is called.
+    async def request(self, make_request):
+        self.requests += 1
+        metricsregistry.registry.increment("hedge.{}.requests".format(self.name))
+        start = time.perf_counter()
+        first = asyncio.ensure_future(make_request())
+        delay = self.get_hedge_delay()
+        if delay is not None and self.__may_hedge():
+            done, pending = await asyncio.wait([first], timeout=delay)
+            if not done:
+                return await self.__hedge(first, make_request, start)
+        result = await first
+        self.__record_latency(time.perf_counter() - start)
+        return result
+
+    async def __hedge(self, first, make_request, start):
+        self.hedges += 1
+        metricsregistry.registry.increment("hedge.{}.fired".format(self.name))
+        second = asyncio.ensure_future(make_request())
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in [first, second]:
+                    if future in done and future.exception() is None:
+                        self.__record_latency(time.perf_counter() - start)
+                        if future is second:
+                            metricsregistry.registry.increment("hedge.{}.won".format(self.name))
+                        return future.result()
+            # Both failed: raise the error of the original request.
+            second.exception()
+            return first.result()
+        finally:
+            for future in pending:
+                future.cancel()
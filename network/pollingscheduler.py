@@ -0,0 +1,95 @@
+import random
+import time
+
+from exceptions import exchangeexceptions
+
+# Fetches start at most this often, and at least this often while the exchange answers.
+MIN_INTERVAL = 0.1
+MAX_INTERVAL = 2
+# Exponential backoff after consecutive errors: BACKOFF_BASE, twice that, and so on up to MAX_BACKOFF seconds.
+BACKOFF_BASE = 0.2
+MAX_BACKOFF = 30
+# A rate-limited response doubles the minimum interval, which then shrinks by RATE_LIMIT_RECOVERY on each success.
+RATE_LIMIT_RECOVERY = 0.95
+DEFAULT_REQUESTS_PER_SECOND = 5
+# Weight of the latest fetch in the moving averages of the round-trip time and of the top-of-book change rate.
+SMOOTHING = 0.2
+HTTP_TOO_MANY_REQUESTS = 429
+HTTP_SERVICE_UNAVAILABLE = 503
+
+
+# Only explicit rate limit signals count: btc38's throttling answer, or HTTP 429 or 503. Other failures only back off.
+def is_rate_limit_error(exception):
+    if isinstance(exception, exchangeexceptions.RateLimitException):
+        return True
+    status = getattr(exception, 'status', None) or getattr(exception, 'code', None)
+    return status in (HTTP_TOO_MANY_REQUESTS, HTTP_SERVICE_UNAVAILABLE)
+
+
+class PollingScheduler(object):
+    """
+        Decides when the next order book fetch of one exchange starts. The interval between fetch starts shrinks
+        toward the minimum while the top of book keeps changing and grows toward the maximum while it is quiet, is never
+        shorter than the round-trip time, and is stretched after rate-limited responses. Errors back off exponentially.
+        On top of that, a token bucket holds the exchange to its request budget.
+    """
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL, clock=time.monotonic):
+        self.requests_per_second = requests_per_second
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.clock = clock
+
+        self.round_trip_time = 0
+        # Moving average of the fraction of fetches which changed the top of book.
+        self.change_rate = 1
+        self.rate_limit_interval = min_interval
+        self.consecutive_failures = 0
+        self.last_request_time = None
+        # Token bucket allowing bursts of one second's budget.
+        self.tokens = requests_per_second
+        self.token_time = clock()
+
+    def get_interval(self):
+        interval = self.max_interval - (self.max_interval - self.min_interval) * self.change_rate
+        return min(self.max_interval, max(interval, self.rate_limit_interval, self.round_trip_time))
+
+    # Seconds to wait before starting the next fetch.
+    def next_delay(self):
+        current_time = self.clock()
+        if self.consecutive_failures:
+            backoff = min(MAX_BACKOFF, BACKOFF_BASE * 2 ** (self.consecutive_failures - 1))
+            # Jitter keeps fetchers which failed together from retrying in lockstep.
+            delay = backoff * random.uniform(0.5, 1)
+        elif self.last_request_time is None:
+            delay = 0
+        else:
+            delay = self.last_request_time + self.get_interval() - current_time
+
+        self.__refill_tokens(current_time)
+        if self.tokens < 1:
+            delay = max(delay, (1 - self.tokens) / self.requests_per_second)
+        return max(0, delay)
+
+    # A fetch may take several requests, e.g. one per market on exchanges without a batched depth endpoint.
+    def on_request(self, request_count=1):
+        current_time = self.clock()
+        self.__refill_tokens(current_time)
+        self.tokens -= request_count
+        self.last_request_time = current_time
+
+    def on_success(self, round_trip_time, top_of_book_changed):
+        self.consecutive_failures = 0
+        self.round_trip_time += SMOOTHING * (round_trip_time - self.round_trip_time)
+        self.change_rate += SMOOTHING * ((1 if top_of_book_changed else 0) - self.change_rate)
+        self.rate_limit_interval = max(self.min_interval, self.rate_limit_interval * RATE_LIMIT_RECOVERY)
+
+    def on_failure(self, exception):
+        self.consecutive_failures += 1
+        if is_rate_limit_error(exception):
+            self.rate_limit_interval = min(self.max_interval, self.rate_limit_interval * 2)
+
+    def __refill_tokens(self, current_time):
+        self.tokens = min(self.requests_per_second,
+                          self.tokens + (current_time - self.token_time) * self.requests_per_second)
+        self.token_time = current_time
@@ -4,21 +4,31 @@ import logging
 from email.mime.text import MIMEText
 
 GMAIL_SERVER = 'smtp.gmail.com'
+SMTP_SSL_PORT = 465
+SMTP_TIMEOUT = 30
 
 # logger
 log = logging.getLogger(__name__)
 
 
 class EmailSender(object):
-    def __init__(self, login, password):
+    """
+        Keeps one SMTP connection open across emails and reconnects when the server dropped it.
+        The server defaults to Gmail over SSL; a plain SMTP server without login can be used for testing.
+    """
+    def __init__(self, login, password, server=GMAIL_SERVER, port=SMTP_SSL_PORT, use_ssl=True):
         self.login = login
         self.password = password
+        self.server = server
+        self.port = port
+        self.use_ssl = use_ssl
+        self.connection = None
 
     def send_email(self, email_template_file):
         with open(email_template_file) as fp:
             email = Parser().parse(fp)
 
-        self.__send_email(email)
+        return self.__send_email(email)
 
     def send_email_with_message(self, message, subject, from_address, to_address):
         email = MIMEText(message)
@@ -26,16 +36,41 @@ class EmailSender(object):
         email['From'] = from_address
         email['To'] = to_address
 
-        self.__send_email(email)
+        return self.__send_email(email)
 
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    # Return True if the email was sent.
     def __send_email(self, email):
         try:
-            server = smtplib.SMTP_SSL(GMAIL_SERVER)
-            server.ehlo()
-            server.login(self.login, self.password)
-            server.send_message(email)
-            server.close()
+            try:
+                self.__get_connection().send_message(email)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # The idle connection was closed by the server. Send once more on a new connection.
+                self.connection = None
+                self.__get_connection().send_message(email)
 
             log.info("Email sent successfully.")
+            return True
         except Exception as e:
+            self.connection = None
             log.error("Failed to send email. Error: {}".format(e))
+            return False
+
+    def __get_connection(self):
+        if self.connection is None:
+            if self.use_ssl:
+                connection = smtplib.SMTP_SSL(self.server, self.port, timeout=SMTP_TIMEOUT)
+            else:
+                connection = smtplib.SMTP(self.server, self.port, timeout=SMTP_TIMEOUT)
+            connection.ehlo()
+            if self.login:
+                connection.login(self.login, self.password)
+            self.connection = connection
+        return self.connection
@@ -0,0 +1,90 @@
+import collections
+import logging
+import queue
+import threading
+import time
+
+# Messages arriving within this many seconds of the first one are sent together in one email.
+BATCH_WINDOW = 5
+MAX_QUEUED_MESSAGES = 100
+# Distinct messages listed in one email. The rest of the batch is only counted.
+MAX_BATCH_MESSAGES = 20
+CLOSE_TIMEOUT = 10
+
+log = logging.getLogger(__name__)
+
+
+class NotificationWorker(object):
+    """
+        Sends notifications from one long-lived thread. notify() never blocks: messages go through a bounded queue and
+        are counted as dropped when it is full. Messages queued within the batch window are sent as one email, where
+        repeated messages are listed once with their count, and dropped messages are summarized.
+    """
+    def __init__(self, email_sender, subject, from_address, to_address, batch_window=BATCH_WINDOW,
+                 max_queued_messages=MAX_QUEUED_MESSAGES):
+        self.email_sender = email_sender
+        self.subject = subject
+        self.from_address = from_address
+        self.to_address = to_address
+        self.batch_window = batch_window
+        self.messages = queue.Queue(max_queued_messages)
+        self.dropped_messages = 0
+        self.sent_emails = 0
+        self.worker_thread = threading.Thread(target=self.__send_forever, name="notification-worker", daemon=True)
+        self.worker_thread.start()
+
+    def notify(self, message):
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            self.dropped_messages += 1
+
+    # Send what is queued, then stop the worker.
+    def close(self, timeout=CLOSE_TIMEOUT):
+        try:
+            self.messages.put(None, timeout=timeout)
+        except queue.Full:
+            log.warning("Notification queue still full on close.")
+        self.worker_thread.join(timeout)
+        self.email_sender.close()
+
+    def __send_forever(self):
+        while True:
+            batch, closed = self.__next_batch()
+            if batch or self.dropped_messages:
+                self.__send_batch(batch)
+            if closed:
+                return
+
+    # Wait for the first message, then collect the messages arriving within the batch window.
+    def __next_batch(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                message = self.messages.get(timeout=timeout)
+            except queue.Empty:
+                return batch, False
+            if message is None:
+                return batch, True
+            batch.append(message)
+            if deadline is None:
+                deadline = time.monotonic() + self.batch_window
+
+    def __send_batch(self, batch):
+        dropped_messages = self.dropped_messages
+        self.dropped_messages -= dropped_messages
+        counts = collections.Counter(batch)
+
+        lines = []
+        for message, count in list(counts.items())[:MAX_BATCH_MESSAGES]:
+            lines.append(message if count == 1 else "{}\n(repeated {} times)".format(message, count))
+        if len(counts) > MAX_BATCH_MESSAGES:
+            lines.append("{} more distinct notifications not shown.".format(len(counts) - MAX_BATCH_MESSAGES))
+        if dropped_messages:
+            lines.append("{} notifications dropped because the queue was full.".format(dropped_messages))
+
+        if self.email_sender.send_email_with_message("\n\n".join(lines), self.subject, self.from_address,
+                                                     self.to_address):
+            self.sent_emails += 1
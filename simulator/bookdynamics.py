@@ -0,0 +1,67 @@
+import math
+import random
+
+# Weight kept by a venue's price offset at every tick, pulling it back toward the reference price.
+OFFSET_MEAN_REVERSION = 0.95
+
+
+class BookDynamics(object):
+    """
+        Order book of one market on one simulated venue, as a function of time. Every venue quotes around a reference
+        price following a random walk seeded by market_seed, which is the same on every venue, with its own
+        mean-reverting offset seeded by seed, so that books occasionally cross between venues.
+        The book changes tick_rate times per second from start_time. It only depends on the tick index, so processes
+        holding their own copy of the same venue see the same book at the same time.
+    """
+    def __init__(self, price, start_time, tick_rate=5, tick_size=0.0001, levels=20, volatility=0.0005,
+                 offset_volatility=0.002, seed=0, market_seed=0, min_volume=100, max_volume=5000):
+        self.initial_price = price
+        self.start_time = start_time
+        self.tick_rate = tick_rate
+        self.tick_size = tick_size
+        self.levels = levels
+        self.volatility = volatility
+        self.offset_volatility = offset_volatility
+        self.min_volume = min_volume
+        self.max_volume = max_volume
+        self.seed = seed
+        self.market_seed = market_seed
+        self.__reset()
+
+    def __reset(self):
+        self.reference_generator = random.Random(self.market_seed)
+        self.generator = random.Random(self.seed)
+        self.tick = -1
+        self.reference_price = self.initial_price
+        self.offset = 0
+        self.bids = []
+        self.asks = []
+        self.__step()
+
+    def __step(self):
+        self.tick += 1
+        if self.tick > 0:
+            self.reference_price *= math.exp(self.reference_generator.gauss(0, self.volatility))
+            self.offset = self.offset * OFFSET_MEAN_REVERSION + self.generator.gauss(0, self.offset_volatility)
+        decimals = max(0, -int(math.floor(math.log10(self.tick_size))))
+        mid = self.reference_price * (1 + self.offset)
+        spread = self.tick_size * self.generator.randint(1, 5)
+        self.bids = [[round(mid - spread - level * self.tick_size, decimals),
+                      round(self.generator.uniform(self.min_volume, self.max_volume), 6)]
+                     for level in range(self.levels)]
+        self.asks = [[round(mid + spread + level * self.tick_size, decimals),
+                      round(self.generator.uniform(self.min_volume, self.max_volume), 6)]
+                     for level in range(self.levels)]
+
+    def get_tick(self, current_time):
+        return max(0, int((current_time - self.start_time) * self.tick_rate))
+
+    # Step the book up to the given time. Return True if it changed.
+    def advance_to(self, current_time):
+        tick = self.get_tick(current_time)
+        if tick < self.tick:
+            self.__reset()
+        changed = tick > self.tick
+        while self.tick < tick:
+            self.__step()
+        return changed
@@ -0,0 +1,166 @@
+import http.server
+import json
+import logging
+import threading
+import urllib.parse
+
+from btc38 import client
+from data import marketmakerexchange
+from simulator import simulatedvenue
+
+API_PREFIX = '/v1/'
+# Answers of api.btc38.com when a request fails: depth.php answers "fail#3", the private endpoints "fail".
+DEPTH_FAILURE = b'fail#3'
+REQUEST_FAILURE = b'fail'
+SUBMIT_ORDER_OVER_BALANCE = b'overBalance'
+NO_ORDER = b'no_order'
+CANCEL_ORDER_SUCCESS = b'succ'
+log = logging.getLogger(__name__)
+
+
+# btc38 names a market by its coin (c) and the currency it is quoted in (mk_type), e.g. c=bts, mk_type=cny.
+def get_market(c, mk_type):
+    return c.upper() + marketmakerexchange.MARKET_SEPARATOR + mk_type.upper()
+
+
+class BTC38RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+        Answers the endpoints of client.API_PATH_DICT from the server's simulated venue, with keep-alive enabled and
+        the response bodies of api.btc38.com. Signatures of the private endpoints are not checked.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        self.__handle(url.path, dict(urllib.parse.parse_qsl(url.query)))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        params.update(urllib.parse.parse_qsl(body.decode(client.ENCODING)))
+        self.__handle(url.path, params)
+
+    def __handle(self, path, params):
+        venue = self.server.venue
+        name = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+        handler = self.server.handlers.get(name)
+        if handler is None:
+            self.__respond(b'', 404)
+            return
+        try:
+            venue.simulate_request()
+            body = handler(venue, params)
+        except simulatedvenue.InjectedError:
+            body = DEPTH_FAILURE if handler is get_depth else REQUEST_FAILURE
+        except Exception as e:
+            log.error("Failed to answer {}. (Error: {})".format(self.path, e))
+            body = REQUEST_FAILURE
+        self.__respond(body)
+
+    def __respond(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def encode(value):
+    return json.dumps(value).encode(client.ENCODING)
+
+
+def get_depth(venue, params):
+    market = get_market(params['c'], params['mk_type'])
+    if market not in venue.get_markets():
+        return DEPTH_FAILURE
+    bids, asks = venue.get_order_book(market)
+    return encode({'bids': bids, 'asks': asks})
+
+
+def get_ticker(venue, params):
+    bids, asks = venue.get_order_book(get_market(params['c'], params['mk_type']))
+    return encode({'ticker': {'buy': bids[0][0], 'sell': asks[0][0]}})
+
+
+def get_balance(venue, params):
+    return encode({currency.lower() + '_balance': '{:.6f}'.format(balance)
+                   for currency, balance in venue.get_balances().items()})
+
+
+def submit_order(venue, params):
+    try:
+        order_id = venue.submit_order(int(params['type']), get_market(params['coinname'], params['mk_type']),
+                                      float(params['price']), float(params['amount']))
+    except simulatedvenue.InsufficientBalanceError:
+        return SUBMIT_ORDER_OVER_BALANCE
+    return '{}|{}'.format(client.SUBMIT_ORDER_SUCCESS_STRING, order_id).encode(client.ENCODING)
+
+
+def cancel_order(venue, params):
+    return CANCEL_ORDER_SUCCESS if venue.cancel_order(params['order_id']) else REQUEST_FAILURE
+
+
+# Orders are listed by coin, across the markets quoting it.
+def get_order_list(venue, params):
+    coinname = params.get('coinname', '').lower()
+    orders = [{'id': order.order_id,
+               'coinname': coinname,
+               'mk_type': marketmakerexchange.get_market_currencies(order.market)[1].lower(),
+               'type': str(order.order_type),
+               'price': '{:.8f}'.format(order.price),
+               'amount': '{:.6f}'.format(order.remaining_volume)}
+              for order in venue.list_open_orders()
+              if marketmakerexchange.get_market_currencies(order.market)[0].lower() == coinname]
+    return encode(orders) if orders else NO_ORDER
+
+
+def get_trade_list(venue, params):
+    trades = venue.list_trades(get_market(params['coinname'], params['mk_type']))
+    return encode([{'order_id': trade.order_id,
+                    'type': str(trade.order_type),
+                    'price': '{:.8f}'.format(trade.price),
+                    'volume': '{:.6f}'.format(trade.volume),
+                    'time': int(trade.trade_time)}
+                   for trade in reversed(trades)])
+
+
+HANDLERS = {
+    client.API_PATH_DICT['tickers'].rstrip('?'): get_ticker,
+    client.API_PATH_DICT['depth'].rstrip('?'): get_depth,
+    client.API_PATH_DICT['balance']: get_balance,
+    client.API_PATH_DICT['submitorder']: submit_order,
+    client.API_PATH_DICT['cancelorder']: cancel_order,
+    client.API_PATH_DICT['myorders']: get_order_list,
+    client.API_PATH_DICT['mytrades']: get_trade_list,
+}
+
+
+class BTC38StubServer(object):
+    """
+        Local HTTP server speaking the btc38 API in front of a simulatedvenue.SimulatedVenue. Point a client.Client or
+        btc38exchange.BTC38Exchange at base_url. The server answers from a daemon thread per connection.
+    """
+    def __init__(self, venue, host='127.0.0.1', port=0):
+        self.server = http.server.ThreadingHTTPServer((host, port), BTC38RequestHandler)
+        self.server.daemon_threads = True
+        self.server.venue = venue
+        self.server.handlers = HANDLERS
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}{}'.format(host, port, API_PREFIX)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="btc38-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,49 @@
+from data import marketmakerexchange
+
+ALL_MARKETS = "all"
+
+
+class GrapheneExchangeStub(object):
+    """
+        Stand-in for the GrapheneExchange calls made by dex.dexexchange.DexExchange, answered from a
+        simulatedvenue.SimulatedVenue instead of a witness node. Pass it as DexExchange's exchange. Failures injected
+        by the venue are raised, as the failing RPC calls of GrapheneExchange are. Prices are quoted in the market's
+        quote currency, as DexExchange reads them; the reversed markets watched by the real client are not answered.
+    """
+    def __init__(self, venue):
+        self.venue = venue
+
+    def returnOrderBook(self, currencyPair=ALL_MARKETS):
+        self.venue.simulate_request()
+        markets = self.venue.get_markets() if currencyPair == ALL_MARKETS else [currencyPair]
+        order_books = {}
+        for market in markets:
+            bids, asks = self.venue.get_order_book(market)
+            order_books[market] = {marketmakerexchange.BIDS: bids, marketmakerexchange.ASKS: asks}
+        return order_books
+
+    def returnOpenOrders(self, currencyPair=ALL_MARKETS):
+        self.venue.simulate_request()
+        markets = self.venue.get_markets() if currencyPair == ALL_MARKETS else [currencyPair]
+        return {market: [{"orderNumber": order.order_id,
+                          "type": "buy" if order.order_type == marketmakerexchange.BUY_ORDER else "sell",
+                          "rate": order.price,
+                          "amount": order.remaining_volume}
+                         for order in self.venue.list_open_orders(market)]
+                for market in markets}
+
+    def returnBalances(self):
+        self.venue.simulate_request()
+        return self.venue.get_balances()
+
+    def buy(self, currencyPair, rate, amount):
+        self.venue.simulate_request()
+        self.venue.submit_order(marketmakerexchange.BUY_ORDER, currencyPair, rate, amount)
+
+    def sell(self, currencyPair, rate, amount):
+        self.venue.simulate_request()
+        self.venue.submit_order(marketmakerexchange.SELL_ORDER, currencyPair, rate, amount)
+
+    def cancel(self, orderNumber):
+        self.venue.simulate_request()
+        self.venue.cancel_order(orderNumber)
@@ -0,0 +1,46 @@
+from btc38 import btc38exchange
+from dex import dexexchange
+from simulator import btc38stubserver
+from simulator import graphenestub
+
+# Profit deduction of the simulated btc38 venues. btc38exchange.BTC38_PROFIT_DEDUCTION never lets them buy.
+SIMULATED_BTC38_PROFIT_DEDUCTION = 0.002
+
+
+class SimulatedBTC38Exchange(btc38exchange.BTC38Exchange):
+    """
+        btc38exchange.BTC38Exchange talking to a btc38stubserver.BTC38StubServer, under the name of its venue so that
+        several of them can be traded together.
+    """
+    def __init__(self, stub_server, profit_deduction=SIMULATED_BTC38_PROFIT_DEDUCTION, **kwargs):
+        venue = stub_server.server.venue
+        super(SimulatedBTC38Exchange, self).__init__('access', 'secret', 'account', markets=venue.get_markets(),
+                                                     base_url=stub_server.base_url, **kwargs)
+        self.exchange_name = venue.name
+        self.profit_deduction = profit_deduction
+
+    def get_exchange_name(self):
+        return self.exchange_name
+
+    def get_profit_deduction(self):
+        return self.profit_deduction
+
+
+class SimulatedDexExchange(dexexchange.DexExchange):
+    """
+        dex.dexexchange.DexExchange on a graphenestub.GrapheneExchangeStub of the venue, under the venue's name.
+        A forked process, such as the order book fetcher, trades its own copy of the venue.
+    """
+    def __init__(self, venue, **kwargs):
+        super(SimulatedDexExchange, self).__init__(None, None, None, markets=venue.get_markets(),
+                                                   exchange=graphenestub.GrapheneExchangeStub(venue), **kwargs)
+        self.exchange_name = venue.name
+
+    def get_exchange_name(self):
+        return self.exchange_name
+
+
+# Serve the venue on a local btc38 stub server. Return the started server and the exchange talking to it.
+def create_btc38_exchange(venue, **kwargs):
+    stub_server = btc38stubserver.BTC38StubServer(venue).start()
+    return stub_server, SimulatedBTC38Exchange(stub_server, **kwargs)
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+import zlib
+
+from data import marketmakerexchange
+from simulator import bookdynamics
+
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+SELL_ORDER = marketmakerexchange.SELL_ORDER
+# Remaining volumes below this are rounding errors of fully filled orders.
+VOLUME_EPSILON = 1e-9
+
+
+# Seeds derived from names rather than hash(), which differs between interpreter runs.
+def get_seed(name, seed):
+    return zlib.crc32(name.encode('utf-8')) ^ seed
+
+
+class VenueError(Exception):
+    pass
+
+
+class InjectedError(VenueError):
+    pass
+
+
+class InsufficientBalanceError(VenueError):
+    pass
+
+
+class SimulatedOrder(object):
+    def __init__(self, order_id, market, order_type, price, volume, submit_time):
+        self.order_id = order_id
+        self.market = market
+        self.order_type = order_type
+        self.price = price
+        self.volume = volume
+        self.remaining_volume = volume
+        self.submit_time = submit_time
+
+
+class SimulatedTrade(object):
+    def __init__(self, order_id, market, order_type, price, volume, trade_time):
+        self.order_id = order_id
+        self.market = market
+        self.order_type = order_type
+        self.price = price
+        self.volume = volume
+        self.trade_time = trade_time
+
+
+class SimulatedVenue(object):
+    """
+        Matching engine of one simulated exchange, shared by the protocol stubs in front of it. Every market book
+        follows bookdynamics.BookDynamics. Orders crossing the book are filled at once against its levels up to their
+        limit price; the rest stays open until a later book crosses it or the order is cancelled. Filled volume does
+        not deplete the simulated book.
+        Every call waits for latency plus up to jitter seconds, and fails with InjectedError with probability
+        error_rate, so that the stubs can answer the way the real exchange does when it is slow or failing.
+    """
+    def __init__(self, name, markets, balances, start_time=None, latency=0, jitter=0, error_rate=0, seed=0,
+                 clock=time.time, **book_settings):
+        self.name = name
+        self.balances = dict(balances)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.clock = clock
+        start_time = clock() if start_time is None else start_time
+        # markets: {market: initial price}. The reference price of a market follows the same walk on every venue.
+        self.books = {market: bookdynamics.BookDynamics(price, start_time, seed=get_seed(name + market, seed),
+                                                        market_seed=get_seed(market, seed), **book_settings)
+                      for market, price in markets.items()}
+        self.orders = {}
+        self.trades = []
+        self.order_count = 0
+        self.generator = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get_markets(self):
+        return list(self.books.keys())
+
+    # Sleep for the configured latency, then raise InjectedError at the configured rate.
+    def simulate_request(self):
+        delay = self.latency + self.generator.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and self.generator.random() < self.error_rate:
+            raise InjectedError("Injected {} failure.".format(self.name))
+
+    # Return the bids and asks of the market, as [price, volume] lists from the best price.
+    def get_order_book(self, market):
+        with self.lock:
+            self.__advance(market)
+            book = self.books[market]
+            return book.bids, book.asks
+
+    def get_balances(self):
+        with self.lock:
+            for market in self.books:
+                self.__advance(market)
+            return dict(self.balances)
+
+    def submit_order(self, order_type, market, price, volume):
+        with self.lock:
+            self.__advance(market)
+            base, quote = marketmakerexchange.get_market_currencies(market)
+            if order_type == BUY_ORDER:
+                required_currency, required_amount = quote, price * volume
+            elif order_type == SELL_ORDER:
+                required_currency, required_amount = base, volume
+            else:
+                raise VenueError("Unrecognized order type: {}".format(order_type))
+            if self.balances.get(required_currency, 0) < required_amount:
+                raise InsufficientBalanceError("Insufficient {} on {}.".format(required_currency, self.name))
+
+            self.order_count += 1
+            order = SimulatedOrder(str(self.order_count), market, order_type, price, volume, self.clock())
+            self.orders[order.order_id] = order
+            self.__match(order)
+            return order.order_id
+
+    def cancel_order(self, order_id):
+        with self.lock:
+            return self.orders.pop(order_id, None) is not None
+
+    def list_open_orders(self, market=None):
+        with self.lock:
+            if market is not None:
+                self.__advance(market)
+            return [order for order in self.orders.values() if market is None or order.market == market]
+
+    def list_trades(self, market=None):
+        with self.lock:
+            return [trade for trade in self.trades if market is None or trade.market == market]
+
+    def __advance(self, market):
+        if self.books[market].advance_to(self.clock()):
+            for order in list(self.orders.values()):
+                if order.market == market:
+                    self.__match(order)
+
+    def __match(self, order):
+        book = self.books[order.market]
+        if order.order_type == BUY_ORDER:
+            levels = [level for level in book.asks if level[0] <= order.price]
+        else:
+            levels = [level for level in book.bids if level[0] >= order.price]
+        for price, volume in levels:
+            if order.remaining_volume <= VOLUME_EPSILON:
+                break
+            self.__fill(order, price, min(volume, order.remaining_volume))
+        if order.remaining_volume <= VOLUME_EPSILON:
+            del self.orders[order.order_id]
+
+    def __fill(self, order, price, volume):
+        base, quote = marketmakerexchange.get_market_currencies(order.market)
+        sign = 1 if order.order_type == BUY_ORDER else -1
+        self.balances[base] = self.balances.get(base, 0) + sign * volume
+        self.balances[quote] = self.balances.get(quote, 0) - sign * price * volume
+        order.remaining_volume -= volume
+        self.trades.append(SimulatedTrade(order.order_id, order.market, order.order_type, price, volume,
+                                          self.clock()))
@@ -0,0 +1,152 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+from data import marketmakerexchange
+from metrics import metricsregistry
+
+CNY = marketmakerexchange.CNY
+BTS = marketmakerexchange.BTS
+MARKET = marketmakerexchange.MARKET
+BUY_ORDER = 1
+SELL_ORDER = 2
+
+# Relative difference between the ledger and an exchange's balance above which trading on the exchange stops until
+# the next reconciliation agrees with the ledger. Fees and partial fills stay below it.
+DRIFT_TOLERANCE = 0.02
+# Balances smaller than this are compared in absolute terms, so that an almost empty account does not drift forever.
+MIN_DRIFT_BASE = 10
+BALANCE_REQUEST_TIMEOUT = 10
+# Seconds between reconciliations while an exchange is blocked by drift.
+DRIFT_RECHECK_INTERVAL = 5
+
+log = logging.getLogger(__name__)
+
+
+class BalanceLedger(object):
+    """
+        Local copy of the maker account balances. Orders update it as soon as they are submitted, and reconcile()
+        replaces it with the balances reported by the exchanges, requested concurrently. Reconciliation normally runs in
+        a background thread woken up by request_reconcile(), so readers never wait for a balance request.
+        An exchange can be traded once it has been reconciled, and as long as its last reconciliation found no drift.
+        Balances are kept per currency, so the markets of an exchange share them. on_reconciled is called with the
+        balances, {exchange name: {currency: amount}}, after every reconciliation.
+    """
+    def __init__(self, exchanges_dict, tolerance=DRIFT_TOLERANCE, on_reconciled=None):
+        self.exchanges_dict = exchanges_dict
+        self.tolerance = tolerance
+        self.on_reconciled = on_reconciled
+        self.balances = {exchange_name: {} for exchange_name in exchanges_dict}
+        self.reconciled_exchanges = set()
+        self.drifted_exchanges = set()
+        # Deltas applied while a reconciliation is waiting for the exchanges, replayed on top of their balances.
+        self.in_flight_deltas = None
+        self.lock = threading.Lock()
+        self.reconcile_requested = threading.Event()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(exchanges_dict)),
+                                                              thread_name_prefix="balance-ledger")
+        self.reconcile_thread = None
+
+    def get_balance(self, exchange_name):
+        with self.lock:
+            return dict(self.balances[exchange_name])
+
+    def is_trading_allowed(self, exchange_name):
+        return exchange_name in self.reconciled_exchanges and exchange_name not in self.drifted_exchanges
+
+    # Apply the expected balance change of an order in the market. order_type 1 for biding, 2 for asking.
+    def record_order(self, exchange_name, order_type, price, volume, market=MARKET):
+        self.__apply(exchange_name, order_type, price, volume, market)
+
+    # Take back the expected change of an order which was rejected by the exchange.
+    def revert_order(self, exchange_name, order_type, price, volume, market=MARKET):
+        self.__apply(exchange_name, order_type, price, -volume, market)
+
+    def __apply(self, exchange_name, order_type, price, volume, market):
+        base, quote = marketmakerexchange.get_market_currencies(market)
+        if order_type == BUY_ORDER:
+            delta = {quote: -price * volume, base: volume}
+        else:
+            delta = {quote: price * volume, base: -volume}
+        with self.lock:
+            for currency, amount in delta.items():
+                self.__add(self.balances[exchange_name], currency, amount)
+                if self.in_flight_deltas is not None:
+                    self.__add(self.in_flight_deltas[exchange_name], currency, amount)
+
+    @staticmethod
+    def __add(balance, currency, amount):
+        balance[currency] = balance.get(currency, 0) + amount
+
+    """
+        Request the balances of all exchanges at once and replace the ledger with them. Exchanges whose balance drifted
+        from the ledger by more than the tolerance are blocked until a later reconciliation agrees with the ledger.
+        An exchange whose balance cannot be retrieved keeps its ledger balance and state.
+    """
+    def reconcile(self):
+        reconcile_start = time.perf_counter()
+        with self.lock:
+            expected_balances = {exchange_name: dict(balance) for exchange_name, balance in self.balances.items()}
+            self.in_flight_deltas = {exchange_name: {} for exchange_name in self.balances}
+
+        futures = {exchange_name: self.executor.submit(exchange.get_maker_account_balance)
+                   for exchange_name, exchange in self.exchanges_dict.items()}
+        reported_balances = {}
+        for exchange_name, future in futures.items():
+            try:
+                reported_balances[exchange_name] = future.result(BALANCE_REQUEST_TIMEOUT)
+            except Exception as e:
+                log.error("Failed to retrieve {} account balance. (Error: {})".format(exchange_name, e))
+
+        with self.lock:
+            for exchange_name, reported_balance in reported_balances.items():
+                drift = self.__get_drift(expected_balances[exchange_name], reported_balance)
+                if exchange_name in self.reconciled_exchanges and drift > self.tolerance:
+                    log.warning("{} balance drifted by {:.2f}%. Ledger: {}, exchange: {}."
+                                .format(exchange_name, drift * 100, expected_balances[exchange_name],
+                                        reported_balance))
+                    self.drifted_exchanges.add(exchange_name)
+                else:
+                    self.drifted_exchanges.discard(exchange_name)
+                self.reconciled_exchanges.add(exchange_name)
+                self.balances[exchange_name] = {currency: amount + self.in_flight_deltas[exchange_name].get(currency, 0)
+                                                for currency, amount in reported_balance.items()}
+            self.in_flight_deltas = None
+            balances = {exchange_name: dict(balance) for exchange_name, balance in self.balances.items()}
+
+        metricsregistry.registry.record("balance.reconcile", time.perf_counter() - reconcile_start)
+        log.info("Account balance reconciled. New account balance: {}".format(balances))
+        if self.on_reconciled is not None:
+            self.on_reconciled(balances)
+
+    @staticmethod
+    def __get_drift(expected_balance, reported_balance):
+        return max([abs(amount - expected_balance.get(currency, 0)) /
+                    max(abs(expected_balance.get(currency, 0)), MIN_DRIFT_BASE)
+                    for currency, amount in reported_balance.items()] or [0])
+
+    def request_reconcile(self):
+        self.reconcile_requested.set()
+
+    """
+        Keep reconciling in a daemon thread: at once, then whenever requested, and regularly while drifted. Exchanges
+        are not traded until their first reconciliation, so the caller does not wait for it.
+    """
+    def start(self):
+        self.reconcile_requested.set()
+
+        def reconcile_on_request():
+            while True:
+                self.reconcile_requested.wait(DRIFT_RECHECK_INTERVAL if self.drifted_exchanges else None)
+                self.reconcile_requested.clear()
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    log.error("Failed to reconcile account balance. (Error: {})".format(e))
+
+        self.reconcile_thread = threading.Thread(target=reconcile_on_request, name="balance-reconcile", daemon=True)
+        self.reconcile_thread.start()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,260 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+from data import marketmakerexchange
+from metrics import metricsregistry
+from trading import ordergateway
+from trading import rounding
+
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+BIDS = marketmakerexchange.BIDS
+ASKS = marketmakerexchange.ASKS
+
+# Largest price concession of a hedge, relative to the price of the leg it replaces.
+SLIPPAGE_BUDGET = 0.005
+# Seconds after which a leg still open while its siblings filled is cancelled and hedged.
+FILL_DEADLINE = 3
+MAX_HEDGE_ATTEMPTS = 3
+RECOVERY_WORKERS = 4
+CANCEL_TIMEOUT = 5
+# Hedges below this volume are not worth an order.
+MIN_HEDGE_VOLUME = 1e-6
+
+log = logging.getLogger(__name__)
+
+
+class LegRecovery(object):
+    """
+        Recovery of arbitrage legs left one-sided, in background threads, as soon as the legs are acknowledged:
+        - When some legs of a group failed, each failed leg not found among its exchange's orders and fills is placed
+          again on the exchange at the current best price within the slippage budget, retried on fresh order books.
+          If no hedge can be placed, the surviving legs are cancelled instead, and the remaining exposure is notified.
+        - When all legs were placed, the group is checked once the fill deadline passed. Legs still open while a
+          sibling filled are cancelled, and their unfilled volume is hedged the same way.
+        Hedges go through the order gateway and are recorded into the balance ledger, the order tracker and the risk
+        engine; they are not subject to the risk limits, which would otherwise block them once the kill switch tripped.
+        get_top_of_book(exchange name, market) returns {BIDS, ASKS} as [price, volume], and get_price_decimals(market)
+        the decimal places of its prices. Nothing is recovered until start().
+    """
+    def __init__(self, order_gateway, order_tracker, balance_ledger, risk_engine, get_top_of_book, get_price_decimals,
+                 notify, slippage_budget=SLIPPAGE_BUDGET, fill_deadline=FILL_DEADLINE):
+        self.order_gateway = order_gateway
+        self.order_tracker = order_tracker
+        self.balance_ledger = balance_ledger
+        self.risk_engine = risk_engine
+        self.get_top_of_book = get_top_of_book
+        self.get_price_decimals = get_price_decimals
+        self.notify = notify
+        self.slippage_budget = slippage_budget
+        self.fill_deadline = fill_deadline
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=RECOVERY_WORKERS,
+                                                              thread_name_prefix="leg-recovery")
+        # Cancellations wait in the recovery threads, so they get threads of their own.
+        self.cancel_executor = concurrent.futures.ThreadPoolExecutor(max_workers=RECOVERY_WORKERS,
+                                                                     thread_name_prefix="leg-recovery-cancel")
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+    """
+        exceptions and tracked_orders are those of the submitted legs, None for the failed legs in the latter.
+        Return the future of the recovery, or None if the group needs none.
+    """
+    def on_legs_submitted(self, legs, exceptions, tracked_orders):
+        if not self.started:
+            return None
+        placed = [exception is None for exception in exceptions]
+        if all(placed):
+            if len(legs) < 2:
+                return None
+            timer = threading.Timer(self.fill_deadline, self.__submit, args=(self.check_fills, legs, tracked_orders))
+            timer.daemon = True
+            timer.start()
+            return timer
+        if not any(placed):
+            return None
+        return self.__submit(self.recover_failed_legs, legs, exceptions, tracked_orders)
+
+    def __submit(self, recovery, *args):
+        try:
+            return self.executor.submit(self.__run, recovery, *args)
+        except RuntimeError as e:
+            # Shut down meanwhile.
+            log.warning("Leg recovery not run. (Error: {})".format(e))
+            return None
+
+    def __run(self, recovery, *args):
+        recovery_start = time.perf_counter()
+        try:
+            recovery(*args)
+        except Exception as e:
+            log.error("Leg recovery failed. (Error: {})".format(e))
+            self.notify("Leg recovery failed: {}".format(e))
+        finally:
+            metricsregistry.registry.record("recovery.latency", time.perf_counter() - recovery_start)
+
+    def recover_failed_legs(self, legs, exceptions, tracked_orders):
+        failed_legs = [leg for leg, exception in zip(legs, exceptions) if exception is not None]
+        surviving = [(leg, tracked_order) for leg, tracked_order in zip(legs, tracked_orders)
+                     if tracked_order is not None]
+        # A failed leg may have been placed all the same, e.g. when only its acknowledgement timed out. Legs which
+        # cannot be looked up are not placed again either.
+        lookups = [self.__find_placed_order(leg) for leg in failed_legs]
+        unhedged_legs = [leg for leg, placed in zip(failed_legs, lookups) if placed is None]
+        unhedged_legs += self.hedge([leg for leg, placed in zip(failed_legs, lookups) if placed is False])
+        if not unhedged_legs:
+            for leg, tracked_order in surviving:
+                self.risk_engine.resolve_unhedged(leg)
+            return
+        cancelled = self.cancel([tracked_order for leg, tracked_order in surviving])
+        for (leg, tracked_order), was_cancelled in zip(surviving, cancelled):
+            if was_cancelled:
+                self.risk_engine.resolve_unhedged(leg)
+        self.__notify_unhedged(unhedged_legs, cancelled)
+
+    # Return True if the failed leg's order is found on its exchange, False if not, None if it cannot be looked up.
+    def __find_placed_order(self, leg):
+        exchange_name = leg.exchange.get_exchange_name()
+        try:
+            order_id = self.order_tracker.find_untracked_order(exchange_name, leg.market, leg.order_type, leg.price)
+        except Exception as e:
+            log.error("Failed to look up the {} order of a failed leg. (Error: {})".format(exchange_name, e))
+            return None
+        if order_id is None:
+            return False
+        # The leg was taken back when it failed; it is counted again as placed.
+        self.risk_engine.record_hedge(leg, reason="placed despite failure")
+        self.balance_ledger.record_order(exchange_name, leg.order_type, leg.price, leg.volume, leg.market)
+        self.order_tracker.track(exchange_name, order_id, leg.order_type, leg.price, leg.volume, leg.market)
+        metricsregistry.registry.increment("recovery.found")
+        log.warning("Failed {} {} leg order type {} at {} found placed as order {}."
+                    .format(exchange_name, leg.market, leg.order_type, leg.price, order_id))
+        return True
+
+    def check_fills(self, legs, tracked_orders):
+        if not any(tracked_order.filled_volume > 0 for tracked_order in tracked_orders):
+            return
+        open_pairs = [(leg, tracked_order) for leg, tracked_order in zip(legs, tracked_orders)
+                      if tracked_order.is_open()]
+        if not open_pairs:
+            return
+        log.warning("{} of {} arbitrage legs unfilled after {} s, cancelling and hedging them."
+                    .format(len(open_pairs), len(legs), self.fill_deadline))
+        cancelled = self.cancel([tracked_order for leg, tracked_order in open_pairs])
+        # Fills between the last poll and the cancellations are not hedged again: the volume left is read once the
+        # cancelled orders are closed. Orders whose exchange could not be polled stay open and are not hedged.
+        self.order_tracker.poll()
+        closed_pairs = [(leg, tracked_order) for (leg, tracked_order), was_cancelled in zip(open_pairs, cancelled)
+                        if was_cancelled and not tracked_order.is_open()]
+        # The cancelled remainders are taken back, and placed again by the hedges.
+        remainders = [ordergateway.OrderLeg(leg.exchange, leg.order_type, leg.price,
+                                            tracked_order.volume - tracked_order.filled_volume, leg.market)
+                      for leg, tracked_order in closed_pairs]
+        remainders = [remainder for remainder in remainders if remainder.volume >= MIN_HEDGE_VOLUME]
+        for remainder in remainders:
+            self.risk_engine.record_hedge(remainder, -1)
+            self.balance_ledger.revert_order(remainder.exchange.get_exchange_name(), remainder.order_type,
+                                             remainder.price, remainder.volume, remainder.market)
+        unhedged_legs = self.hedge(remainders)
+        if unhedged_legs or len(closed_pairs) < len(open_pairs):
+            self.__notify_unhedged(unhedged_legs, cancelled)
+
+    """
+        Place every leg again on its exchange, at the best price within the slippage budget of its own price, all at
+        once. Legs which failed are retried on fresh order books. Return the legs left unhedged.
+    """
+    def hedge(self, legs):
+        pending_legs = list(legs)
+        for attempt in range(MAX_HEDGE_ATTEMPTS):
+            hedges = []
+            for leg in pending_legs:
+                price = self.get_hedge_price(leg)
+                if price is None:
+                    log.warning("No {} {} price within the slippage budget of {}."
+                                .format(leg.exchange.get_exchange_name(), leg.market, leg.price))
+                    continue
+                hedges.append((leg, ordergateway.OrderLeg(leg.exchange, leg.order_type, price, leg.volume,
+                                                          leg.market)))
+            if not hedges:
+                break
+            for leg, hedge in hedges:
+                self.risk_engine.record_hedge(hedge)
+                self.balance_ledger.record_order(hedge.exchange.get_exchange_name(), hedge.order_type, hedge.price,
+                                                 hedge.volume, hedge.market)
+            futures = self.order_gateway.submit_legs([hedge for leg, hedge in hedges])
+            for (leg, hedge), future in zip(hedges, futures):
+                exchange_name = hedge.exchange.get_exchange_name()
+                exception = future.exception()
+                if exception is None:
+                    pending_legs.remove(leg)
+                    self.order_tracker.track(exchange_name, hedge.order_id, hedge.order_type, hedge.price,
+                                             hedge.volume, hedge.market)
+                    metricsregistry.registry.increment("recovery.hedged")
+                    log.info("Hedged {} {} order type {} at {} (instead of {}), volume: {}."
+                             .format(exchange_name, hedge.market, hedge.order_type, hedge.price, leg.price,
+                                     hedge.volume))
+                else:
+                    self.risk_engine.record_hedge(hedge, -1)
+                    self.balance_ledger.revert_order(exchange_name, hedge.order_type, hedge.price, hedge.volume,
+                                                     hedge.market)
+                    log.error("Failed to hedge on {} (attempt {}). Error: {}.".format(exchange_name, attempt + 1,
+                                                                                     exception))
+            if not pending_legs:
+                break
+        self.balance_ledger.request_reconcile()
+        return pending_legs
+
+    # Best price of the leg's exchange on the side it takes, if within the slippage budget of the leg's price.
+    def get_hedge_price(self, leg):
+        top_of_book = self.get_top_of_book(leg.exchange.get_exchange_name(), leg.market)
+        if top_of_book is None:
+            return None
+        decimals = self.get_price_decimals(leg.market)
+        if leg.order_type == BUY_ORDER:
+            price = top_of_book[ASKS][0]
+            if 0 < price <= leg.price * (1 + self.slippage_budget):
+                return rounding.round_up(price, decimals)
+        else:
+            price = top_of_book[BIDS][0]
+            if price >= leg.price * (1 - self.slippage_budget) and price > 0:
+                return rounding.round_down(price, decimals)
+        return None
+
+    # Cancel the tracked orders concurrently. Return whether each cancellation was accepted.
+    def cancel(self, tracked_orders):
+        futures = [self.cancel_executor.submit(self.__cancel, tracked_order)
+                   if tracked_order.order_id is not None else None for tracked_order in tracked_orders]
+        cancelled = []
+        for tracked_order, future in zip(tracked_orders, futures):
+            try:
+                if future is None:
+                    raise ValueError("order id unknown")
+                future.result(CANCEL_TIMEOUT)
+                tracked_order.cancel_requested = True
+                metricsregistry.registry.increment("recovery.cancelled")
+                log.warning("Cancelled {} order {}.".format(tracked_order.exchange_name, tracked_order.order_id))
+                cancelled.append(True)
+            except Exception as e:
+                log.error("Failed to cancel {} order {}. (Error: {})".format(tracked_order.exchange_name,
+                                                                            tracked_order.order_id, e))
+                cancelled.append(False)
+        self.order_tracker.poll_requested.set()
+        return cancelled
+
+    def __cancel(self, tracked_order):
+        exchange = self.order_tracker.exchanges_dict[tracked_order.exchange_name]
+        exchange.cancel_order(tracked_order.order_id, tracked_order.market)
+
+    def __notify_unhedged(self, unhedged_legs, cancelled):
+        self.notify("Arbitrage legs left one-sided: {} unhedged, {} of {} cancellations accepted.\n{}"
+                    .format(len(unhedged_legs), sum(cancelled), len(cancelled),
+                            "\n".join("{} {} order type {} at {}, volume: {}"
+                                      .format(leg.exchange.get_exchange_name(), leg.market, leg.order_type, leg.price,
+                                              leg.volume) for leg in unhedged_legs)))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.cancel_executor.shutdown(wait=False)
@@ -0,0 +1,101 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+from data import marketmakerexchange
+from metrics import metricsregistry
+
+# Legs still waiting for their siblings after this many seconds are fired anyway.
+LEG_RELEASE_TIMEOUT = 1
+
+log = logging.getLogger(__name__)
+
+
+class OrderLeg(object):
+    # order_type 1 for biding, 2 for asking.
+    def __init__(self, exchange, order_type, price, volume, market=marketmakerexchange.MARKET):
+        self.exchange = exchange
+        self.market = market
+        self.order_type = order_type
+        self.price = price
+        self.volume = volume
+        # Id of the placed order, if the exchange returned one.
+        self.order_id = None
+        # perf_counter timestamps of the submission and of the exchange's acknowledgement.
+        self.submit_time = None
+        self.ack_time = None
+
+    @property
+    def latency(self):
+        if self.submit_time is None or self.ack_time is None:
+            return None
+        return self.ack_time - self.submit_time
+
+
+class OrderGateway(object):
+    """
+        Long-lived pool of order submission threads. Threads are started and their exchange connections opened when the
+        gateway is created, so that an arbitrage does not pay for thread or connection setup.
+        The legs of an arbitrage wait on a barrier in their worker threads and are released together, which keeps the
+        skew between them down to thread wake-up time.
+    """
+    def __init__(self, exchanges, max_workers=None):
+        self.exchanges = list(exchanges)
+        self.max_workers = max_workers or max(2, 2 * len(self.exchanges))
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                              thread_name_prefix="order-gateway")
+        self.__warm_up()
+
+    """
+        Run one warm-up task on every worker thread. The barrier keeps each thread busy until all threads are started.
+        The gateway does not wait for the warm-up: legs submitted meanwhile are queued behind it.
+    """
+    def __warm_up(self):
+        barrier = threading.Barrier(self.max_workers)
+        for _ in range(self.max_workers):
+            self.executor.submit(self.__warm_up_thread, barrier).add_done_callback(self.__log_warm_up_failure)
+
+    @staticmethod
+    def __log_warm_up_failure(future):
+        exception = future.exception()
+        if exception is not None:
+            log.warning("Failed to warm up order gateway thread. (Error: {})".format(exception))
+
+    def __warm_up_thread(self, barrier):
+        barrier.wait(LEG_RELEASE_TIMEOUT)
+        for exchange in self.exchanges:
+            exchange.warm_up()
+
+    """
+        Submit all legs at once. Return one future per leg; each future resolves to its leg once acknowledged by the
+        exchange, or raises the exchange's exception.
+    """
+    def submit_legs(self, legs):
+        barrier = threading.Barrier(len(legs))
+        return [self.executor.submit(self.__submit_leg, leg, barrier) for leg in legs]
+
+    @staticmethod
+    def __submit_leg(leg, barrier):
+        try:
+            barrier.wait(LEG_RELEASE_TIMEOUT)
+        except threading.BrokenBarrierError:
+            log.warning("Order leg released before its siblings were ready.")
+        leg.submit_time = time.perf_counter()
+        try:
+            leg.order_id = leg.exchange.submit_arbitrage_order(leg.order_type, leg.price, leg.volume, leg.market)
+        finally:
+            leg.ack_time = time.perf_counter()
+            metricsregistry.registry.record("order.ack." + leg.exchange.get_exchange_name(), leg.latency)
+        log.info("Order leg acknowledged by {} in {:.2f} ms."
+                 .format(leg.exchange.get_exchange_name(), leg.latency * 1000))
+        return leg
+
+    # Submit skew between legs that were fired together, in seconds.
+    @staticmethod
+    def get_skew(legs):
+        submit_times = [leg.submit_time for leg in legs if leg.submit_time is not None]
+        return max(submit_times) - min(submit_times) if submit_times else 0
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
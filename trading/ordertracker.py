@@ -0,0 +1,227 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+from data import marketmakerexchange
+from metrics import metricsregistry
+
+MARKET = marketmakerexchange.MARKET
+
+PENDING = "pending"
+PARTIALLY_FILLED = "partially_filled"
+FILLED = "filled"
+CANCELLED = "cancelled"
+OPEN_STATES = {PENDING, PARTIALLY_FILLED}
+
+# Poll every second while orders are open, and every 30 seconds otherwise.
+ACTIVE_POLL_INTERVAL = 1
+IDLE_POLL_INTERVAL = 30
+# Orders still open after this many seconds are cancelled.
+STALE_ORDER_TIMEOUT = 30
+POLL_TIMEOUT = 10
+# Orders placed without an id are matched to an open order of the same type within this price distance.
+PRICE_MATCH_TOLERANCE = 0.00005
+
+log = logging.getLogger(__name__)
+
+
+class TrackedOrder(object):
+    def __init__(self, exchange_name, order_id, order_type, price, volume, submit_time, market=MARKET):
+        self.exchange_name = exchange_name
+        self.market = market
+        # None until the order is found among the exchange's open orders, for exchanges which do not return ids.
+        self.order_id = order_id
+        self.order_type = order_type
+        self.price = price
+        self.volume = volume
+        self.filled_volume = 0
+        self.state = PENDING
+        self.submit_time = submit_time
+        self.cancel_requested = False
+
+    def is_open(self):
+        return self.state in OPEN_STATES
+
+
+class OrderTracker(object):
+    """
+        In-memory index of the orders placed by the maker and of their state. A daemon thread polls the open orders and
+        trade histories of all exchanges concurrently, every ACTIVE_POLL_INTERVAL while orders are open and every
+        IDLE_POLL_INTERVAL otherwise, and cancels orders left open longer than the stale order timeout.
+        Open orders which were not placed by the maker, such as manual ones, count as open as well.
+        markets gives the markets polled on each exchange, {exchange name: [market]}; MARKET only by default.
+    """
+    def __init__(self, exchanges_dict, stale_order_timeout=STALE_ORDER_TIMEOUT, clock=time.time, markets=None):
+        self.exchanges_dict = exchanges_dict
+        self.stale_order_timeout = stale_order_timeout
+        self.clock = clock
+        if markets is None:
+            markets = {exchange_name: [MARKET] for exchange_name in exchanges_dict}
+        self.books = [(exchange_name, market) for exchange_name in exchanges_dict for market in markets[exchange_name]]
+        self.orders = []
+        self.foreign_order_counts = {book: 0 for book in self.books}
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()
+        self.poll_requested = threading.Event()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, 2 * len(self.books)),
+                                                              thread_name_prefix="order-tracker")
+        self.poll_thread = None
+
+    def track(self, exchange_name, order_id, order_type, price, volume, market=MARKET):
+        order = TrackedOrder(exchange_name, order_id, order_type, price, volume, self.clock(), market)
+        with self.lock:
+            self.orders.append(order)
+        self.poll_requested.set()
+        return order
+
+    # Open orders of the exchange in the market, of all markets if market is None, or of all exchanges.
+    def get_open_orders(self, exchange_name=None, market=None):
+        with self.lock:
+            return [order for order in self.orders
+                    if order.is_open() and (exchange_name is None or order.exchange_name == exchange_name) and
+                    (market is None or order.market == market)]
+
+    def has_open_orders(self, exchange_name, market=None):
+        has_foreign_orders = any(count > 0 for (name, book_market), count in self.foreign_order_counts.items()
+                                 if name == exchange_name and (market is None or book_market == market))
+        return has_foreign_orders or bool(self.get_open_orders(exchange_name, market))
+
+    """
+        Fetch the open orders and trades of every exchange and market at once, update the state of the tracked orders,
+        and cancel the stale ones. Orders of an exchange and market which cannot be polled keep their state, and so do
+        orders tracked once the fetch started, which it may have missed: they are judged on the next poll.
+    """
+    def poll(self):
+        # Polls of the background thread and of callers such as the leg recovery run one at a time, so that they
+        # neither cancel the same stale order twice nor overwrite each other's results with older fetches.
+        with self.poll_lock:
+            poll_start = time.perf_counter()
+            with self.lock:
+                polled_orders = set(self.orders)
+            futures = {(exchange_name, market): (
+                           self.executor.submit(self.exchanges_dict[exchange_name].list_my_orders, market),
+                           self.executor.submit(self.exchanges_dict[exchange_name].list_my_trades, market))
+                       for exchange_name, market in self.books}
+            for (exchange_name, market), (orders_future, trades_future) in futures.items():
+                try:
+                    open_orders = orders_future.result(POLL_TIMEOUT)
+                except Exception as e:
+                    log.error("Failed to list {} {} open orders. (Error: {})".format(exchange_name, market, e))
+                    continue
+                try:
+                    trades = trades_future.result(POLL_TIMEOUT)
+                except Exception as e:
+                    log.warning("Failed to list {} {} trades. (Error: {})".format(exchange_name, market, e))
+                    trades = []
+                with self.lock:
+                    self.__update_exchange_orders(exchange_name, market, open_orders, trades, polled_orders)
+
+            self.__cancel_stale_orders()
+            with self.lock:
+                # Closed orders are kept only until they are out of the polling window.
+                self.orders = [order for order in self.orders if order.is_open() or
+                               self.clock() - order.submit_time < self.stale_order_timeout]
+            metricsregistry.registry.record("orders.poll", time.perf_counter() - poll_start)
+
+    def __update_exchange_orders(self, exchange_name, market, open_orders, trades, polled_orders):
+        open_orders_by_id = {open_order.order_id: open_order for open_order in open_orders}
+        filled_volumes = {}
+        for trade in trades:
+            filled_volumes[trade.order_id] = filled_volumes.get(trade.order_id, 0) + trade.volume
+
+        tracked_orders = [order for order in self.orders
+                          if order.exchange_name == exchange_name and order.market == market and order.is_open() and
+                          order in polled_orders]
+        for order in tracked_orders:
+            if order.order_id is None:
+                order.order_id = self.__match_order_id(order, open_orders_by_id, tracked_orders)
+            open_order = open_orders_by_id.get(order.order_id) if order.order_id is not None else None
+            if open_order is not None:
+                order.filled_volume = max(order.volume - open_order.remaining_volume,
+                                          filled_volumes.get(order.order_id, 0))
+                order.state = PARTIALLY_FILLED if order.filled_volume > 0 else PENDING
+            elif order.cancel_requested:
+                order.filled_volume = max(order.filled_volume, filled_volumes.get(order.order_id, 0))
+                order.state = CANCELLED
+            else:
+                order.filled_volume = order.volume
+                order.state = FILLED
+            if not order.is_open():
+                log.info("{} order {} {}, filled {} of {}.".format(exchange_name, order.order_id, order.state,
+                                                                  order.filled_volume, order.volume))
+
+        tracked_ids = {order.order_id for order in self.orders
+                       if order.exchange_name == exchange_name and order.market == market}
+        self.foreign_order_counts[(exchange_name, market)] = len(open_orders_by_id.keys() - tracked_ids)
+
+    """
+        Look for an order matching the type and price among the exchange's open orders and its fills within the stale
+        order timeout, which the tracker does not know about: an order whose submission failed, for example by timing
+        out, may have been placed all the same. Return its id, or None. Errors of the exchange are raised.
+    """
+    def find_untracked_order(self, exchange_name, market, order_type, price):
+        exchange = self.exchanges_dict[exchange_name]
+        open_orders = exchange.list_my_orders(market)
+        trades = exchange.list_my_trades(market)
+        current_time = self.clock()
+        with self.lock:
+            tracked_ids = {order.order_id for order in self.orders
+                           if order.exchange_name == exchange_name and order.market == market}
+        for open_order in open_orders:
+            if open_order.order_id not in tracked_ids and open_order.order_type == order_type and \
+                    abs(open_order.price - price) <= PRICE_MATCH_TOLERANCE:
+                return open_order.order_id
+        for trade in trades:
+            if trade.order_id not in tracked_ids and trade.order_type == order_type and trade.price is not None and \
+                    abs(trade.price - price) <= PRICE_MATCH_TOLERANCE and trade.trade_time is not None and \
+                    current_time - trade.trade_time < self.stale_order_timeout:
+                return trade.order_id
+        return None
+
+    @staticmethod
+    def __match_order_id(order, open_orders_by_id, tracked_orders):
+        tracked_ids = {tracked_order.order_id for tracked_order in tracked_orders}
+        for order_id, open_order in open_orders_by_id.items():
+            if order_id not in tracked_ids and open_order.order_type == order.order_type and \
+                    abs(open_order.price - order.price) <= PRICE_MATCH_TOLERANCE:
+                return order_id
+        return None
+
+    def __cancel_stale_orders(self):
+        current_time = self.clock()
+        with self.lock:
+            stale_orders = [order for order in self.orders
+                            if order.is_open() and not order.cancel_requested and order.order_id is not None and
+                            current_time - order.submit_time > self.stale_order_timeout]
+        futures = [(order, self.executor.submit(self.exchanges_dict[order.exchange_name].cancel_order, order.order_id,
+                                                order.market))
+                   for order in stale_orders]
+        for order, future in futures:
+            try:
+                future.result(POLL_TIMEOUT)
+                order.cancel_requested = True
+                log.warning("Cancelled stale {} order {} placed {:.0f} seconds ago."
+                            .format(order.exchange_name, order.order_id, current_time - order.submit_time))
+            except Exception as e:
+                log.error("Failed to cancel {} order {}. (Error: {})".format(order.exchange_name, order.order_id, e))
+        if stale_orders:
+            self.poll_requested.set()
+
+    # Poll in a daemon thread, quickly while orders are open and rarely otherwise. track() triggers a poll at once.
+    def start(self):
+        def poll_forever():
+            while True:
+                self.poll_requested.clear()
+                try:
+                    self.poll()
+                except Exception as e:
+                    log.error("Failed to poll orders. (Error: {})".format(e))
+                active = any(self.foreign_order_counts.values()) or bool(self.get_open_orders())
+                self.poll_requested.wait(ACTIVE_POLL_INTERVAL if active else IDLE_POLL_INTERVAL)
+
+        self.poll_thread = threading.Thread(target=poll_forever, name="order-tracker", daemon=True)
+        self.poll_thread.start()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
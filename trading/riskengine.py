@@ -0,0 +1,321 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+from data import marketmakerexchange
+from metrics import metricsregistry
+
+CNY = marketmakerexchange.CNY
+BTS = marketmakerexchange.BTS
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+
+# Limits by currency; currencies without a limit are not limited.
+# Largest change of a currency's holdings on one venue from the baseline, in either direction.
+MAX_VENUE_INVENTORY = {CNY: 100000, BTS: 500000}
+# Largest change of a currency's holdings summed over all venues. Arbitrages move inventory between venues, so only
+# withdrawal fees and one-sided fills add up to it.
+MAX_NET_EXPOSURE = {CNY: 20000, BTS: 50000}
+# Largest notional ordered within the rolling window, by quote currency.
+MAX_ROLLING_NOTIONAL = {CNY: 500000}
+MAX_ORDERS_PER_WINDOW = 120
+ROLLING_WINDOW = 60
+# Largest notional of placed legs whose sibling legs failed, by quote currency. Past it, the kill switch trips.
+MAX_UNHEDGED_EXPOSURE = {CNY: 10000}
+
+# Audit entries waiting for the writer thread. The oldest entries are dropped past this, e.g. before start().
+MAX_PENDING_AUDIT_ENTRIES = 100000
+AUDIT_FLUSH_INTERVAL = 0.5
+
+log = logging.getLogger(__name__)
+
+
+class RiskLimits(object):
+    def __init__(self, max_venue_inventory=None, max_net_exposure=None, max_rolling_notional=None,
+                 max_orders_per_window=MAX_ORDERS_PER_WINDOW, rolling_window=ROLLING_WINDOW,
+                 max_unhedged_exposure=None):
+        self.max_venue_inventory = MAX_VENUE_INVENTORY if max_venue_inventory is None else max_venue_inventory
+        self.max_net_exposure = MAX_NET_EXPOSURE if max_net_exposure is None else max_net_exposure
+        self.max_rolling_notional = MAX_ROLLING_NOTIONAL if max_rolling_notional is None else max_rolling_notional
+        self.max_orders_per_window = max_orders_per_window
+        self.rolling_window = rolling_window
+        self.max_unhedged_exposure = MAX_UNHEDGED_EXPOSURE if max_unhedged_exposure is None else max_unhedged_exposure
+
+
+class RollingCounter(object):
+    """
+        Sum of the amounts added within the last window seconds, in one-second buckets. Buckets are cleared as time
+        moves on, at most window of them per call, so reads and adds take constant time.
+    """
+    def __init__(self, window):
+        self.buckets = [0] * window
+        self.total = 0
+        self.second = None
+
+    def get(self, current_time):
+        self.__advance(int(current_time))
+        return self.total
+
+    def add(self, current_time, amount):
+        self.__advance(int(current_time))
+        self.buckets[self.second % len(self.buckets)] += amount
+        self.total += amount
+
+    def __advance(self, second):
+        if self.second is None or second - self.second >= len(self.buckets):
+            self.buckets = [0] * len(self.buckets)
+            self.total = 0
+        elif second > self.second:
+            for passed_second in range(self.second + 1, second + 1):
+                index = passed_second % len(self.buckets)
+                self.total -= self.buckets[index]
+                self.buckets[index] = 0
+        self.second = second if self.second is None else max(self.second, second)
+
+
+class RiskDecision(object):
+    def __init__(self, approved, reason=None):
+        self.approved = approved
+        self.reason = reason
+
+    def __bool__(self):
+        return self.approved
+
+
+APPROVED = RiskDecision(True)
+
+
+class AuditLog(object):
+    """
+        Every decision of the risk engine as a JSON line: time, approved, reason and the legs as [exchange, market,
+        order type, price, volume]. Recording appends a tuple to a deque; a background thread encodes and writes the
+        entries, so that the order path does not wait for the file.
+    """
+    def __init__(self, max_pending_entries=MAX_PENDING_AUDIT_ENTRIES):
+        self.entries = collections.deque(maxlen=max_pending_entries)
+        self.path = None
+        self.writer_thread = None
+        self.stopped = threading.Event()
+
+    def record(self, decision_time, approved, reason, legs):
+        self.entries.append((decision_time, approved, reason, legs))
+
+    def start(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.writer_thread = threading.Thread(target=self.__write_forever, name="risk-audit", daemon=True)
+        self.writer_thread.start()
+
+    def close(self):
+        self.stopped.set()
+        if self.writer_thread is not None:
+            self.writer_thread.join()
+
+    def __write_forever(self):
+        with open(self.path, "a") as audit_file:
+            while not self.stopped.wait(AUDIT_FLUSH_INTERVAL):
+                self.__flush(audit_file)
+            self.__flush(audit_file)
+
+    def __flush(self, audit_file):
+        lines = []
+        while self.entries:
+            decision_time, approved, reason, legs = self.entries.popleft()
+            lines.append(json.dumps({'time': decision_time, 'approved': approved, 'reason': reason, 'legs': legs}))
+        if lines:
+            audit_file.write("\n".join(lines) + "\n")
+            audit_file.flush()
+
+
+class RiskEngine(object):
+    """
+        Pre-trade checks of every group of order legs against in-memory counters: the inventory change of every
+        venue and in total, the notional and the number of orders within the rolling window, and the notional of
+        unhedged legs. Approved legs are counted at once, as if placed; on_legs_submitted takes back the inventory
+        change of the legs that failed, and counts the placed legs of a partially failed group as unhedged until
+        resolve_unhedged is called for them.
+        Inventory changes are measured from the baseline holdings, {exchange name: {currency: amount}}. rebase() sets
+        them from reconciled balances, so that fills, fees, withdrawals and transfers between venues are accounted
+        for; holdings missing from the baseline are taken from the first balances rebased.
+        The kill switch rejects every leg until resume() or reset(). It trips on its own when the unhedged exposure
+        exceeds its limit, and calls on_kill with the reason. Every decision goes to the audit log.
+        Legs have exchange, order_type, price, volume and market, like ordergateway.OrderLeg. Times come from clock, in
+        seconds.
+    """
+    def __init__(self, limits=None, clock=time.time, on_kill=None, baseline=None):
+        self.limits = limits or RiskLimits()
+        self.clock = clock
+        self.on_kill = on_kill
+        self.baseline = {exchange_name: dict(balance) for exchange_name, balance in (baseline or {}).items()}
+        # {(exchange name, currency): holdings change from the baseline}
+        self.venue_inventory = {}
+        # {currency: holdings change summed over the venues}
+        self.net_exposure = {}
+        self.rolling_notional = {}
+        self.order_count = RollingCounter(self.limits.rolling_window)
+        # {quote currency: notional of the unhedged legs}
+        self.unhedged_exposure = {}
+        self.kill_reason = None
+        self.audit_log = AuditLog()
+        self.lock = threading.Lock()
+
+    def is_killed(self):
+        return self.kill_reason is not None
+
+    def kill(self, reason):
+        with self.lock:
+            if self.kill_reason is not None:
+                return
+            self.kill_reason = reason
+            self.audit_log.record(self.clock(), False, "kill switch: " + reason, [])
+        metricsregistry.registry.increment("risk.kill")
+        log.critical("Risk kill switch tripped: {}".format(reason))
+        if self.on_kill is not None:
+            self.on_kill(reason)
+
+    def resume(self):
+        with self.lock:
+            self.kill_reason = None
+            self.audit_log.record(self.clock(), True, "resumed", [])
+        log.warning("Risk kill switch reset.")
+
+    """
+        Clear the kill switch and the unhedged exposure, and measure inventory changes from the balances of the next
+        rebase, for operators who checked the accounts.
+    """
+    def reset(self):
+        with self.lock:
+            self.kill_reason = None
+            self.unhedged_exposure = {}
+            self.baseline = {}
+            self.audit_log.record(self.clock(), True, "reset", [])
+        log.warning("Risk engine reset; the next reconciled balances are the new baseline.")
+
+    # Replace the inventory counters with the change of the reconciled balances, {exchange name: {currency: amount}}.
+    def rebase(self, balances):
+        with self.lock:
+            for exchange_name, balance in balances.items():
+                baseline = self.baseline.setdefault(exchange_name, {})
+                for currency, amount in balance.items():
+                    self.venue_inventory[(exchange_name, currency)] = amount - baseline.setdefault(currency, amount)
+            self.net_exposure = {}
+            for (exchange_name, currency), amount in self.venue_inventory.items():
+                self.net_exposure[currency] = self.net_exposure.get(currency, 0) + amount
+
+    # Check the legs against every limit, and count them if they are approved.
+    def check(self, legs):
+        current_time = self.clock()
+        with self.lock:
+            decision = self.__check(legs, current_time)
+            if decision.approved:
+                for leg in legs:
+                    self.__apply_inventory(leg, 1)
+                    quote = marketmakerexchange.get_market_currencies(leg.market)[1]
+                    self.__get_rolling_notional(quote).add(current_time, leg.price * leg.volume)
+                self.order_count.add(current_time, len(legs))
+            self.audit_log.record(current_time, decision.approved, decision.reason,
+                                  [(leg.exchange.get_exchange_name(), leg.market, leg.order_type, leg.price,
+                                    leg.volume) for leg in legs])
+        if not decision.approved:
+            metricsregistry.registry.increment("risk.rejected")
+        return decision
+
+    # exceptions of the submitted legs, None for the legs placed. Return the notional of the legs left unhedged.
+    def on_legs_submitted(self, legs, exceptions):
+        unhedged = 0
+        over_limit = None
+        with self.lock:
+            placed_legs = [leg for leg, exception in zip(legs, exceptions) if exception is None]
+            for leg, exception in zip(legs, exceptions):
+                if exception is not None:
+                    self.__apply_inventory(leg, -1)
+            if len(placed_legs) == len(legs) or not placed_legs:
+                return 0
+            for leg in placed_legs:
+                quote = marketmakerexchange.get_market_currencies(leg.market)[1]
+                notional = leg.price * leg.volume
+                unhedged += notional
+                self.unhedged_exposure[quote] = self.unhedged_exposure.get(quote, 0) + notional
+                limit = self.limits.max_unhedged_exposure.get(quote)
+                if limit is not None and self.unhedged_exposure[quote] > limit:
+                    over_limit = "unhedged {} exposure {:.2f} over {}".format(quote, self.unhedged_exposure[quote],
+                                                                            limit)
+        if over_limit is not None:
+            self.kill(over_limit)
+        return unhedged
+
+    """
+        Count a hedge of unhedged legs, or take it back with sign -1, without checking it against the limits. reason
+        goes to the audit log.
+    """
+    def record_hedge(self, leg, sign=1, reason="hedge"):
+        with self.lock:
+            self.__apply_inventory(leg, sign)
+            self.audit_log.record(self.clock(), True, reason if sign > 0 else reason + " reverted",
+                                  [(leg.exchange.get_exchange_name(), leg.market, leg.order_type, leg.price,
+                                    leg.volume)])
+
+    # The unhedged leg has been cancelled or hedged.
+    def resolve_unhedged(self, leg):
+        quote = marketmakerexchange.get_market_currencies(leg.market)[1]
+        with self.lock:
+            self.unhedged_exposure[quote] = max(0, self.unhedged_exposure.get(quote, 0) - leg.price * leg.volume)
+
+    def __check(self, legs, current_time):
+        if self.kill_reason is not None:
+            return RiskDecision(False, "kill switch: " + self.kill_reason)
+        limits = self.limits
+        if self.order_count.get(current_time) + len(legs) > limits.max_orders_per_window:
+            return RiskDecision(False, "over {} orders in {} s".format(limits.max_orders_per_window,
+                                                                      limits.rolling_window))
+        deltas = {}
+        notionals = {}
+        for leg in legs:
+            exchange_name = leg.exchange.get_exchange_name()
+            base, quote = marketmakerexchange.get_market_currencies(leg.market)
+            sign = 1 if leg.order_type == BUY_ORDER else -1
+            notional = leg.price * leg.volume
+            for key, amount in [((exchange_name, base), sign * leg.volume), ((exchange_name, quote), -sign * notional)]:
+                deltas[key] = deltas.get(key, 0) + amount
+            notionals[quote] = notionals.get(quote, 0) + notional
+
+        net_deltas = {}
+        for (exchange_name, currency), amount in deltas.items():
+            net_deltas[currency] = net_deltas.get(currency, 0) + amount
+            limit = limits.max_venue_inventory.get(currency)
+            inventory = self.venue_inventory.get((exchange_name, currency), 0) + amount
+            # Legs bringing the inventory back toward zero are always allowed.
+            if limit is not None and abs(inventory) > limit and abs(inventory) > abs(inventory - amount):
+                return RiskDecision(False, "{} {} inventory {:.2f} over {}".format(exchange_name, currency, inventory,
+                                                                                  limit))
+        for currency, amount in net_deltas.items():
+            limit = limits.max_net_exposure.get(currency)
+            exposure = self.net_exposure.get(currency, 0) + amount
+            if limit is not None and abs(exposure) > limit and abs(exposure) > abs(exposure - amount):
+                return RiskDecision(False, "net {} exposure {:.2f} over {}".format(currency, exposure, limit))
+        for currency, notional in notionals.items():
+            limit = limits.max_rolling_notional.get(currency)
+            if limit is not None and self.__get_rolling_notional(currency).get(current_time) + notional > limit:
+                return RiskDecision(False, "{} notional over {} in {} s".format(currency, limit,
+                                                                               limits.rolling_window))
+        return APPROVED
+
+    def __apply_inventory(self, leg, sign):
+        exchange_name = leg.exchange.get_exchange_name()
+        base, quote = marketmakerexchange.get_market_currencies(leg.market)
+        if leg.order_type != BUY_ORDER:
+            sign = -sign
+        for currency, amount in [(base, sign * leg.volume), (quote, -sign * leg.price * leg.volume)]:
+            key = (exchange_name, currency)
+            self.venue_inventory[key] = self.venue_inventory.get(key, 0) + amount
+            self.net_exposure[currency] = self.net_exposure.get(currency, 0) + amount
+
+    def __get_rolling_notional(self, currency):
+        counter = self.rolling_notional.get(currency)
+        if counter is None:
+            counter = self.rolling_notional.setdefault(currency, RollingCounter(self.limits.rolling_window))
+        return counter
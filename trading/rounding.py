@@ -0,0 +1,10 @@
+import math
+
+
+# Round to the given number of decimal places, for prices and volumes to be accepted by the exchanges.
+def round_up(value, decimal=0):
+    return math.ceil(value * (10 ** decimal)) / (10 ** decimal)
+
+
+def round_down(value, decimal=0):
+    return math.floor(value * (10 ** decimal)) / (10 ** decimal)
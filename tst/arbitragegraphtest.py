@@ -0,0 +1,84 @@
+import math
+import unittest
+
+from data import arbitragegraph
+
+BUY_ORDER = arbitragegraph.BUY_ORDER
+SELL_ORDER = arbitragegraph.SELL_ORDER
+
+
+def get_route(cycle):
+    return [(leg.exchange_name, leg.market, leg.order_type) for leg in cycle.legs]
+
+
+class ArbitrageGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = arbitragegraph.ArbitrageGraph()
+        self.graph.update_book("a", "BTS_CNY", [0.39, 1000], [0.40, 1000])
+        self.graph.update_book("a", "BTC_CNY", [19900, 1], [20000, 1])
+        self.graph.update_book("a", "BTS_BTC", [0.0000199, 100000], [0.0000200, 100000])
+
+    def test_consistent_prices_have_no_cycle(self):
+        self.assertEqual([], self.graph.find_cycles())
+
+    def test_direct_arbitrage(self):
+        self.graph.update_book("b", "BTS_CNY", [0.42, 500], [0.43, 1000])
+        cycles = self.graph.find_cycles()
+        self.assertEqual(1, len(cycles))
+        self.assertEqual({("a", "BTS_CNY", BUY_ORDER), ("b", "BTS_CNY", SELL_ORDER)}, set(get_route(cycles[0])))
+        self.assertAlmostEqual(0.42 / 0.40 - 1, cycles[0].profit)
+        self.assertEqual([], self.graph.find_cycles(min_legs=3))
+
+    def test_triangular_arbitrage(self):
+        # BTS is cheap in BTC: CNY buys BTC, BTC buys BTS, BTS sells for CNY.
+        self.graph.update_book("a", "BTS_BTC", [0.0000180, 100000], [0.0000181, 100000])
+        cycles = self.graph.find_cycles(min_legs=3)
+        self.assertEqual(1, len(cycles))
+        cycle = cycles[0]
+        self.assertEqual(3, len(cycle))
+        self.assertEqual({("a", "BTC_CNY", BUY_ORDER), ("a", "BTS_BTC", BUY_ORDER), ("a", "BTS_CNY", SELL_ORDER)},
+                         set(get_route(cycle)))
+        self.assertAlmostEqual(0.39 / 20000 / 0.0000181 - 1, cycle.profit)
+
+    def test_cycle_bounded_by_top_of_book(self):
+        self.graph.update_book("a", "BTS_BTC", [0.0000180, 100000], [0.0000181, 100000])
+        cycle = self.graph.find_cycles(min_legs=3)[0]
+        # Selling 1000 BTS at 0.39 bounds the cycle, whichever currency it starts from.
+        bts_amounts = [amount for leg, amount in zip(cycle.legs, cycle.leg_amounts) if leg.order_type == SELL_ORDER]
+        self.assertAlmostEqual(1000, bts_amounts[0])
+        for leg, amount in zip(cycle.legs, cycle.leg_amounts):
+            self.assertLessEqual(amount, leg.capacity * (1 + 1e-9))
+
+    def test_profit_deduction(self):
+        graph = arbitragegraph.ArbitrageGraph({"a": 0.1})
+        graph.update_book("a", "BTS_CNY", [0.39, 1000], [0.40, 1000])
+        graph.update_book("b", "BTS_CNY", [0.42, 500], [0.43, 1000])
+        self.assertEqual([], graph.find_cycles())
+
+    def test_cycle_disappears_when_book_updates(self):
+        self.graph.update_book("b", "BTS_CNY", [0.42, 500], [0.43, 1000])
+        self.assertEqual(1, len(self.graph.find_cycles()))
+        self.graph.update_book("b", "BTS_CNY", [0.38, 500], [0.41, 1000])
+        self.assertEqual([], self.graph.find_cycles())
+        self.graph.update_book("b", "BTS_CNY", [0.42, 500], [0.43, 1000])
+        self.graph.update_book("b", "BTS_CNY", None, None)
+        self.assertEqual([], self.graph.find_cycles())
+
+    def test_potentials_rebuilt_after_drift(self):
+        self.graph.update_book("b", "BTS_CNY", [0.42, 500], [0.43, 1000])
+        for currency in list(self.graph.potentials):
+            self.graph.potentials[currency] -= 2 * arbitragegraph.MAX_POTENTIAL_DRIFT
+        self.assertEqual(1, len(self.graph.find_cycles()))
+        self.assertGreater(min(self.graph.potentials.values()), -arbitragegraph.MAX_POTENTIAL_DRIFT)
+
+    def test_potentials_stay_feasible(self):
+        self.graph.update_book("b", "BTS_CNY", [0.42, 500], [0.43, 1000])
+        self.graph.update_book("a", "BTS_BTC", [0.0000180, 100000], [0.0000181, 100000])
+        self.graph.find_cycles()
+        for key, edge in self.graph.edges.items():
+            if key not in self.graph.deferred_keys:
+                self.assertGreaterEqual(self.graph.potentials[edge.source] + edge.weight -
+                                        self.graph.potentials[edge.target], -arbitragegraph.EPSILON)
+        self.assertTrue(math.isfinite(sum(self.graph.potentials.values())))
+
+unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from data import arbitragesizer
+from data import orderbook
+
+
+def make_side(descending, levels):
+    return orderbook.OrderBookSide.from_sorted_levels(descending, [level[0] for level in levels],
+                                                      [level[1] for level in levels])
+
+
+class ArbitrageSizerTest(unittest.TestCase):
+    def setUp(self):
+        self.asks = make_side(False, [[0.40, 1000], [0.41, 2000], [0.45, 5000]])
+        self.bids = make_side(True, [[0.44, 1500], [0.43, 3000], [0.39, 5000]])
+
+    def size(self, usable_cny=100000, usable_bts=100000, withdrawal_ratio=1, withdrawal_fee=0, listing_buffer=0):
+        return arbitragesizer.size_arbitrage(self.asks, self.bids, 0.01, withdrawal_ratio, withdrawal_fee,
+                                             usable_cny, usable_bts, 0, listing_buffer)
+
+    def test_walks_all_profitable_levels(self):
+        plan = self.size()
+        # 3000 profitable shares, less the 20% haircut.
+        self.assertAlmostEqual(2400, plan.purchase_volume)
+        self.assertEqual([[0.40, 1000], [0.41, 1400]], plan.purchase_levels)
+        self.assertEqual(0.41, plan.purchase_price)
+        self.assertEqual(0.43, plan.sell_price)
+        self.assertAlmostEqual(1000 * 0.40 + 1400 * 0.41, plan.cost)
+        self.assertAlmostEqual(1500 * 0.44 + 900 * 0.43, plan.revenue)
+
+    def test_listing_buffer_larger_than_haircut(self):
+        plan = self.size(listing_buffer=1000)
+        self.assertAlmostEqual(2000, plan.purchase_volume)
+
+    def test_capped_by_usable_cny(self):
+        plan = self.size(usable_cny=400 + 0.41 * 500)
+        self.assertAlmostEqual(1500, plan.purchase_volume)
+
+    def test_capped_by_usable_bts(self):
+        plan = self.size(usable_bts=1200)
+        self.assertAlmostEqual(1200, plan.sell_volume)
+
+    def test_withdrawal_fee(self):
+        plan = self.size(withdrawal_ratio=0.99, withdrawal_fee=1)
+        self.assertAlmostEqual(plan.purchase_volume * 0.99 - 1, plan.sell_volume)
+        self.assertAlmostEqual(plan.sell_volume, sum(level[1] for level in plan.sell_levels))
+
+    def test_nothing_profitable(self):
+        self.asks = make_side(False, [[0.45, 1000]])
+        plan = self.size()
+        self.assertEqual(0, plan.purchase_volume)
+        self.assertEqual(0, plan.purchase_price)
+
+unittest.main()
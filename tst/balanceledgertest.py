@@ -0,0 +1,76 @@
+import unittest
+
+from trading import balanceledger
+
+CNY = balanceledger.CNY
+BTS = balanceledger.BTS
+BTC = "BTC"
+
+
+class FakeExchange(object):
+    def __init__(self, cny, bts):
+        self.balance = {CNY: cny, BTS: bts}
+
+    def get_maker_account_balance(self):
+        return dict(self.balance)
+
+
+class BalanceLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.exchange = FakeExchange(1000, 5000)
+        self.ledger = balanceledger.BalanceLedger({"a": self.exchange})
+
+    def tearDown(self):
+        self.ledger.shutdown()
+
+    def test_trading_blocked_until_reconciled(self):
+        self.assertFalse(self.ledger.is_trading_allowed("a"))
+        self.ledger.reconcile()
+        self.assertTrue(self.ledger.is_trading_allowed("a"))
+        self.assertEqual({CNY: 1000, BTS: 5000}, self.ledger.get_balance("a"))
+
+    def test_orders_update_balance_immediately(self):
+        self.ledger.reconcile()
+        self.ledger.record_order("a", balanceledger.BUY_ORDER, 0.5, 100)
+        self.assertEqual({CNY: 950, BTS: 5100}, self.ledger.get_balance("a"))
+        self.ledger.revert_order("a", balanceledger.BUY_ORDER, 0.5, 100)
+        self.ledger.record_order("a", balanceledger.SELL_ORDER, 0.5, 100)
+        self.assertEqual({CNY: 1050, BTS: 4900}, self.ledger.get_balance("a"))
+
+    def test_orders_in_other_markets(self):
+        self.exchange.balance[BTC] = 2
+        self.ledger.reconcile()
+        self.ledger.record_order("a", balanceledger.BUY_ORDER, 0.00002, 10000, market="BTS_BTC")
+        self.assertEqual({CNY: 1000, BTS: 15000, BTC: 1.8}, self.ledger.get_balance("a"))
+
+    def test_small_drift_does_not_block(self):
+        self.ledger.reconcile()
+        self.ledger.record_order("a", balanceledger.SELL_ORDER, 0.5, 100)
+        self.exchange.balance = {CNY: 1049.9, BTS: 4900}
+        self.ledger.reconcile()
+        self.assertTrue(self.ledger.is_trading_allowed("a"))
+        self.assertEqual({CNY: 1049.9, BTS: 4900}, self.ledger.get_balance("a"))
+
+    def test_large_drift_blocks_until_next_reconciliation(self):
+        self.ledger.reconcile()
+        self.ledger.record_order("a", balanceledger.SELL_ORDER, 0.5, 1000)
+        self.ledger.reconcile()
+        self.assertFalse(self.ledger.is_trading_allowed("a"))
+        self.ledger.reconcile()
+        self.assertTrue(self.ledger.is_trading_allowed("a"))
+
+    def test_reconciled_balances_reported(self):
+        reconciled_balances = []
+        ledger = balanceledger.BalanceLedger({"a": self.exchange}, on_reconciled=reconciled_balances.append)
+        ledger.reconcile()
+        self.assertEqual([{"a": {CNY: 1000, BTS: 5000}}], reconciled_balances)
+        ledger.shutdown()
+
+    def test_failed_balance_request_keeps_ledger(self):
+        self.ledger.reconcile()
+        self.ledger.record_order("a", balanceledger.BUY_ORDER, 0.5, 100)
+        self.exchange.get_maker_account_balance = lambda: 1 / 0
+        self.ledger.reconcile()
+        self.assertEqual({CNY: 950, BTS: 5100}, self.ledger.get_balance("a"))
+
+unittest.main()
@@ -0,0 +1,46 @@
+import io
+import unittest
+
+from btc38 import client
+from btc38 import depthparser
+from exceptions import exchangeexceptions
+
+DEPTH_RESPONSE = (b'{"bids":[[0.4402,1623.38488],[0.4401,10366.271967],[0.44,8204.550502],[0.4392,2624]],'
+                  b'"asks":[[0.4444,4127.835417],[0.4457,7358.901461],[0.4458,10000],[0.4459,9170.8]]}')
+
+
+class DepthParserTest(unittest.TestCase):
+    def test_matches_json_parsing(self):
+        parser = depthparser.DepthParser().parse(DEPTH_RESPONSE)
+        expected = client.parse_depth([DEPTH_RESPONSE])
+        self.assertEqual(expected['bids'], [list(level) for level in parser.get_bids()])
+        self.assertEqual(expected['asks'], [list(level) for level in parser.get_asks()])
+
+    def test_parses_only_requested_depth(self):
+        parser = depthparser.DepthParser(depth=2).parse(DEPTH_RESPONSE)
+        self.assertEqual([(0.4402, 1623.38488), (0.4401, 10366.271967)], list(parser.get_bids()))
+        self.assertEqual([(0.4444, 4127.835417), (0.4457, 7358.901461)], list(parser.get_asks()))
+
+    def test_quoted_numbers_and_whitespace(self):
+        parser = depthparser.DepthParser().parse(b' {"asks": [ ["0.45", "10"] ], "bids": []}')
+        self.assertEqual([], list(parser.get_bids()))
+        self.assertEqual([(0.45, 10)], list(parser.get_asks()))
+
+    def test_failure_responses(self):
+        parser = depthparser.DepthParser()
+        for body in [b'', b'fail', b'  \n']:
+            with self.assertRaises(exchangeexceptions.UpdateOrderBookFailureException) as context:
+                parser.parse(body)
+            self.assertNotIsInstance(context.exception, exchangeexceptions.RateLimitException)
+        with self.assertRaises(exchangeexceptions.RateLimitException):
+            parser.parse(b'fail#3')
+
+    def test_parses_prefix_of_reused_buffer(self):
+        buffer = bytearray(16)
+        length = depthparser.read_response(io.BytesIO(DEPTH_RESPONSE), buffer)
+        self.assertEqual(len(DEPTH_RESPONSE), length)
+        buffer[length:length + 4] = b'junk'
+        parser = depthparser.DepthParser().parse(buffer, length)
+        self.assertEqual(4, parser.ask_count)
+
+unittest.main()
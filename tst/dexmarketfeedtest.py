@@ -0,0 +1,119 @@
+import collections
+import json
+import unittest
+
+from data import marketmakerexchange
+from dex import marketfeed
+
+MARKET = marketmakerexchange.MARKET
+BTS_ASSET = {'id': '1.3.0', 'symbol': 'BTS', 'precision': 5}
+CNY_ASSET = {'id': '1.3.113', 'symbol': 'CNY', 'precision': 4}
+
+
+# Sell volume BTS at price CNY per BTS.
+def create_ask(order_id, price, volume):
+    return {'id': order_id, 'for_sale': int(volume * 1e5),
+            'sell_price': {'base': {'amount': int(volume * 1e5), 'asset_id': BTS_ASSET['id']},
+                           'quote': {'amount': int(round(price * volume * 1e4)), 'asset_id': CNY_ASSET['id']}}}
+
+
+# Buy volume BTS at price CNY per BTS.
+def create_bid(order_id, price, volume):
+    return {'id': order_id, 'for_sale': int(round(price * volume * 1e4)),
+            'sell_price': {'base': {'amount': int(round(price * volume * 1e4)), 'asset_id': CNY_ASSET['id']},
+                           'quote': {'amount': int(volume * 1e5), 'asset_id': BTS_ASSET['id']}}}
+
+
+def create_notice(*updates):
+    return {'method': 'notice', 'params': [0, [list(updates)]]}
+
+
+class FakeWitnessConnection(object):
+    def __init__(self, limit_orders):
+        self.limit_orders = limit_orders
+        self.messages = collections.deque()
+        self.calls = []
+
+    def send(self, text):
+        request = json.loads(text)
+        api, method, params = request['params']
+        self.calls.append(method)
+        results = {'lookup_asset_symbols': [BTS_ASSET, CNY_ASSET],
+                   'subscribe_to_market': None,
+                   'get_limit_orders': self.limit_orders,
+                   'get_dynamic_global_properties': {}}
+        self.messages.append({'id': request['id'], 'jsonrpc': '2.0', 'result': results[method]})
+
+    def recv(self):
+        if not self.messages:
+            raise TimeoutError()
+        return json.dumps(self.messages.popleft())
+
+    def close(self):
+        pass
+
+
+class DecodeLimitOrderTest(unittest.TestCase):
+    def test_ask(self):
+        self.assertEqual((marketfeed.ASKS, 0.44, 1000), marketfeed.decode_limit_order(create_ask('1.7.1', 0.44, 1000),
+                                                                                       BTS_ASSET, CNY_ASSET))
+
+    def test_bid(self):
+        side, price, volume = marketfeed.decode_limit_order(create_bid('1.7.1', 0.43, 1000), BTS_ASSET, CNY_ASSET)
+        self.assertEqual((marketfeed.BIDS, 0.43), (side, price))
+        self.assertAlmostEqual(1000, volume)
+
+    def test_other_market(self):
+        order = create_ask('1.7.1', 0.44, 1000)
+        order['sell_price']['quote']['asset_id'] = '1.3.121'
+        self.assertIsNone(marketfeed.decode_limit_order(order, BTS_ASSET, CNY_ASSET))
+
+
+class DexMarketFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeWitnessConnection([create_bid('1.7.1', 0.43, 1000), create_ask('1.7.2', 0.44, 500),
+                                                 create_ask('1.7.3', 0.44, 700)])
+        self.feed = marketfeed.DexMarketFeed('ws://witness', [MARKET], connect=lambda url: self.connection)
+        self.updates = []
+        self.feed.on_update = lambda market, bids, asks, receive_time: self.updates.append((market, bids, asks))
+        self.feed.sync()
+
+    def test_sync_from_snapshot(self):
+        self.assertTrue(self.feed.is_synced())
+        market, bids, asks = self.updates[-1]
+        self.assertEqual(MARKET, market)
+        self.assertEqual([[0.44, 1200]], asks)
+        self.assertEqual(0.43, bids[0][0])
+
+    def test_pushed_updates(self):
+        self.connection.messages.append(create_notice(create_ask('1.7.2', 0.44, 200), '1.7.3',
+                                                      create_ask('1.7.4', 0.45, 100)))
+        self.feed.receive()
+        self.assertEqual([[0.44, 200], [0.45, 100]], self.updates[-1][2])
+
+    def test_notices_received_during_call(self):
+        self.connection.messages.append(create_notice('1.7.1'))
+        self.feed.call('get_dynamic_global_properties', [])
+        self.assertEqual(0.43, self.updates[-1][1][0][0])
+        self.assertEqual(1, len(self.feed.pending_notices))
+        self.feed.receive()
+        self.assertEqual([], self.updates[-1][1])
+
+    def test_crossed_book_is_resynced(self):
+        self.connection.messages.append(create_notice(create_bid('1.7.5', 0.45, 100)))
+        self.feed.receive()
+        self.assertEqual(2, self.connection.calls.count('get_limit_orders'))
+        self.assertEqual(0.43, self.updates[-1][1][0][0])
+
+    def test_idle_connection_is_checked(self):
+        self.feed.last_receive_time = 0
+        self.feed.receive()
+        self.assertEqual('get_dynamic_global_properties', self.connection.calls[-1])
+        self.assertGreater(self.feed.get_last_receive_time(), 0)
+
+    def test_silent_connection_is_out_of_sync(self):
+        self.assertTrue(self.feed.is_synced())
+        self.feed.last_receive_time -= marketfeed.KEEPALIVE_INTERVAL + marketfeed.CALL_TIMEOUT + 1
+        self.assertFalse(self.feed.is_synced())
+
+unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+
+from metrics import metricsregistry
+from network import hedgedrequest
+
+
+class HedgePolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = metricsregistry.reset()
+        self.policy = hedgedrequest.HedgePolicy("test", max_hedge_ratio=1)
+        self.calls = 0
+
+    def make_request(self, latencies):
+        async def request():
+            latency = latencies[self.calls]
+            self.calls += 1
+            await asyncio.sleep(latency)
+            return latency
+        return request
+
+    def warm_up(self, latency=0.001):
+        for _ in range(hedgedrequest.MIN_SAMPLES):
+            self.calls = 0
+            asyncio.run(self.policy.request(self.make_request([latency])))
+        self.calls = 0
+
+    def test_no_hedge_before_enough_samples(self):
+        self.assertEqual(0.5, asyncio.run(self.policy.request(self.make_request([0.5, 0]))))
+        self.assertEqual(1, self.calls)
+
+    def test_slow_request_hedged(self):
+        self.warm_up()
+        self.assertEqual(0, asyncio.run(self.policy.request(self.make_request([1, 0]))))
+        self.assertEqual(2, self.calls)
+        self.assertEqual(1, self.registry.counters["hedge.test.fired"])
+        self.assertEqual(1, self.registry.counters["hedge.test.won"])
+
+    def test_original_wins(self):
+        self.warm_up(latency=0.01)
+        self.assertEqual(0.02, asyncio.run(self.policy.request(self.make_request([0.02, 1]))))
+        self.assertEqual(1, self.registry.counters["hedge.test.fired"])
+        self.assertNotIn("hedge.test.won", self.registry.counters)
+
+    def test_hedges_capped(self):
+        self.policy.max_hedge_ratio = 0
+        self.warm_up()
+        asyncio.run(self.policy.request(self.make_request([0.05, 0])))
+        self.assertEqual(1, self.calls)
+
+    def test_failed_request_hedged(self):
+        self.warm_up()
+
+        async def failing_request():
+            self.calls += 1
+            if self.calls == 1:
+                await asyncio.sleep(0.05)
+                raise ConnectionResetError()
+            await asyncio.sleep(0.1)
+            return "hedge"
+        self.assertEqual("hedge", asyncio.run(self.policy.request(failing_request)))
+
+    def test_failure_latency_not_measured(self):
+        async def failing_request():
+            raise ConnectionResetError()
+        with self.assertRaises(ConnectionResetError):
+            asyncio.run(self.policy.request(failing_request))
+        self.assertEqual(0, self.policy.latencies.count)
+
+unittest.main()
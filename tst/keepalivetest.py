@@ -0,0 +1,143 @@
+import asyncio
+import http.client
+import socketserver
+import threading
+import time
+import unittest
+
+from btc38 import client
+from network import asynchttp
+
+OK_RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\n{}"
+# What the server does with each request it receives, in turn.
+ANSWER = "answer"
+# Answer, then close the connection while it is idle, as servers do after their keep-alive timeout.
+ANSWER_AND_CLOSE = "answer and close"
+# Read the request, then close the connection without answering.
+DROP = "drop"
+
+
+class ScriptedHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.connection_count += 1
+        buffered = b""
+        while True:
+            while b"\r\n\r\n" not in buffered:
+                data = self.request.recv(4096)
+                if not data:
+                    return
+                buffered += data
+            head, buffered = buffered.split(b"\r\n\r\n", 1)
+            length = 0
+            for line in head.split(b"\r\n")[1:]:
+                key, value = line.split(b":", 1)
+                if key.strip().lower() == b"content-length":
+                    length = int(value)
+            while len(buffered) < length:
+                buffered += self.request.recv(4096)
+            self.server.requests.append(head.split(b" ", 1)[0].decode())
+            buffered = buffered[length:]
+            action = self.server.actions.pop(0) if self.server.actions else ANSWER
+            if action == DROP:
+                return
+            self.request.sendall(OK_RESPONSE)
+            if action == ANSWER_AND_CLOSE:
+                return
+
+
+class ScriptedServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, actions):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), ScriptedHandler)
+        self.actions = list(actions)
+        self.requests = []
+        self.connection_count = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}/v1/".format(self.server_address[1])
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ClientRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = None
+
+    def tearDown(self):
+        self.server.stop()
+
+    def create_client(self, actions):
+        self.server = ScriptedServer(actions)
+        return client.Client("key", "secret", "1", base_url=self.server.base_url)
+
+    def test_idle_connection_closed_by_server_is_replaced(self):
+        btc38_client = self.create_client([ANSWER_AND_CLOSE])
+        btc38_client.cancel_order(client.CNY_SYMBOL, 1)
+        # Let the close reach the client.
+        time.sleep(0.1)
+        self.assertEqual([b"{}"], btc38_client.cancel_order(client.CNY_SYMBOL, 2))
+        self.assertEqual(["POST", "POST"], self.server.requests)
+        self.assertEqual(2, self.server.connection_count)
+
+    def test_dropped_post_is_not_sent_again(self):
+        btc38_client = self.create_client([ANSWER, DROP])
+        btc38_client.cancel_order(client.CNY_SYMBOL, 1)
+        with self.assertRaises((http.client.RemoteDisconnected, ConnectionError)):
+            btc38_client.submit_order(1, client.CNY_SYMBOL, 0.44, 10, client.BTS_SYMBOL)
+        self.assertEqual(["POST", "POST"], self.server.requests)
+
+    def test_dropped_get_is_sent_again(self):
+        btc38_client = self.create_client([ANSWER, DROP])
+        btc38_client.cancel_order(client.CNY_SYMBOL, 1)
+        self.assertEqual({}, btc38_client.get_tickers())
+        self.assertEqual(["POST", "GET", "GET"], self.server.requests)
+
+
+class AsyncHttpPoolRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = None
+        self.pool = asynchttp.AsyncHttpPool()
+
+    def tearDown(self):
+        self.server.stop()
+
+    # Send the batches in turn on one event loop, the requests of a batch concurrently, as (url suffix, data).
+    # Return the results of the last batch, exceptions included.
+    def send(self, actions, batches):
+        self.server = ScriptedServer(actions)
+
+        async def send_all():
+            results = None
+            for batch in batches:
+                results = await asyncio.gather(*[self.pool.request(self.server.base_url + suffix, data)
+                                                 for suffix, data in batch], return_exceptions=True)
+                # Let the closes reach the pool.
+                await asyncio.sleep(0.1)
+            await self.pool.close()
+            return results
+
+        return asyncio.run(send_all())
+
+    def test_idle_connection_closed_by_server_is_replaced(self):
+        results = self.send([ANSWER_AND_CLOSE], [[("submitOrder.php", b"a=1")], [("submitOrder.php", b"a=2")]])
+        self.assertEqual([b"{}"], results)
+        self.assertEqual(["POST", "POST"], self.server.requests)
+        self.assertEqual(2, self.server.connection_count)
+
+    def test_dropped_post_is_not_sent_again(self):
+        results = self.send([ANSWER, DROP], [[("submitOrder.php", b"a=1")], [("submitOrder.php", b"a=2")]])
+        self.assertIsInstance(results[0], (ConnectionError, asyncio.IncompleteReadError))
+        self.assertEqual(["POST", "POST"], self.server.requests)
+
+    def test_dropped_get_is_sent_again_once(self):
+        # Three idle connections are pooled, then the GET is dropped on every connection.
+        results = self.send([ANSWER] * 3 + [DROP] * 4, [[("depth.php", None)] * 3, [("depth.php", None)]])
+        self.assertIsInstance(results[0], (ConnectionError, asyncio.IncompleteReadError))
+        self.assertEqual(5, len(self.server.requests))
+
+unittest.main()
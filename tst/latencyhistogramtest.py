@@ -0,0 +1,44 @@
+import unittest
+
+from metrics import latencyhistogram
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_bucket_index_round_trip(self):
+        for value in [0, 1, 63, 64, 65, 127, 128, 1000, 123456, 2 ** 35]:
+            index = latencyhistogram.get_bucket_index(value)
+            self.assertLessEqual(latencyhistogram.get_bucket_value(index), value)
+            self.assertGreater(latencyhistogram.get_bucket_value(index + 1), value)
+
+    def test_bucket_relative_error(self):
+        for value in [100, 1000, 54321, 10 ** 8]:
+            index = latencyhistogram.get_bucket_index(value)
+            lower = latencyhistogram.get_bucket_value(index)
+            upper = latencyhistogram.get_bucket_value(index + 1)
+            self.assertLess((upper - lower) / lower, 1 / latencyhistogram.SUB_BUCKET_COUNT + 1e-9)
+
+    def test_values_beyond_range_land_in_last_bucket(self):
+        self.assertEqual(latencyhistogram.BUCKET_COUNT - 1, latencyhistogram.get_bucket_index(2 ** 40))
+
+    def test_percentiles(self):
+        histogram = latencyhistogram.LatencyHistogram()
+        for microseconds in range(1, 1001):
+            histogram.record(microseconds / 1000000)
+        self.assertEqual(1000, histogram.count)
+        self.assertEqual(1, histogram.min)
+        self.assertEqual(1000, histogram.max)
+        self.assertAlmostEqual(500, histogram.percentile(50), delta=500 / latencyhistogram.SUB_BUCKET_COUNT)
+        self.assertAlmostEqual(990, histogram.percentile(99), delta=990 / latencyhistogram.SUB_BUCKET_COUNT)
+        self.assertEqual(1000, histogram.percentile(100))
+
+    def test_merge(self):
+        histogram = latencyhistogram.LatencyHistogram()
+        other = latencyhistogram.LatencyHistogram()
+        histogram.record(0.001)
+        other.record(0.002)
+        histogram.merge(other)
+        self.assertEqual(2, histogram.count)
+        self.assertEqual(1000, histogram.min)
+        self.assertEqual(2000, histogram.max)
+
+unittest.main()
@@ -0,0 +1,221 @@
+import concurrent.futures
+import unittest
+
+from data import marketmakerexchange
+from trading import legrecovery
+from trading import ordergateway
+from trading import ordertracker
+from trading import riskengine
+
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+SELL_ORDER = marketmakerexchange.SELL_ORDER
+BIDS = marketmakerexchange.BIDS
+ASKS = marketmakerexchange.ASKS
+MARKET = marketmakerexchange.MARKET
+
+
+class FakeExchange(object):
+    def __init__(self, name, failures=0):
+        self.name = name
+        self.failures = failures
+        self.cancelled = []
+        self.open_orders = []
+        self.trades = []
+
+    def get_exchange_name(self):
+        return self.name
+
+    def list_my_orders(self, market=MARKET):
+        return list(self.open_orders)
+
+    def list_my_trades(self, market=MARKET):
+        return list(self.trades)
+
+    def cancel_order(self, order_id, market):
+        self.cancelled.append(order_id)
+        self.open_orders = [order for order in self.open_orders if order.order_id != order_id]
+
+
+class FakeOrderGateway(object):
+    def __init__(self):
+        self.submitted = []
+
+    def submit_legs(self, legs):
+        futures = []
+        for leg in legs:
+            self.submitted.append(leg)
+            future = concurrent.futures.Future()
+            if leg.exchange.failures > 0:
+                leg.exchange.failures -= 1
+                future.set_exception(RuntimeError("rejected"))
+            else:
+                leg.order_id = len(self.submitted)
+                future.set_result(leg)
+            futures.append(future)
+        return futures
+
+
+class FakeBalanceLedger(object):
+    def __init__(self):
+        self.orders = []
+        self.reverted_orders = []
+        self.reconcile_requested = False
+
+    def record_order(self, exchange_name, order_type, price, volume, market=MARKET):
+        self.orders.append((exchange_name, order_type, price, volume))
+
+    def revert_order(self, exchange_name, order_type, price, volume, market=MARKET):
+        self.reverted_orders.append((exchange_name, order_type, price, volume))
+
+    def request_reconcile(self):
+        self.reconcile_requested = True
+
+
+class LegRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.exchanges = {"a": FakeExchange("a"), "b": FakeExchange("b")}
+        self.order_gateway = FakeOrderGateway()
+        self.order_tracker = ordertracker.OrderTracker(self.exchanges)
+        self.balance_ledger = FakeBalanceLedger()
+        self.risk_engine = riskengine.RiskEngine(clock=lambda: 1000)
+        # {exchange name: {BIDS: [price, volume], ASKS: [price, volume]}}
+        self.books = {"a": {BIDS: [0.45, 1000], ASKS: [0.46, 1000]}, "b": {BIDS: [0.43, 1000], ASKS: [0.438, 1000]}}
+        self.notifications = []
+        self.recovery = legrecovery.LegRecovery(
+            self.order_gateway, self.order_tracker, self.balance_ledger, self.risk_engine,
+            lambda exchange_name, market: self.books[exchange_name], lambda market: 3, self.notifications.append,
+            fill_deadline=0)
+        self.recovery.start()
+
+    def tearDown(self):
+        self.recovery.shutdown()
+        self.order_tracker.shutdown()
+
+    # Sell on a, buy on b, as submitted by the market maker.
+    def submit_arbitrage(self, exceptions):
+        legs = [ordergateway.OrderLeg(self.exchanges["a"], SELL_ORDER, 0.45, 100),
+                ordergateway.OrderLeg(self.exchanges["b"], BUY_ORDER, 0.44, 100)]
+        self.assertTrue(self.risk_engine.check(legs))
+        tracked_orders = []
+        for index, (leg, exception) in enumerate(zip(legs, exceptions)):
+            if exception is None:
+                leg.order_id = "placed{}".format(index)
+                tracked_orders.append(self.order_tracker.track(leg.exchange.get_exchange_name(), leg.order_id,
+                                                               leg.order_type, leg.price, leg.volume))
+            else:
+                tracked_orders.append(None)
+        self.risk_engine.on_legs_submitted(legs, exceptions)
+        return legs, tracked_orders
+
+    def test_not_started(self):
+        recovery = legrecovery.LegRecovery(self.order_gateway, self.order_tracker, self.balance_ledger,
+                                           self.risk_engine, None, None, None)
+        legs, tracked_orders = self.submit_arbitrage([None, RuntimeError()])
+        self.assertIsNone(recovery.on_legs_submitted(legs, [None, RuntimeError()], tracked_orders))
+        recovery.shutdown()
+
+    def test_failed_leg_is_hedged(self):
+        exceptions = [None, RuntimeError("rejected")]
+        legs, tracked_orders = self.submit_arbitrage(exceptions)
+        self.assertGreater(self.risk_engine.unhedged_exposure["CNY"], 0)
+        self.recovery.on_legs_submitted(legs, exceptions, tracked_orders).result()
+
+        hedge = self.order_gateway.submitted[-1]
+        self.assertEqual(("b", BUY_ORDER, 0.438, 100), (hedge.exchange.get_exchange_name(), hedge.order_type,
+                                                        hedge.price, hedge.volume))
+        self.assertEqual([("b", BUY_ORDER, 0.438, 100)], self.balance_ledger.orders)
+        self.assertEqual(0, self.risk_engine.unhedged_exposure["CNY"])
+        self.assertEqual(2, len(self.order_tracker.get_open_orders()))
+        self.assertEqual([], self.exchanges["a"].cancelled)
+        self.assertEqual([], self.notifications)
+
+    def test_hedge_is_retried(self):
+        self.exchanges["b"].failures = 1
+        exceptions = [None, RuntimeError("rejected")]
+        legs, tracked_orders = self.submit_arbitrage(exceptions)
+        self.recovery.on_legs_submitted(legs, exceptions, tracked_orders).result()
+        self.assertEqual(2, len(self.order_gateway.submitted))
+        self.assertEqual(1, len(self.balance_ledger.reverted_orders))
+        self.assertEqual([], self.notifications)
+
+    def test_failed_leg_found_placed(self):
+        self.exchanges["b"].open_orders = [marketmakerexchange.OpenOrder("late", BUY_ORDER, 0.44, 100)]
+        exceptions = [None, RuntimeError("timed out")]
+        legs, tracked_orders = self.submit_arbitrage(exceptions)
+        self.recovery.on_legs_submitted(legs, exceptions, tracked_orders).result()
+
+        self.assertEqual([], self.order_gateway.submitted)
+        self.assertEqual([("b", BUY_ORDER, 0.44, 100)], self.balance_ledger.orders)
+        self.assertEqual(["late"], [order.order_id for order in self.order_tracker.get_open_orders("b")])
+        self.assertEqual(0, self.risk_engine.unhedged_exposure["CNY"])
+        self.assertEqual([], self.exchanges["a"].cancelled)
+        self.assertEqual([], self.notifications)
+
+    def test_failed_leg_not_placed_again_if_unknown(self):
+        def fail(market):
+            raise RuntimeError("timed out")
+        self.exchanges["b"].list_my_orders = fail
+        exceptions = [None, RuntimeError("timed out")]
+        legs, tracked_orders = self.submit_arbitrage(exceptions)
+        self.recovery.on_legs_submitted(legs, exceptions, tracked_orders).result()
+
+        self.assertEqual([], self.order_gateway.submitted)
+        self.assertEqual(["placed0"], self.exchanges["a"].cancelled)
+        self.assertEqual(1, len(self.notifications))
+
+    def test_survivor_cancelled_without_price_in_budget(self):
+        self.books["b"][ASKS] = [0.45, 1000]
+        exceptions = [None, RuntimeError("rejected")]
+        legs, tracked_orders = self.submit_arbitrage(exceptions)
+        self.recovery.on_legs_submitted(legs, exceptions, tracked_orders).result()
+
+        self.assertEqual([], self.order_gateway.submitted)
+        self.assertEqual(["placed0"], self.exchanges["a"].cancelled)
+        self.assertTrue(tracked_orders[0].cancel_requested)
+        self.assertEqual(0, self.risk_engine.unhedged_exposure["CNY"])
+        self.assertEqual(1, len(self.notifications))
+
+    def test_unfilled_leg_is_cancelled_and_hedged(self):
+        exceptions = [None, None]
+        legs, tracked_orders = self.submit_arbitrage(exceptions)
+        tracked_orders[0].state = ordertracker.FILLED
+        tracked_orders[0].filled_volume = 100
+        tracked_orders[1].state = ordertracker.PARTIALLY_FILLED
+        tracked_orders[1].filled_volume = 40
+        # 20 more filled after the last poll, before the cancellation.
+        self.exchanges["b"].open_orders = [marketmakerexchange.OpenOrder("placed1", BUY_ORDER, 0.44, 40)]
+        self.exchanges["b"].trades = [marketmakerexchange.Trade("placed1", 40),
+                                      marketmakerexchange.Trade("placed1", 20)]
+        self.recovery.check_fills(legs, tracked_orders)
+
+        self.assertEqual(["placed1"], self.exchanges["b"].cancelled)
+        self.assertEqual(ordertracker.CANCELLED, tracked_orders[1].state)
+        hedge = self.order_gateway.submitted[-1]
+        self.assertEqual(("b", BUY_ORDER, 0.438), (hedge.exchange.get_exchange_name(), hedge.order_type, hedge.price))
+        self.assertAlmostEqual(40, hedge.volume)
+        self.assertEqual([("b", BUY_ORDER, 0.44, hedge.volume)], self.balance_ledger.reverted_orders)
+        self.assertEqual([], self.notifications)
+
+    def test_all_filled(self):
+        exceptions = [None, None]
+        legs, tracked_orders = self.submit_arbitrage(exceptions)
+        for tracked_order in tracked_orders:
+            tracked_order.state = ordertracker.FILLED
+            tracked_order.filled_volume = 100
+        self.recovery.check_fills(legs, tracked_orders)
+        self.assertEqual([], self.order_gateway.submitted)
+        self.assertEqual([], self.exchanges["b"].cancelled)
+
+    def test_hedge_price_within_budget(self):
+        buy = ordergateway.OrderLeg(self.exchanges["b"], BUY_ORDER, 0.44, 100)
+        sell = ordergateway.OrderLeg(self.exchanges["a"], SELL_ORDER, 0.45, 100)
+        self.books["b"][ASKS] = [0.442, 1000]
+        self.assertEqual(0.442, self.recovery.get_hedge_price(buy))
+        self.books["b"][ASKS] = [0.443, 1000]
+        self.assertIsNone(self.recovery.get_hedge_price(buy))
+        self.books["a"][BIDS] = [0.448, 1000]
+        self.assertEqual(0.448, self.recovery.get_hedge_price(sell))
+        self.books["a"][BIDS] = [0.447, 1000]
+        self.assertIsNone(self.recovery.get_hedge_price(sell))
+
+unittest.main()
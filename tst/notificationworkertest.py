@@ -0,0 +1,97 @@
+import socketserver
+import threading
+import time
+import unittest
+
+from notifications import emailsender
+from notifications import notificationworker
+
+
+# Minimal SMTP server keeping the received emails and counting connections.
+class StubSmtpHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self.__reply(b'220 stub')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().upper()
+            if command.startswith(b'EHLO') or command.startswith(b'HELO'):
+                self.__reply(b'250 stub')
+            elif command == b'DATA':
+                self.__reply(b'354 end with .')
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if data_line in (b'.\r\n', b''):
+                        break
+                    lines.append(data_line)
+                self.server.emails.append(b''.join(lines).decode('utf-8').replace('\r\n', '\n'))
+                self.__reply(b'250 queued')
+            elif command == b'QUIT':
+                self.__reply(b'221 bye')
+                return
+            else:
+                self.__reply(b'250 ok')
+
+    def __reply(self, response):
+        self.wfile.write(response + b'\r\n')
+
+
+class StubSmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super(StubSmtpServer, self).__init__(('127.0.0.1', 0), StubSmtpHandler)
+        self.emails = []
+        self.connections = 0
+
+
+class NotificationWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubSmtpServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.sender = emailsender.EmailSender(None, None, '127.0.0.1', self.server.server_address[1], use_ssl=False)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_worker(self, batch_window, max_queued_messages=100):
+        return notificationworker.NotificationWorker(self.sender, "subject", "from@test", "to@test",
+                                                     batch_window, max_queued_messages)
+
+    def test_batches_and_deduplicates(self):
+        worker = self.make_worker(batch_window=0.2)
+        for _ in range(3):
+            worker.notify("Failed to place arbitrage order!")
+        worker.notify("Arbitrage: purchase from btc38")
+        worker.close()
+
+        self.assertEqual(1, len(self.server.emails))
+        self.assertIn("Failed to place arbitrage order!\n(repeated 3 times)", self.server.emails[0])
+        self.assertIn("Arbitrage: purchase from btc38", self.server.emails[0])
+
+    def test_reuses_connection(self):
+        worker = self.make_worker(batch_window=0)
+        for index in range(3):
+            worker.notify("message {}".format(index))
+            time.sleep(0.1)
+        worker.close()
+
+        self.assertEqual(3, worker.sent_emails)
+        self.assertEqual(1, self.server.connections)
+
+    def test_summarizes_dropped_messages(self):
+        worker = self.make_worker(batch_window=0.5, max_queued_messages=2)
+        for index in range(10):
+            worker.notify("message {}".format(index))
+        worker.close()
+
+        emails = "".join(self.server.emails)
+        self.assertIn("notifications dropped because the queue was full", emails)
+        self.assertEqual(0, worker.dropped_messages)
+
+unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from data import opportunitymatrix
+
+BIDS = opportunitymatrix.BIDS
+ASKS = opportunitymatrix.ASKS
+
+
+class OpportunityMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.matrix = opportunitymatrix.OpportunityMatrix({"a": 0.01, "b": 0.01, "c": 0.01})
+        self.matrix.update({"a": {BIDS: [0.39, 1000], ASKS: [0.40, 1000]},
+                            "b": {BIDS: [0.42, 1000], ASKS: [0.43, 1000]},
+                            "c": {BIDS: [0.45, 500], ASKS: [0.46, 1000]}})
+
+    def test_profit_matrix(self):
+        profits = self.matrix.get_profit_matrix()
+        self.assertAlmostEqual((0.45 - 0.40) / 0.40 - 0.01, profits[0][2])
+        self.assertAlmostEqual((0.39 - 0.43) / 0.43 - 0.01, profits[1][0])
+
+    def test_opportunities_ranked_by_expected_profit(self):
+        opportunities = self.matrix.find_opportunities({"a", "b", "c"}, {"a", "b", "c"}, 0)
+        self.assertEqual([("a", "c"), ("a", "b"), ("b", "c")],
+                         [(opportunity.buyer_name, opportunity.seller_name) for opportunity in opportunities])
+
+    def test_only_valid_exchanges(self):
+        opportunities = self.matrix.find_opportunities({"a", "b"}, {"a", "b", "c"}, 0)
+        self.assertEqual([("a", "b")], [(opportunity.buyer_name, opportunity.seller_name)
+                                        for opportunity in opportunities])
+
+    def test_only_pairs_with_updated_exchange(self):
+        opportunities = self.matrix.find_opportunities({"a", "b", "c"}, {"c"}, 0)
+        self.assertEqual([("a", "c"), ("b", "c")], [(opportunity.buyer_name, opportunity.seller_name)
+                                                    for opportunity in opportunities])
+
+    def test_empty_book_never_profitable(self):
+        self.matrix.update({"a": {BIDS: [0, 0], ASKS: [0, 0]},
+                            "b": {BIDS: [0.42, 1000], ASKS: [0.43, 1000]},
+                            "c": {BIDS: [0, 0], ASKS: [0, 0]}})
+        self.assertEqual([], self.matrix.find_opportunities({"a", "b", "c"}, {"a", "b", "c"}, 0))
+
+unittest.main()
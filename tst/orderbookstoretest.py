@@ -0,0 +1,79 @@
+import struct
+import time
+import unittest
+from datetime import datetime
+
+from data import orderbook
+from data import orderbookstore
+
+
+class OrderBookStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = orderbookstore.OrderBookStore(["btc38", "dex"])
+
+    def tearDown(self):
+        self.store.close()
+        self.store.unlink()
+
+    def test_read_after_write(self):
+        order_book = orderbook.OrderBook()
+        order_book.apply_snapshot([[0.4402, 1623.38], [0.4401, 10366.27]], [[0.4444, 4127.83]])
+        update_time = time.time()
+        self.store.write("dex", order_book, update_time)
+
+        stored_order_book = self.store.read("dex")
+        self.assertEqual([[0.4402, 1623.38], [0.4401, 10366.27]], stored_order_book[orderbookstore.BIDS].levels())
+        self.assertEqual([[0.4444, 4127.83]], stored_order_book[orderbookstore.ASKS].levels())
+        self.assertAlmostEqual(update_time, stored_order_book[orderbookstore.UPDATE_TIME].timestamp(), 5)
+
+    def test_write_truncates_to_store_depth(self):
+        order_book = orderbook.OrderBook()
+        order_book.apply_snapshot([[i, 1] for i in range(orderbookstore.ORDER_BOOK_DEPTH + 10)], [])
+        self.store.write("dex", order_book, time.time())
+        self.assertEqual(orderbookstore.ORDER_BOOK_DEPTH, len(self.store.read("dex")[orderbookstore.BIDS]))
+
+    def test_write_does_not_touch_other_exchanges(self):
+        order_book = orderbook.OrderBook()
+        order_book.apply_snapshot([[0.4402, 1623.38]], [[0.4444, 4127.83]])
+        self.store.write("dex", order_book, time.time())
+        snapshot = self.store.snapshot()
+        self.assertEqual(0, len(snapshot["btc38"][orderbookstore.BIDS]))
+        self.assertEqual(0, len(snapshot["btc38"][orderbookstore.ASKS]))
+
+    def test_snapshot_versions(self):
+        snapshot = self.store.snapshot()
+        self.assertIs(snapshot, self.store.snapshot())
+        self.assertEqual(snapshot.version, self.store.get_version())
+
+        order_book = orderbook.OrderBook()
+        order_book.apply_snapshot([[0.4402, 1623.38]], [[0.4444, 4127.83]])
+        self.store.write("btc38", order_book, time.time())
+        new_snapshot = self.store.snapshot()
+        self.assertEqual(snapshot.version + 1, new_snapshot.version)
+        self.assertEqual(0, len(snapshot["btc38"][orderbookstore.BIDS]))
+        self.assertEqual(1, len(new_snapshot["btc38"][orderbookstore.BIDS]))
+
+    def test_slot_left_mid_write_is_stale(self):
+        order_book = orderbook.OrderBook()
+        order_book.apply_snapshot([[0.4402, 1623.38]], [[0.4444, 4127.83]])
+        self.store.write("btc38", order_book, time.time())
+        self.store.write("dex", order_book, time.time())
+        # The dex writer died in the middle of its next write.
+        offset = self.store.slot_index["dex"] * orderbookstore.SLOT_SIZE
+        sequence = struct.unpack_from(orderbookstore.SEQUENCE_FORMAT, self.store.shared_memory.buf, offset)[0]
+        struct.pack_into(orderbookstore.SEQUENCE_FORMAT, self.store.shared_memory.buf, offset, sequence + 1)
+
+        start = time.perf_counter()
+        snapshot = self.store.snapshot()
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(snapshot.version, self.store.get_version())
+        self.assertEqual(0, len(snapshot["dex"][orderbookstore.BIDS]))
+        self.assertEqual(datetime.fromtimestamp(0), snapshot["dex"][orderbookstore.UPDATE_TIME])
+        self.assertEqual([[0.4402, 1623.38]], snapshot["btc38"][orderbookstore.BIDS].levels())
+
+    def test_snapshot_read_only(self):
+        snapshot = self.store.snapshot()
+        with self.assertRaises(TypeError):
+            snapshot.order_books["btc38"] = None
+
+unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from data import orderbook
+
+
+class OrderBookTest(unittest.TestCase):
+    def setUp(self):
+        self.order_book = orderbook.OrderBook()
+        self.order_book.apply_snapshot([[0.4401, 10366.27], [0.4402, 5], [0.44, 8204.55]],
+                                       [[0.4457, 7358.9], [0.4444, 4127.83]])
+
+    def test_levels_sorted_from_best_price(self):
+        self.assertEqual([[0.4402, 5], [0.4401, 10366.27], [0.44, 8204.55]], self.order_book.bids.levels())
+        self.assertEqual([[0.4444, 4127.83], [0.4457, 7358.9]], self.order_book.asks.levels())
+
+    def test_update_inserts_replaces_and_removes_levels(self):
+        bids = self.order_book.bids
+        bids.update(0.4403, 100)
+        bids.update(0.4401, 200)
+        bids.update(0.44, 0)
+        self.assertEqual([[0.4403, 100], [0.4402, 5], [0.4401, 200]], bids.levels())
+
+    def test_apply_snapshot_returns_changed_levels(self):
+        changes = self.order_book.apply_snapshot([[0.4402, 5], [0.4401, 300]], [[0.4444, 4127.83], [0.4457, 7358.9]])
+        self.assertEqual([[0.4401, 300], [0.44, 0]], changes[orderbook.marketmakerexchange.BIDS])
+        self.assertEqual([], changes[orderbook.marketmakerexchange.ASKS])
+
+    def test_apply_snapshot_rebuilds_side(self):
+        self.assertAlmostEqual(18575.82, self.order_book.bids.cumulative_volume(2))
+        self.order_book.apply_snapshot([[0.4398, 30], [0.4403, 10], [0.4401, 0], [0.4399, 20]], [])
+        self.assertEqual([[0.4403, 10], [0.4399, 20], [0.4398, 30]], self.order_book.bids.levels())
+        self.assertEqual(60, self.order_book.bids.cumulative_volume(2))
+        self.order_book.bids.update(0.44, 40)
+        self.assertEqual([[0.4403, 10], [0.44, 40], [0.4399, 20], [0.4398, 30]], self.order_book.bids.levels())
+
+    def test_apply_snapshot_merges_orders_at_same_price(self):
+        self.order_book.apply_snapshot([], [[0.4444, 100, 44.44], [0.4444, 50, 22.22]])
+        self.assertEqual([[0.4444, 150]], self.order_book.asks.levels())
+
+    def test_cumulative_volume(self):
+        self.assertEqual(5, self.order_book.bids.cumulative_volume(0))
+        self.assertAlmostEqual(18575.82, self.order_book.bids.cumulative_volume(2))
+        self.assertAlmostEqual(18575.82, self.order_book.bids.cumulative_volume(10))
+
+    def test_top_offer_skips_fake_orders(self):
+        self.assertEqual([0.4401, 10371.27], self.order_book.bids.top_offer())
+        self.assertEqual([0.4444, 4127.83], self.order_book.asks.top_offer())
+
+    def test_top_offer_of_thin_side_is_best_level(self):
+        self.order_book.apply_snapshot([[0.4402, 5]], [])
+        self.assertEqual([0.4402, 5], self.order_book.bids.top_offer())
+        self.assertEqual([0, 0], self.order_book.asks.top_offer())
+
+unittest.main()
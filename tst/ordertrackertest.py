@@ -0,0 +1,151 @@
+import threading
+import time
+import unittest
+
+from data import marketmakerexchange
+from trading import ordertracker
+
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+SELL_ORDER = marketmakerexchange.SELL_ORDER
+
+
+class FakeExchange(object):
+    def __init__(self):
+        self.open_orders = []
+        self.trades = []
+        self.cancelled_ids = []
+
+    # Only orders of the default market are open.
+    def list_my_orders(self, market=marketmakerexchange.MARKET):
+        return list(self.open_orders) if market == marketmakerexchange.MARKET else []
+
+    def list_my_trades(self, market=marketmakerexchange.MARKET):
+        return list(self.trades)
+
+    def cancel_order(self, order_id, market=marketmakerexchange.MARKET):
+        self.cancelled_ids.append(order_id)
+        self.open_orders = [order for order in self.open_orders if order.order_id != order_id]
+
+
+class OrderTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.time = 1000
+        self.exchange = FakeExchange()
+        self.tracker = ordertracker.OrderTracker({"a": self.exchange}, stale_order_timeout=30,
+                                                 clock=lambda: self.time)
+
+    def tearDown(self):
+        self.tracker.shutdown()
+
+    def test_order_lifecycle(self):
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("1", BUY_ORDER, 0.44, 100)]
+        order = self.tracker.track("a", "1", BUY_ORDER, 0.44, 100)
+        self.assertTrue(self.tracker.has_open_orders("a"))
+
+        self.tracker.poll()
+        self.assertEqual(ordertracker.PENDING, order.state)
+
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("1", BUY_ORDER, 0.44, 40)]
+        self.tracker.poll()
+        self.assertEqual(ordertracker.PARTIALLY_FILLED, order.state)
+        self.assertEqual(60, order.filled_volume)
+
+        self.exchange.open_orders = []
+        self.tracker.poll()
+        self.assertEqual(ordertracker.FILLED, order.state)
+        self.assertFalse(self.tracker.has_open_orders("a"))
+
+    def test_stale_order_cancelled(self):
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("1", SELL_ORDER, 0.45, 100)]
+        self.exchange.trades = [marketmakerexchange.Trade("1", 30)]
+        order = self.tracker.track("a", "1", SELL_ORDER, 0.45, 100)
+        self.time += 31
+        self.tracker.poll()
+        self.assertEqual(["1"], self.exchange.cancelled_ids)
+
+        self.tracker.poll()
+        self.assertEqual(ordertracker.CANCELLED, order.state)
+        self.assertEqual(30, order.filled_volume)
+
+    def test_concurrent_polls_cancel_stale_order_once(self):
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("1", SELL_ORDER, 0.45, 100)]
+        cancel_order = self.exchange.cancel_order
+
+        def slow_cancel_order(order_id, market=marketmakerexchange.MARKET):
+            time.sleep(0.1)
+            cancel_order(order_id, market)
+        self.exchange.cancel_order = slow_cancel_order
+        self.tracker.track("a", "1", SELL_ORDER, 0.45, 100)
+        self.time += 31
+        poll_threads = [threading.Thread(target=self.tracker.poll) for _ in range(2)]
+        for poll_thread in poll_threads:
+            poll_thread.start()
+        for poll_thread in poll_threads:
+            poll_thread.join(5)
+        self.assertEqual(["1"], self.exchange.cancelled_ids)
+
+    def test_order_without_id_matched_by_price(self):
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("7", BUY_ORDER, 0.4400, 100)]
+        order = self.tracker.track("a", None, BUY_ORDER, 0.44, 100)
+        self.tracker.poll()
+        self.assertEqual("7", order.order_id)
+        self.assertEqual(ordertracker.PENDING, order.state)
+
+    def test_markets_tracked_separately(self):
+        tracker = ordertracker.OrderTracker({"a": self.exchange}, clock=lambda: self.time,
+                                            markets={"a": [marketmakerexchange.MARKET, "BTS_BTC"]})
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("1", BUY_ORDER, 0.44, 100)]
+        tracker.track("a", "1", BUY_ORDER, 0.44, 100)
+        tracker.track("a", "2", SELL_ORDER, 0.00002, 100, market="BTS_BTC")
+        tracker.poll()
+        self.assertEqual(["1"], [order.order_id for order in tracker.get_open_orders("a", marketmakerexchange.MARKET)])
+        self.assertFalse(tracker.has_open_orders("a", "BTS_BTC"))
+        tracker.shutdown()
+
+    def test_order_tracked_during_poll_kept_open(self):
+        listing_started = threading.Event()
+        listing_released = threading.Event()
+        list_my_orders = self.exchange.list_my_orders
+
+        def blocked_list_my_orders(market=marketmakerexchange.MARKET):
+            open_orders = list_my_orders(market)
+            listing_started.set()
+            listing_released.wait(5)
+            return open_orders
+        self.exchange.list_my_orders = blocked_list_my_orders
+        poll_thread = threading.Thread(target=self.tracker.poll)
+        poll_thread.start()
+        self.assertTrue(listing_started.wait(5))
+        order = self.tracker.track("a", "1", BUY_ORDER, 0.44, 100)
+        listing_released.set()
+        poll_thread.join(5)
+        self.assertEqual(ordertracker.PENDING, order.state)
+        self.assertTrue(self.tracker.has_open_orders("a"))
+
+        self.exchange.list_my_orders = list_my_orders
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("1", BUY_ORDER, 0.44, 100)]
+        self.tracker.poll()
+        self.assertEqual(ordertracker.PENDING, order.state)
+        self.exchange.open_orders = []
+        self.tracker.poll()
+        self.assertEqual(ordertracker.FILLED, order.state)
+
+    def test_foreign_open_orders(self):
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("9", BUY_ORDER, 0.40, 100)]
+        self.assertFalse(self.tracker.has_open_orders("a"))
+        self.tracker.poll()
+        self.assertTrue(self.tracker.has_open_orders("a"))
+
+    def test_find_untracked_order(self):
+        self.tracker.track("a", "1", BUY_ORDER, 0.44, 100)
+        self.exchange.open_orders = [marketmakerexchange.OpenOrder("1", BUY_ORDER, 0.44, 100),
+                                     marketmakerexchange.OpenOrder("2", SELL_ORDER, 0.44, 100)]
+        self.exchange.trades = [marketmakerexchange.Trade("3", 100, BUY_ORDER, 0.44, self.time - 40),
+                                marketmakerexchange.Trade("4", 100, BUY_ORDER, 0.44)]
+        self.assertIsNone(self.tracker.find_untracked_order("a", marketmakerexchange.MARKET, BUY_ORDER, 0.44))
+        self.assertEqual("2", self.tracker.find_untracked_order("a", marketmakerexchange.MARKET, SELL_ORDER, 0.44))
+
+        self.exchange.trades.append(marketmakerexchange.Trade("5", 100, BUY_ORDER, 0.44, self.time - 2))
+        self.assertEqual("5", self.tracker.find_untracked_order("a", marketmakerexchange.MARKET, BUY_ORDER, 0.44))
+
+unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from exceptions import exchangeexceptions
+from network import asynchttp
+from network import pollingscheduler
+
+
+class PollingSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.time = 0
+        self.scheduler = pollingscheduler.PollingScheduler(requests_per_second=5, min_interval=0.1, max_interval=2,
+                                                           clock=lambda: self.time)
+
+    def fetch(self, round_trip_time=0.05, changed=True):
+        self.time += self.scheduler.next_delay()
+        self.scheduler.on_request()
+        self.time += round_trip_time
+        self.scheduler.on_success(round_trip_time, changed)
+
+    def test_quiet_book_polled_less_often(self):
+        for _ in range(50):
+            self.fetch(changed=True)
+        volatile_interval = self.scheduler.get_interval()
+        for _ in range(50):
+            self.fetch(changed=False)
+        self.assertAlmostEqual(0.2, volatile_interval, delta=0.1)
+        self.assertGreater(self.scheduler.get_interval(), 1.5)
+
+    def test_interval_not_shorter_than_round_trip(self):
+        for _ in range(50):
+            self.fetch(round_trip_time=0.5)
+        self.assertGreaterEqual(self.scheduler.get_interval(), 0.49)
+
+    def test_errors_back_off_exponentially(self):
+        delays = []
+        for _ in range(10):
+            self.scheduler.on_request()
+            self.scheduler.on_failure(ValueError())
+            delays.append(self.scheduler.next_delay())
+        self.assertLessEqual(delays[0], pollingscheduler.BACKOFF_BASE)
+        self.assertGreater(delays[-1], 50 * pollingscheduler.BACKOFF_BASE)
+        self.fetch()
+        self.assertEqual(0, self.scheduler.consecutive_failures)
+
+    def test_rate_limit_stretches_interval(self):
+        self.scheduler.on_failure(exchangeexceptions.RateLimitException("fail#3"))
+        self.assertAlmostEqual(0.2, self.scheduler.rate_limit_interval)
+        self.scheduler.on_failure(asynchttp.HttpResponseException("HTTP 429", 429))
+        self.assertAlmostEqual(0.4, self.scheduler.rate_limit_interval)
+
+    def test_other_failures_do_not_stretch_interval(self):
+        self.scheduler.on_failure(exchangeexceptions.UpdateOrderBookFailureException("Order book has no bids."))
+        self.scheduler.on_failure(asynchttp.HttpResponseException("HTTP 500", 500))
+        self.assertAlmostEqual(0.1, self.scheduler.rate_limit_interval)
+
+    def test_request_budget(self):
+        requests = 0
+        while self.time < 10:
+            self.fetch(round_trip_time=0)
+            requests += 1
+        self.assertLessEqual(requests, 5 * 11)
+
+unittest.main()
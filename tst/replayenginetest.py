@@ -0,0 +1,58 @@
+import logging
+import unittest
+from unittest import mock
+
+import marketmaker
+from backtest import replayengine
+
+EXCHANGE_NAMES = ["btc38", "dex"]
+EXCHANGE_SETTINGS = {exchange_name: {"profit_deduction": 0.01, "cny_balance": 10000, "bts_balance": 20000,
+                                     "trading_fee": 0.001}
+                     for exchange_name in EXCHANGE_NAMES}
+SNAPSHOT_COUNT = 3000
+
+
+class ReplayEngineTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        # Number of orders still tracked by the market maker when the replay closes it.
+        self.tracked_order_counts = []
+        close = marketmaker.MarketMaker.close
+
+        def record_and_close(maker):
+            self.tracked_order_counts.append(len(maker.order_tracker.orders))
+            close(maker)
+        patcher = mock.patch.object(marketmaker.MarketMaker, "close", record_and_close)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def replay(self, count=SNAPSHOT_COUNT):
+        return replayengine.replay(replayengine.SyntheticSource(EXCHANGE_NAMES, count), EXCHANGE_SETTINGS,
+                                   {"profit_threshold": 0})
+
+    def test_replay_trades(self):
+        result = self.replay()
+        self.assertEqual(SNAPSHOT_COUNT, result.snapshots)
+        self.assertGreater(result.trade_count, 0)
+        self.assertGreater(result.pnl, 0)
+
+    def test_replay_is_deterministic(self):
+        first = self.replay()
+        second = self.replay()
+        self.assertEqual((first.trade_count, first.missed_opportunities, first.cny_change, first.bts_change),
+                         (second.trade_count, second.missed_opportunities, second.cny_change, second.bts_change))
+
+    def test_closed_orders_pruned_on_replay_clock(self):
+        result = self.replay()
+        # Every trade places two orders; only those of the last stale order timeout of replayed time are kept.
+        self.assertLess(self.tracked_order_counts[0], 2 * result.trade_count)
+
+    def test_empty_source(self):
+        result = self.replay(count=0)
+        self.assertEqual(0, result.snapshots)
+        self.assertEqual([], self.tracked_order_counts)
+
+unittest.main()
@@ -0,0 +1,49 @@
+import hashlib
+import unittest
+import urllib.parse
+
+from btc38 import client
+
+ACCESS_KEY = "access+key"
+MDT = "{}_account_secret".format(ACCESS_KEY)
+
+
+# Body of the signed request as it was built from a parameter dict.
+def encode_params(stamp, **params):
+    md5 = hashlib.md5("{}_{}".format(MDT, stamp).encode(client.ENCODING)).hexdigest()
+    signed_params = {'key': ACCESS_KEY, 'time': stamp, 'md5': md5}
+    signed_params.update(params)
+    return urllib.parse.urlencode(signed_params).encode(client.ENCODING)
+
+
+class RequestBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.time = 1500000000.25
+        self.builder = client.RequestBuilder(ACCESS_KEY, client.get_mdt_prefix_md5(MDT), clock=lambda: self.time)
+
+    def test_balance(self):
+        self.assertEqual(encode_params(1500000000), self.builder.build_balance())
+
+    def test_submit_order(self):
+        body = self.builder.build_submit_order(1, client.CNY_SYMBOL, 0.44005, 1234.5678912, client.BTS_SYMBOL)
+        self.assertEqual(encode_params(1500000000, type=1, mk_type='cny', price='0.4400', amount='1234.567891',
+                                       coinname='bts'), body)
+        body = self.builder.build_submit_order(2, client.BTC_SYMBOL, 0.0000123456789, 10, client.BTS_SYMBOL)
+        self.assertEqual(encode_params(1500000000, type=2, mk_type='btc', price='0.00001235', amount='10.000000',
+                                       coinname='bts'), body)
+
+    def test_other_requests(self):
+        self.assertEqual(encode_params(1500000000, mk_type='cny', order_id='123'),
+                         self.builder.build_cancel_order('cny', '123'))
+        self.assertEqual(encode_params(1500000000, coinname=None), self.builder.build_order_list())
+        self.assertEqual(encode_params(1500000000, mk_type='cny', coinname='bts', page=2),
+                         self.builder.build_trade_list('cny', 'bts', 2))
+
+    def test_signature_per_second(self):
+        signed_prefix = self.builder.get_signed_prefix()
+        self.time += 0.5
+        self.assertIs(signed_prefix, self.builder.get_signed_prefix())
+        self.time += 0.5
+        self.assertEqual(encode_params(1500000001), self.builder.get_signed_prefix())
+
+unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+
+from data import marketmakerexchange
+from trading import riskengine
+
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+SELL_ORDER = marketmakerexchange.SELL_ORDER
+MARKET = marketmakerexchange.MARKET
+
+
+class FakeExchange(object):
+    def __init__(self, name):
+        self.name = name
+
+    def get_exchange_name(self):
+        return self.name
+
+
+class Leg(object):
+    def __init__(self, exchange_name, order_type, price, volume, market=MARKET):
+        self.exchange = FakeExchange(exchange_name)
+        self.order_type = order_type
+        self.price = price
+        self.volume = volume
+        self.market = market
+
+
+def create_arbitrage(volume, price=0.5):
+    return [Leg("a", SELL_ORDER, price, volume), Leg("b", BUY_ORDER, price, volume)]
+
+
+class RollingCounterTest(unittest.TestCase):
+    def test_window(self):
+        counter = riskengine.RollingCounter(10)
+        counter.add(100.5, 1)
+        counter.add(105, 2)
+        self.assertEqual(3, counter.get(109.9))
+        self.assertEqual(2, counter.get(110))
+        self.assertEqual(0, counter.get(200))
+
+
+class RiskEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.time = 1000
+        self.kill_reasons = []
+        limits = riskengine.RiskLimits(max_venue_inventory={"BTS": 1000}, max_net_exposure={"BTS": 100},
+                                       max_rolling_notional={"CNY": 2000}, max_orders_per_window=6,
+                                       rolling_window=60, max_unhedged_exposure={"CNY": 100})
+        self.engine = riskengine.RiskEngine(limits, clock=lambda: self.time, on_kill=self.kill_reasons.append)
+
+    def test_venue_inventory(self):
+        self.assertTrue(self.engine.check(create_arbitrage(600)))
+        decision = self.engine.check(create_arbitrage(600))
+        self.assertFalse(decision)
+        self.assertIn("inventory", decision.reason)
+        # Trading back toward zero is allowed.
+        self.assertTrue(self.engine.check([Leg("a", BUY_ORDER, 0.5, 600), Leg("b", SELL_ORDER, 0.5, 600)]))
+
+    def test_net_exposure(self):
+        self.assertFalse(self.engine.check([Leg("b", BUY_ORDER, 0.5, 150)]))
+        self.assertTrue(self.engine.check([Leg("b", BUY_ORDER, 0.5, 150), Leg("a", SELL_ORDER, 0.5, 100)]))
+
+    def test_order_rate_and_notional(self):
+        for _ in range(3):
+            self.assertTrue(self.engine.check(create_arbitrage(10)))
+        self.assertIn("orders", self.engine.check(create_arbitrage(10)).reason)
+        self.time += 60
+        self.assertIn("notional", self.engine.check(create_arbitrage(700, price=3)).reason)
+        self.assertTrue(self.engine.check(create_arbitrage(300, price=3)))
+
+    def test_failed_legs(self):
+        legs = create_arbitrage(100)
+        self.engine.check(legs)
+        self.assertEqual(50, self.engine.on_legs_submitted(legs, [None, Exception()]))
+        self.assertEqual(0, self.engine.venue_inventory[("b", "BTS")])
+        self.assertEqual(-100, self.engine.net_exposure["BTS"])
+        self.engine.resolve_unhedged(legs[0])
+        self.assertEqual(0, self.engine.unhedged_exposure["CNY"])
+
+    def test_kill_switch(self):
+        legs = create_arbitrage(300)
+        self.engine.check(legs)
+        self.engine.on_legs_submitted(legs, [Exception(), None])
+        self.assertTrue(self.engine.is_killed())
+        self.assertEqual(1, len(self.kill_reasons))
+        self.assertIn("kill switch", self.engine.check(create_arbitrage(1)).reason)
+        self.engine.resume()
+        self.assertTrue(self.engine.check(create_arbitrage(1)))
+
+    def test_one_way_trades_unblocked_by_reconciliation(self):
+        balances = {"a": {"BTS": 5000, "CNY": 5000}, "b": {"BTS": 5000, "CNY": 5000}}
+        self.engine.rebase(balances)
+        approved_count = 0
+        while self.engine.check(create_arbitrage(100)):
+            approved_count += 1
+            self.time += 60
+        self.assertEqual(10, approved_count)
+        self.assertIn("inventory", self.engine.check(create_arbitrage(100)).reason)
+
+        # The trades filled, and BTS was moved back from b to a, less the withdrawal fee.
+        self.engine.rebase({"a": {"BTS": 4995, "CNY": 5500}, "b": {"BTS": 5000, "CNY": 4500}})
+        self.assertEqual(-5, self.engine.net_exposure["BTS"])
+        self.assertEqual(0, self.engine.venue_inventory[("b", "BTS")])
+        self.assertTrue(self.engine.check(create_arbitrage(100)))
+
+    def test_configured_baseline(self):
+        engine = riskengine.RiskEngine(self.engine.limits, clock=lambda: self.time,
+                                       baseline={"b": {"BTS": 4000, "CNY": 5000}})
+        engine.rebase({"a": {"BTS": 5000, "CNY": 5000}, "b": {"BTS": 5000, "CNY": 5000}})
+        self.assertEqual(1000, engine.venue_inventory[("b", "BTS")])
+        self.assertEqual(0, engine.venue_inventory[("a", "BTS")])
+        self.assertIn("inventory", engine.check(create_arbitrage(100)).reason)
+
+    def test_reset(self):
+        self.engine.rebase({"b": {"BTS": 5000}})
+        self.engine.rebase({"b": {"BTS": 5900}})
+        legs = create_arbitrage(300)
+        self.engine.check(legs)
+        self.engine.on_legs_submitted(legs, [Exception(), None])
+        self.assertTrue(self.engine.is_killed())
+
+        self.engine.reset()
+        self.assertEqual(0, self.engine.unhedged_exposure.get("CNY", 0))
+        self.engine.rebase({"b": {"BTS": 6200}})
+        self.assertEqual(0, self.engine.venue_inventory[("b", "BTS")])
+        self.assertTrue(self.engine.check(create_arbitrage(100)))
+
+    def test_audit_log(self):
+        self.engine.check(create_arbitrage(10))
+        self.engine.check(create_arbitrage(10000))
+        entries = list(self.engine.audit_log.entries)
+        self.assertEqual([True, False], [entry[1] for entry in entries])
+        self.assertEqual(("a", MARKET, SELL_ORDER, 0.5, 10), entries[0][3][0])
+
+unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from backtest import simulatedexchange
+from exceptions import exchangeexceptions
+
+CNY = simulatedexchange.CNY
+BTS = simulatedexchange.BTS
+
+
+class SimulatedExchangeTest(unittest.TestCase):
+    def setUp(self):
+        self.exchange = simulatedexchange.SimulatedExchange("sim", 0.01, 1000, 1000, trading_fee=0.001)
+        self.exchange.set_order_book([[0.39, 100], [0.38, 200]], [[0.40, 100], [0.41, 200]])
+
+    def test_buy_fills_up_to_limit_price(self):
+        self.exchange.submit_arbitrage_order(simulatedexchange.BUY_ORDER, 0.41, 500)
+        self.assertEqual(300, self.exchange.balance[BTS] - 1000)
+        notional = 0.40 * 100 + 0.41 * 200
+        self.assertAlmostEqual(1000 - notional * 1.001, self.exchange.balance[CNY])
+        self.assertEqual([], self.exchange.order_book.asks.levels())
+
+    def test_sell_consumes_book(self):
+        self.exchange.submit_arbitrage_order(simulatedexchange.SELL_ORDER, 0.39, 60)
+        self.assertEqual([[0.39, 40], [0.38, 200]], self.exchange.order_book.bids.levels())
+        self.assertEqual(940, self.exchange.balance[BTS])
+
+    def test_unfillable_order_rejected(self):
+        with self.assertRaises(exchangeexceptions.SubmitOrderFailureException):
+            self.exchange.submit_arbitrage_order(simulatedexchange.BUY_ORDER, 0.39, 100)
+        self.assertEqual([], self.exchange.fills)
+
+unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+
+from btc38 import client
+from data import marketmakerexchange
+from exceptions import exchangeexceptions
+from simulator import bookdynamics
+from simulator import simulatedexchanges
+from simulator import simulatedvenue
+
+BUY_ORDER = marketmakerexchange.BUY_ORDER
+SELL_ORDER = marketmakerexchange.SELL_ORDER
+MARKET = marketmakerexchange.MARKET
+START_TIME = 1000
+
+
+class BookDynamicsTest(unittest.TestCase):
+    def test_book_depends_on_tick_only(self):
+        book = bookdynamics.BookDynamics(0.44, START_TIME, tick_rate=10, seed=1)
+        other_book = bookdynamics.BookDynamics(0.44, START_TIME, tick_rate=10, seed=1)
+        self.assertTrue(book.advance_to(START_TIME + 2.05))
+        self.assertFalse(book.advance_to(START_TIME + 2.09))
+        for current_time in [START_TIME + 1, START_TIME + 2.05]:
+            other_book.advance_to(current_time)
+        self.assertEqual(20, book.tick)
+        self.assertEqual(book.bids, other_book.bids)
+        self.assertEqual(book.asks, other_book.asks)
+        self.assertLess(book.bids[0][0], book.asks[0][0])
+
+    def test_venues_share_reference_price(self):
+        venue = simulatedvenue.SimulatedVenue("a", {MARKET: 0.44}, {}, start_time=START_TIME, clock=lambda: 2000)
+        other_venue = simulatedvenue.SimulatedVenue("b", {MARKET: 0.44}, {}, start_time=START_TIME,
+                                                    clock=lambda: 2000)
+        venue.get_order_book(MARKET)
+        other_venue.get_order_book(MARKET)
+        self.assertEqual(venue.books[MARKET].reference_price, other_venue.books[MARKET].reference_price)
+        self.assertNotEqual(venue.books[MARKET].offset, other_venue.books[MARKET].offset)
+
+
+class SimulatedVenueTest(unittest.TestCase):
+    def setUp(self):
+        self.time = START_TIME
+        self.venue = simulatedvenue.SimulatedVenue("a", {MARKET: 0.44}, {"BTS": 1000, "CNY": 1000},
+                                                   start_time=START_TIME, clock=lambda: self.time)
+
+    def test_crossing_order_fills(self):
+        bids, asks = self.venue.get_order_book(MARKET)
+        self.venue.submit_order(BUY_ORDER, MARKET, asks[0][0], 10)
+        self.assertEqual([], self.venue.list_open_orders(MARKET))
+        self.assertAlmostEqual(1010, self.venue.get_balances()["BTS"])
+        self.assertAlmostEqual(1000 - asks[0][0] * 10, self.venue.get_balances()["CNY"])
+
+    def test_resting_order_is_cancelled(self):
+        bids, asks = self.venue.get_order_book(MARKET)
+        order_id = self.venue.submit_order(SELL_ORDER, MARKET, asks[0][0] + 1, 10)
+        self.assertEqual([order_id], [order.order_id for order in self.venue.list_open_orders(MARKET)])
+        self.assertTrue(self.venue.cancel_order(order_id))
+        self.assertFalse(self.venue.cancel_order(order_id))
+
+    def test_insufficient_balance(self):
+        with self.assertRaises(simulatedvenue.InsufficientBalanceError):
+            self.venue.submit_order(SELL_ORDER, MARKET, 0.44, 1001)
+
+
+class BTC38StubServerTest(unittest.TestCase):
+    def setUp(self):
+        self.venue = simulatedvenue.SimulatedVenue("sim", {MARKET: 0.44}, {"BTS": 1000, "CNY": 1000})
+        self.server, self.exchange = simulatedexchanges.create_btc38_exchange(self.venue)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_depth(self):
+        bids, asks = self.venue.get_order_book(MARKET)
+        order_book = self.exchange.get_order_book()
+        self.assertEqual(bids[0], order_book.bids.top_offer())
+        self.assertEqual(asks[0], order_book.asks.top_offer())
+
+    def test_depth_failure(self):
+        self.venue.error_rate = 1
+        with self.assertRaises(exchangeexceptions.UpdateOrderBookFailureException):
+            self.exchange.get_order_book()
+
+    def test_order_lifecycle(self):
+        self.assertEqual([], self.exchange.client.get_order_list(client.BTS_SYMBOL))
+        order_id = self.exchange.submit_arbitrage_order(SELL_ORDER, 10, 100)
+        self.assertEqual([order_id], [order.order_id for order in self.exchange.list_my_orders()])
+        self.exchange.cancel_order(order_id)
+        self.assertEqual([], self.exchange.list_my_orders())
+        self.assertEqual({"BTS": 1000, "CNY": 1000}, self.exchange.get_maker_account_balance())
+
+    def test_over_balance(self):
+        with self.assertRaises(exchangeexceptions.SubmitOrderFailureException):
+            self.exchange.submit_arbitrage_order(SELL_ORDER, 10, 10000)
+
+
+class GrapheneExchangeStubTest(unittest.TestCase):
+    def setUp(self):
+        self.venue = simulatedvenue.SimulatedVenue("sim", {MARKET: 0.44}, {"BTS": 1000, "CNY": 1000})
+        self.exchange = simulatedexchanges.SimulatedDexExchange(self.venue)
+
+    def test_order_book_and_orders(self):
+        bids, asks = self.venue.get_order_book(MARKET)
+        self.assertEqual(asks[0], self.exchange.get_order_book().asks.top_offer())
+        self.exchange.submit_arbitrage_order(BUY_ORDER, bids[0][0] - 0.01, 100)
+        orders = self.exchange.list_my_orders()
+        self.assertEqual([(BUY_ORDER, 100)], [(order.order_type, order.remaining_volume) for order in orders])
+        self.exchange.cancel_order(orders[0].order_id)
+        self.assertEqual([], self.exchange.list_my_orders())
+
+    def test_injected_failure(self):
+        self.venue.error_rate = 1
+        with self.assertRaises(simulatedvenue.InjectedError):
+            self.exchange.get_order_book()
+
+unittest.main()
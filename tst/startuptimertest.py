@@ -0,0 +1,35 @@
+import unittest
+
+from metrics import metricsregistry
+from metrics import startuptimer
+
+
+class StartupTimerTest(unittest.TestCase):
+    def setUp(self):
+        self.time = 100
+        self.timer = startuptimer.StartupTimer(clock=lambda: self.time)
+
+    def test_phases_and_milestones(self):
+        self.time += 1
+        with self.timer.phase("exchanges"):
+            self.time += 2
+        self.timer.mark("first speculation")
+        self.assertEqual([("exchanges", 1, 2)], self.timer.phases)
+        self.assertEqual([("first speculation", 3)], self.timer.milestones)
+
+    def test_failed_phase_is_timed(self):
+        with self.assertRaises(ValueError):
+            with self.timer.phase("exchanges"):
+                self.time += 2
+                raise ValueError()
+        self.assertEqual([("exchanges", 0, 2)], self.timer.phases)
+
+    def test_reported_once(self):
+        registry = metricsregistry.reset()
+        with self.timer.phase("fetcher"):
+            self.time += 0.5
+        self.timer.report()
+        self.timer.report()
+        self.assertEqual(1, registry.get_histogram("startup.fetcher").count)
+
+unittest.main()
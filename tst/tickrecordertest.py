@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from data import tickrecorder
+
+
+class TickRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record_and_read(self, snapshots, start_time=None, end_time=None):
+        recorder = tickrecorder.TickRecorder(self.directory.name)
+        for snapshot in snapshots:
+            recorder.record(*snapshot)
+        recorder.close()
+
+        files = sorted(os.listdir(self.directory.name))
+        self.assertEqual(1, len(files))
+        reader = tickrecorder.TickReader(os.path.join(self.directory.name, files[0]))
+        try:
+            return list(reader.read(start_time, end_time))
+        finally:
+            reader.close()
+
+    def test_round_trip(self):
+        snapshots = [("dex", 1500000000.5, [0.44, 0.43], [100, 200], [0.45], [300]),
+                     ("btc38", 1500000000.7, [0.441], [10], [0.449, 0.45], [20, 30])]
+        self.assertEqual([("dex", 1500000000.5, [[0.44, 100], [0.43, 200]], [[0.45, 300]]),
+                          ("btc38", 1500000000.7, [[0.441, 10]], [[0.449, 20], [0.45, 30]])],
+                         self.record_and_read(snapshots))
+
+    def test_seek_by_time(self):
+        snapshots = [("dex", 1500000000 + second, [0.44], [second + 1], [0.45], [1]) for second in range(100)]
+        read_snapshots = self.record_and_read(snapshots, 1500000010, 1500000012)
+        self.assertEqual([1500000010, 1500000011, 1500000012], [snapshot[1] for snapshot in read_snapshots])
+
+    def test_out_of_order_receive_times(self):
+        path = os.path.join(self.directory.name, "ticks.ticks")
+        writer = tickrecorder.TickFileWriter(path, "20170714")
+        # Snapshots of the exchanges are interleaved, and the second block starts with a late one.
+        writer.write_snapshots([("dex", 100, [0.44], [1], [0.45], [1]), ("btc38", 103, [0.44], [1], [0.45], [1]),
+                                ("dex", 101, [0.44], [1], [0.45], [1]), ("btc38", 102, [0.44], [1], [0.45], [1])])
+        writer.write_snapshots([("dex", 104, [0.44], [1], [0.45], [1]), ("btc38", 99, [0.44], [1], [0.45], [1])])
+        writer.close()
+
+        reader = tickrecorder.TickReader(path)
+        try:
+            self.assertEqual([100, 101, 102], [snapshot[1] for snapshot in reader.read(100, 102)])
+            self.assertEqual([99], [snapshot[1] for snapshot in reader.read(98, 99.5)])
+            self.assertEqual([103, 104], [snapshot[1] for snapshot in reader.read(102.5)])
+            self.assertEqual([100, 103, 101, 102, 104, 99], [snapshot[1] for snapshot in reader.read()])
+        finally:
+            reader.close()
+
+    def test_ignores_truncated_block(self):
+        recorder = tickrecorder.TickRecorder(self.directory.name)
+        recorder.record("dex", 1500000000, [0.44], [100], [0.45], [300])
+        recorder.close()
+        path = os.path.join(self.directory.name, os.listdir(self.directory.name)[0])
+        with open(path, "ab") as tick_file:
+            tick_file.write(tickrecorder.BLOCK_HEADER.pack(tickrecorder.DATA_TAG, 1000) + b"partial")
+
+        reader = tickrecorder.TickReader(path)
+        self.assertEqual(1, len(list(reader.read())))
+        reader.close()
+
+unittest.main()